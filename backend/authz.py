@@ -0,0 +1,104 @@
+from functools import wraps
+
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from cache import TTLCache
+import invalidation
+from models import db, User, UserRole
+from replica import on_primary
+
+
+# Role ids the app was built around, used when user_roles has no row with
+# that name. role_id: 1=admin, 2=driver, 3=parent
+DEFAULT_ROLE_IDS = {'admin': 1, 'driver': 2, 'parent': 3}
+
+_roles = TTLCache('roles', maxsize=1, ttl=300)
+_profiles = TTLCache('profiles', maxsize=4096, ttl=300)
+
+
+# Both loaders read the primary: what they return is cached across requests,
+# so a replica that is behind would keep serving the old values for the TTL
+# after the write that invalidated them.
+
+def _load_roles():
+    with on_primary():
+        names = dict(db.session.query(UserRole.id, UserRole.name).all())
+    ids = dict(DEFAULT_ROLE_IDS)
+    ids.update((name, id_) for id_, name in names.items())
+    if not names:
+        names = {id_: name for name, id_ in DEFAULT_ROLE_IDS.items()}
+    return ids, names
+
+
+def role_ids():
+    """Role name -> id, from user_roles plus DEFAULT_ROLE_IDS for missing names"""
+    return _roles.get_or_load('roles', _load_roles)[0]
+
+
+def role_name(role_id):
+    """The role's name in user_roles (DEFAULT_ROLE_IDS only if the table is empty)"""
+    return _roles.get_or_load('roles', _load_roles)[1].get(role_id)
+
+
+def invalidate_roles():
+    """Drop the cached role table in every worker once the session commits"""
+    invalidation.publish(db.session, 'roles')
+
+
+def current_identity():
+    """
+    The JWT identity as a dict. Older tokens may carry just the user id.
+    """
+    identity = get_jwt_identity()
+    if isinstance(identity, dict):
+        return identity
+    return {"id": identity, "role_id": None}
+
+
+def roles_required(*roles, message=None):
+    """
+    Require a JWT whose role_id is one of the named roles. The check uses
+    the claims in the token plus the cached role table, so it costs no query.
+    """
+    message = message or f"{' and '.join(r.capitalize() + 's' for r in roles)} only"
+
+    def decorator(fn):
+        @wraps(fn)
+        @jwt_required()
+        def wrapper(*args, **kwargs):
+            allowed = {role_ids().get(role) for role in roles}
+            if current_identity().get("role_id") not in allowed:
+                return {"error": message}, 403
+
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+admin_required = roles_required('admin')
+driver_required = roles_required('driver')
+admin_or_parent_required = roles_required('admin', 'parent', message="Admins and parents only")
+
+
+def _load_profile(user_id):
+    with on_primary():
+        user = db.session.get(User, user_id)
+    if not user:
+        return None
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "phone_number": user.phone_number,
+        "role_id": user.role_id,
+    }
+
+
+def get_profile(user_id):
+    """Cached profile fields for /me, or None if the user no longer exists"""
+    return _profiles.get_or_load(user_id, lambda: _load_profile(user_id))
+
+
+def invalidate_profile(user_id):
+    """Drop the user's cached profile in every worker once the session commits"""
+    invalidation.publish(db.session, 'profiles', user_id)
@@ -0,0 +1,205 @@
+"""
+Check that the hot queries are planned on their indexes.
+
+    python bench/explain_check.py                                  # temp SQLite db
+    python bench/explain_check.py --database-url postgresql://...  # migrated Postgres db (data is replaced)
+
+Seeds a dataset with seed.py, calls each endpoint below through the test
+client, captures the statement it issues against the table of interest,
+and runs EXPLAIN on it with the same parameters. A case fails if the plan
+scans the whole table or uses none of the expected indexes. On Postgres
+the tables are analyzed and sequential scans are disabled for the EXPLAIN,
+so the check is whether an index can serve the query at all rather than
+whether the planner prefers it on this dataset size.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from run import SIZES, PASSWORD, ROLE_IDS, LocalClient
+
+
+class Case:
+    def __init__(self, name, role, method, path, statement, table, indexes, body=None):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.path = path
+        self.body = body
+        # Regex picking the statement to explain out of those the request issues
+        self.statement = re.compile(statement, re.S)
+        self.table = table
+        self.indexes = indexes
+
+
+def build_cases(f):
+    today = date.today()
+    return [
+        Case('TripToday', 'driver', 'GET', f"/trips/today?vehicle_id={f['vehicle_id']}&service_time=morning",
+             r'FROM trips JOIN bookings', 'trips', ['ix_trips_open_trip_date', 'ix_trips_booking_id_trip_date']),
+        Case('validate_booking_capacity', 'parent', 'POST', '/bookings',
+             r'sum\(bookings.seats_booked\)', 'trips', ['ix_trips_open_trip_date', 'ix_trips_booking_id_trip_date'],
+             body=dict(f['booking'], start_date=today.isoformat(),
+                       end_date=(today + timedelta(days=90)).isoformat(), seats_booked=10000)),
+        Case('BookingList by route', 'parent', 'GET', f"/bookings?route_id={f['route_id']}&status=active",
+             r'^SELECT .*FROM bookings\s.*WHERE bookings.route_id', 'bookings', ['ix_bookings_route_id_status']),
+        Case('BookingList by parent', 'parent', 'GET', f"/bookings?user_id={f['parent_id']}",
+             r'^SELECT .*FROM bookings\s.*WHERE bookings.user_id', 'bookings', ['ix_bookings_user_id']),
+        Case('BookingDetail trips', 'parent', 'GET', f"/bookings/{f['booking_id']}",
+             r'FROM trips\s+WHERE .*trips.booking_id', 'trips', ['ix_trips_booking_id_trip_date']),
+        Case('VehicleList by route', 'parent', 'GET', f"/vehicles?route_id={f['route_id']}",
+             r'FROM vehicles', 'vehicles', ['ix_vehicles_route_id']),
+        Case('PickupLocationByRoute', 'parent', 'GET', f"/pickup_locations/route/{f['route_id']}",
+             r'FROM pickup_locations\s+WHERE', 'pickup_locations', ['ix_pickup_locations_route_id_grid_cell']),
+        Case('PickupLocationDetail bookings count', 'parent', 'GET', f"/pickup_locations/{f['pickup_id']}",
+             r'count\(bookings.id\)', 'bookings', ['ix_bookings_pickup_location_id']),
+    ]
+
+
+def fixtures(app):
+    from sqlalchemy import func
+    from models import db, User, Vehicle, Booking
+
+    with app.app_context():
+        booking = db.session.query(Booking).filter_by(status='active').join(
+            Booking.trips
+        ).group_by(Booking.id).order_by(func.count().desc()).first()
+        parent = db.session.get(User, booking.user_id)
+        vehicle = Vehicle.query.filter_by(route_id=booking.route_id).first()
+        return {
+            'driver_email': db.session.get(User, vehicle.user_id).email,
+            'parent_email': parent.email,
+            'parent_id': parent.id,
+            'route_id': booking.route_id,
+            'vehicle_id': vehicle.id,
+            'pickup_id': booking.pickup_location_id,
+            'booking_id': booking.id,
+            'booking': {
+                'user_id': parent.id,
+                'route_id': booking.route_id,
+                'pickup_location_id': booking.pickup_location_id,
+                'dropoff_location_id': booking.dropoff_location_id,
+                'days_of_week': '1,2,3,4,5',
+                'service_type': 'both',
+            },
+        }
+
+
+def explain(connection, statement, parameters):
+    """(plan text, indexes used, tables scanned in full)"""
+    if connection.dialect.name == 'postgresql':
+        plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+        plan = plan if isinstance(plan, list) else json.loads(plan)
+        indexes, scanned, lines = set(), set(), []
+
+        def walk(node, depth):
+            relation = node.get('Relation Name')
+            lines.append('  ' * depth + node['Node Type'] + (f' on {relation}' if relation else '') +
+                         (f" using {node['Index Name']}" if 'Index Name' in node else ''))
+            if 'Index Name' in node:
+                indexes.add(node['Index Name'])
+            if node['Node Type'] == 'Seq Scan':
+                scanned.add(relation)
+            for child in node.get('Plans', []):
+                walk(child, depth + 1)
+
+        walk(plan[0]['Plan'], 0)
+        return '\n'.join(lines), indexes, scanned
+
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    details = [row[-1] for row in rows]
+    indexes = {match.group(1) for detail in details for match in re.finditer(r'USING (?:COVERING )?INDEX (\w+)', detail)}
+    scanned = {match.group(1) for detail in details for match in [re.match(r'SCAN (\w+)$', detail)] if match}
+    return '\n'.join(details), indexes, scanned
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='EXPLAIN the hot queries and check their indexes.')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file')
+    parser.add_argument('--size', choices=SIZES, default='small', help='Dataset size passed to seed.py')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan')
+    args = parser.parse_args(argv)
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'explain.db')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ['HTTP_CACHE_ENABLED'] = 'false'
+    os.environ['REQUEST_LOG'] = 'off'
+    os.environ['PROFILE_SAMPLE_RATE'] = '0'
+
+    import seed
+    from sqlalchemy import event
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    seed_args = SIZES[args.size] + ['--reset'] + ([] if args.database_url else ['--create-tables'])
+    with app.app_context():
+        seed.Seeder(seed.build_parser().parse_args(seed_args)).run(app)
+        engine = db.engine
+        if engine.dialect.name == 'postgresql':
+            with engine.begin() as connection:
+                connection.exec_driver_sql('ANALYZE')
+    f = fixtures(app)
+
+    clients = {}
+    for role in ('driver', 'parent'):
+        clients[role] = LocalClient(app)
+        status, _ = clients[role].request('POST', '/login', {
+            'email': f[f'{role}_email'], 'password': PASSWORD, 'role_id': ROLE_IDS[role]
+        })
+        if status != 200:
+            sys.exit(f'Could not log in as {role}: {status}')
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    failures = []
+    for case in build_cases(f):
+        del statements[:]
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            clients[case.role].request(case.method, case.path, case.body)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        matching = [(statement, parameters) for statement, parameters in statements
+                    if case.statement.search(statement)]
+        if not matching:
+            print(f'{case.name:<38} FAIL: no statement matching {case.statement.pattern!r}')
+            failures.append(case.name)
+            continue
+
+        with engine.connect() as connection:
+            if connection.dialect.name == 'postgresql':
+                # LOCAL: ends with this transaction, also behind PgBouncer
+                connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            plan, indexes, scanned = explain(connection, *matching[0])
+
+        problems = []
+        if case.table in scanned:
+            problems.append(f'full scan of {case.table}')
+        if not indexes & set(case.indexes):
+            problems.append(f"none of {', '.join(case.indexes)} used")
+        print(f"{case.name:<38} {'FAIL: ' + '; '.join(problems) if problems else 'ok'}  "
+              f"[{', '.join(sorted(indexes)) or 'no index'}]")
+        if problems or args.verbose:
+            print('    ' + plan.replace('\n', '\n    '))
+        if problems:
+            failures.append(case.name)
+
+    if failures:
+        print(f'\n{len(failures)} case(s) failed: {", ".join(failures)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Import-time profile of the backend, with a budget for CI.
+
+    python bench/import_time.py                  # top modules by cumulative import time
+    python bench/import_time.py --budget-ms 900  # exit 1 if startup takes longer
+
+Runs a fresh interpreter with -X importtime that imports app and calls
+create_app() (what every gunicorn worker did before preload_app, and what
+the master does now), then reports the slowest imports, the first-party
+ones separately, and the time spent in create_app itself. Startup is
+measured --repeat times and the fastest run is compared with the budget,
+so a busy CI machine doesn't fail it.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = """
+import time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+print(f'{(imported - started) * 1000:.1f} {(time.perf_counter() - imported) * 1000:.1f}')
+"""
+
+
+def first_party():
+    names = {os.path.splitext(name)[0] for name in os.listdir(BACKEND_DIR) if name.endswith('.py')}
+    return names | {'routes'}
+
+
+def profile(env):
+    """([(module, self µs, cumulative µs)], import ms, create_app ms)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(result.stderr)
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    import_ms, create_ms = (float(value) for value in result.stdout.split())
+    return modules, import_ms, create_ms
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile backend import time.')
+    parser.add_argument('--top', type=int, default=15, help='Modules to list')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs; the fastest is reported')
+    parser.add_argument('--budget-ms', type=float, help='Fail if import plus create_app takes longer')
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    # Any URL works: create_app doesn't connect
+    env.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'import.db'))
+    # Bytecode compiled on the first run, so later runs measure imports only
+    subprocess.run([sys.executable, '-c', 'import app'], cwd=BACKEND_DIR, env=dict(env, PYTHONDONTWRITEBYTECODE=''),
+                   capture_output=True)
+
+    runs = [profile(env) for _ in range(args.repeat)]
+    modules, import_ms, create_ms = min(runs, key=lambda run: run[1] + run[2])
+
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[2])[:args.top]:
+        print(f'{cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}')
+
+    ours = first_party()
+    print(f"\n{'cumulative ms':>13} {'self ms':>8}  first-party module")
+    for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[2]):
+        if name.split('.')[0] in ours:
+            print(f'{cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {name}')
+
+    total_ms = import_ms + create_ms
+    print(f'\nimport app {import_ms:.1f} ms, create_app() {create_ms:.1f} ms, total {total_ms:.1f} ms')
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f'Over the budget of {args.budget_ms:.0f} ms')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Compare the stdlib and orjson representations on a 10k-row GET /bookings.
+
+    python bench/json_encoding.py [--rows 10000] [--repeat 5]
+
+Runs against a throwaway in-memory SQLite database, so it needs no setup.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from models import db, User, UserRole, Route, PickupLocation, SchoolLocation, Booking  # noqa: E402
+from representation import ENCODERS  # noqa: E402
+
+
+def seed(rows):
+    db.create_all()
+    db.session.add_all([UserRole(name=name) for name in ('admin', 'driver', 'parent')])
+    route = Route(name='Bench route', starting_point='A', ending_point='B')
+    db.session.add(route)
+    db.session.flush()
+    pickup = PickupLocation(route_id=route.id, name='Gate', gps_coordinates='-1.28,36.82')
+    school = SchoolLocation(route_id=route.id, name='School', gps_coordinates='-1.30,36.80')
+    parent = User(name='Parent', email='parent@bench', password_hash='x', role_id=3)
+    db.session.add_all([pickup, school, parent])
+    db.session.flush()
+
+    start = date.today()
+    db.session.execute(db.insert(Booking), [{
+        'user_id': parent.id,
+        'route_id': route.id,
+        'pickup_location_id': pickup.id,
+        'dropoff_location_id': school.id,
+        'booking_date': datetime.utcnow(),
+        'start_date': start + timedelta(days=i % 30),
+        'end_date': start + timedelta(days=i % 30 + 90),
+        'status': 'active',
+        'seats_booked': 1,
+        'service_type': 'both',
+        'days_of_week': '1,2,3,4,5',
+    } for i in range(rows)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        seed(args.rows)
+
+    client = app.test_client()
+
+    with app.test_request_context():
+        from routes.booking import serialize_booking
+        payload = [serialize_booking(b, include_trips=False) for b in Booking.query.all()]
+
+    print(f'{args.rows} bookings, best/median of {args.repeat} runs (ms)')
+    print(f"{'encoder':<8} {'encode':>14} {'GET /bookings':>16} {'bytes':>10}")
+    for name, dumps in ENCODERS.items():
+        app.config['JSON_ENCODER'] = name
+
+        encode = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            body = dumps(payload)
+            encode.append((time.perf_counter() - started) * 1000)
+
+        request_times = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.get('/bookings')
+            request_times.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.status_code
+
+        print(f'{name:<8} {min(encode):>6.1f}/{statistics.median(encode):>6.1f} '
+              f'{min(request_times):>7.1f}/{statistics.median(request_times):>7.1f} {len(body):>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Query-count budgets for the API resources.
+
+    python bench/query_budgets.py              # exit 1 if any endpoint is over budget
+    python bench/query_budgets.py --verbose    # also print every statement issued
+
+Resources declare their budget next to their methods, e.g.
+
+    class VehicleList(Resource):
+        query_budget = {'get': 1}
+
+Every case below is requested against fixtures of 1, 10 and 1,000 rows
+(routes, vehicles, pickup locations, bookings, today's trips, trips on one
+booking) and the SQL statements it issues are recorded. A case fails if it
+issues more statements than its budget at any size, or more statements at
+a larger size than at the smallest one: the count must not grow with the
+number of rows.
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SIZES = (1, 10, 1000)
+PASSWORD = 'password'
+HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+class Case:
+    def __init__(self, resource, method, role, path, body=None, expected=200):
+        self.resource = resource
+        self.method = method
+        self.role = role
+        self.path = path
+        self.body = body
+        self.expected = expected
+
+    @property
+    def name(self):
+        return f'{self.resource.__name__}.{self.method}'
+
+    @property
+    def budget(self):
+        return getattr(self.resource, 'query_budget', {}).get(self.method)
+
+
+def build_cases(f):
+    """The requests to measure; f holds the fixture ids"""
+    from routes.auth import Login, Me
+    from routes.booking import BookingList, BookingDetail
+    from routes.pickup_locations import PickupLocationList, PickupLocationDetail, PickupLocationByRoute
+    from routes.route import RouteList, RouteDetail
+    from routes.school_location import GetAllSchoolLocations, GetSchoolLocation
+    from routes.trip import TripToday, TripPickup, TripDropoff
+    from routes.user import GetUsers, GetDrivers
+    from routes.user_role import UserRoleList, UserRoleDetail
+    from routes.vehicle import VehicleList, VehicleDetail
+
+    today = date.today()
+    return [
+        Case(Login, 'post', None, '/login', {'email': f['parent_email'], 'password': PASSWORD, 'role_id': 3}),
+        Case(Me, 'get', 'parent', '/me'),
+        Case(GetUsers, 'get', 'admin', '/users'),
+        Case(GetDrivers, 'get', 'admin', '/drivers'),
+        Case(UserRoleList, 'get', 'admin', '/user_roles'),
+        Case(UserRoleDetail, 'get', 'admin', '/user_roles/3'),
+        Case(RouteList, 'get', 'admin', '/routes'),
+        Case(RouteDetail, 'get', 'admin', f"/routes/{f['route_id']}"),
+        Case(VehicleList, 'get', 'admin', '/vehicles'),
+        Case(VehicleDetail, 'get', 'admin', f"/vehicles/{f['vehicle_id']}"),
+        Case(GetAllSchoolLocations, 'get', 'admin', '/school-locations/all'),
+        Case(GetSchoolLocation, 'get', 'admin', f"/school-locations/{f['school_id']}"),
+        Case(PickupLocationList, 'get', 'admin', '/pickup_locations'),
+        Case(PickupLocationDetail, 'get', 'admin', f"/pickup_locations/{f['pickup_id']}"),
+        Case(PickupLocationByRoute, 'get', 'admin', f"/pickup_locations/route/{f['route_id']}"),
+        Case(BookingList, 'get', 'admin', '/bookings'),
+        Case(BookingDetail, 'get', 'parent', f"/bookings/{f['long_booking_id']}"),
+        Case(BookingList, 'post', 'parent', '/bookings', {
+            'user_id': f['parent_id'],
+            'route_id': f['route_id'],
+            'pickup_location_id': f['pickup_id'],
+            'dropoff_location_id': f['school_id'],
+            'start_date': today.isoformat(),
+            'end_date': (today + timedelta(days=6)).isoformat(),
+            'days_of_week': '1,2,3,4,5,6,7',
+            'service_type': 'both',
+            'seats_booked': 1,
+        }, expected=201),
+        Case(TripToday, 'get', 'driver', f"/trips/today?vehicle_id={f['vehicle_id']}&service_time=morning"),
+        Case(TripPickup, 'patch', 'driver', f"/trips/{f['trip_id']}/pickup", {}),
+        Case(TripDropoff, 'patch', 'driver', f"/trips/{f['trip_id']}/dropoff", {}),
+    ]
+
+
+def populate(n):
+    """
+    n drivers, parents, routes (each with a vehicle, school and pickup
+    location) and bookings on the first route with a trip today, plus n
+    trips on the first booking. Returns the ids the cases need.
+    """
+    from werkzeug.security import generate_password_hash
+    from models import db, UserRole, User, Route, SchoolLocation, PickupLocation, Vehicle, Booking, Trip
+
+    today = date.today()
+    password_hash = generate_password_hash(PASSWORD, method=HASH_METHOD)
+
+    db.session.add_all([UserRole(id=1, name='admin'), UserRole(id=2, name='driver'), UserRole(id=3, name='parent')])
+    admin = User(name='Admin', email='admin@minitrack.test', password_hash=password_hash, role_id=1)
+    drivers = [User(name=f'Driver {i}', email=f'driver{i}@minitrack.test', password_hash=password_hash, role_id=2)
+               for i in range(n)]
+    parents = [User(name=f'Parent {i}', email=f'parent{i}@minitrack.test', password_hash=password_hash, role_id=3)
+               for i in range(n)]
+    routes = [Route(name=f'Route {i}', starting_point='Start', ending_point='End') for i in range(n)]
+    db.session.add_all([admin] + drivers + parents + routes)
+    db.session.flush()
+
+    schools = [SchoolLocation(route_id=route.id, name=f'School {i}', gps_coordinates='-1.29,36.81')
+               for i, route in enumerate(routes)]
+    pickups = [PickupLocation(route_id=route.id, name=f'Stop {i}', gps_coordinates='-1.28,36.82')
+               for i, route in enumerate(routes)]
+    vehicles = [Vehicle(route_id=route.id, user_id=driver.id, license_plate=f'KAA {i:03d}', model='Van',
+                        capacity=n + 10) for i, (route, driver) in enumerate(zip(routes, drivers))]
+    db.session.add_all(schools + pickups + vehicles)
+    db.session.flush()
+
+    bookings = [Booking(
+        user_id=parent.id, route_id=routes[0].id, pickup_location_id=pickups[0].id,
+        dropoff_location_id=schools[0].id, start_date=today, end_date=today + timedelta(days=30),
+        status='active', seats_booked=1, service_type='morning', days_of_week='1,2,3,4,5,6,7'
+    ) for parent in parents]
+    db.session.add_all(bookings)
+    db.session.flush()
+
+    trips = [Trip(booking_id=booking.id, trip_date=today, service_time='morning', status='scheduled')
+             for booking in bookings]
+    trips += [Trip(booking_id=bookings[0].id, trip_date=today + timedelta(days=day), service_time='morning',
+                   status='scheduled') for day in range(1, n)]
+    db.session.add_all(trips)
+    db.session.commit()
+
+    return {
+        'admin_email': admin.email,
+        'driver_email': drivers[0].email,
+        'parent_email': parents[0].email,
+        'parent_id': parents[0].id,
+        'route_id': routes[0].id,
+        'vehicle_id': vehicles[0].id,
+        'school_id': schools[0].id,
+        'pickup_id': pickups[0].id,
+        'long_booking_id': bookings[0].id,
+        'trip_id': trips[0].id,
+    }
+
+
+def measure(app, n, verbose):
+    """(case, number of statements) for each case against fixtures of n rows"""
+    from sqlalchemy import event
+    from models import db
+    import invalidation
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        fixtures = populate(n)
+        # Same (cold) process caches at every size
+        invalidation.flush_all()
+        engine = db.engine
+
+    clients = {}
+    for role in ('admin', 'driver', 'parent'):
+        clients[role] = app.test_client()
+        response = clients[role].post('/login', json={
+            'email': fixtures[f'{role}_email'], 'password': PASSWORD, 'role_id': {'admin': 1, 'driver': 2, 'parent': 3}[role]
+        })
+        if response.status_code != 200:
+            sys.exit(f'Could not log in as {role}: {response.status_code}')
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = []
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        for case in build_cases(fixtures):
+            client = clients[case.role] if case.role else app.test_client()
+            del statements[:]
+            response = client.open(case.path, method=case.method.upper(), json=case.body)
+            if response.status_code != case.expected:
+                sys.exit(f'{case.name} at {n} rows returned {response.status_code}: {response.get_data(as_text=True)}')
+            counts.append((case, len(statements)))
+            if verbose:
+                print(f'\n{case.name} ({n} rows): {len(statements)} statements')
+                for statement in statements:
+                    print('    ' + ' '.join(statement.split())[:160])
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check per-endpoint SQL query budgets.')
+    parser.add_argument('--verbose', action='store_true', help='Print every statement')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'budgets.db')
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ['HTTP_CACHE_ENABLED'] = 'false'
+    os.environ['REQUEST_LOG'] = 'off'
+    os.environ['PROFILE_SAMPLE_RATE'] = '0'
+    os.environ['PASSWORD_HASH_METHOD'] = HASH_METHOD
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+
+    from app import create_app
+
+    app = create_app()
+    results = [measure(app, n, args.verbose) for n in SIZES]
+
+    print(f"\n{'endpoint':<32} {'budget':>6} " + ' '.join(f'{n:>6}' for n in SIZES))
+    failures = []
+    for measured in zip(*results):
+        case = measured[0][0]
+        counts = [count for _, count in measured]
+        problems = []
+        if case.budget is None:
+            problems.append('no query_budget declared')
+        elif max(counts) > case.budget:
+            problems.append(f'over budget of {case.budget}')
+        if max(counts) > counts[0]:
+            problems.append('grows with row count')
+        budget = '-' if case.budget is None else case.budget
+        print(f"{case.name:<32} {budget:>6} " + ' '.join(f'{c:>6}' for c in counts) +
+              (f"  FAIL: {', '.join(problems)}" if problems else ''))
+        if problems:
+            failures.append(case.name)
+
+    if failures:
+        print(f'\n{len(failures)} endpoint(s) failed: {", ".join(failures)}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
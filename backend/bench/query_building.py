@@ -0,0 +1,173 @@
+"""
+Python-side cost of the hot-path queries, legacy Query API vs select().
+
+    python bench/query_building.py [--calls 2000] [--repeat 5]
+
+Runs each query against a throwaway in-memory SQLite database with a few
+rows, so the database does next to nothing and the time per call is almost
+all SQLAlchemy building, compiling (or fetching from the cache) and loading.
+The legacy versions are copies of what the routes ran before they moved to
+select(), db.session.get() and lambda statements; both must return the
+same rows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.orm import contains_eager, joinedload  # noqa: E402
+
+from app import create_app  # noqa: E402
+from models import (  # noqa: E402
+    db, User, UserRole, Route, Vehicle, PickupLocation, SchoolLocation, Booking, Trip
+)
+from routes.booking import list_bookings, max_seats_booked  # noqa: E402
+from routes.trip import sync_booking_status_from_trips, today_trips  # noqa: E402
+
+
+def seed():
+    db.create_all()
+    db.session.add_all([UserRole(name=name) for name in ('admin', 'driver', 'parent')])
+    route = Route(name='Bench route', starting_point='A', ending_point='B')
+    db.session.add(route)
+    db.session.flush()
+    pickup = PickupLocation(route_id=route.id, name='Gate', gps_coordinates='-1.28,36.82')
+    school = SchoolLocation(route_id=route.id, name='School', gps_coordinates='-1.30,36.80')
+    parent = User(name='Parent', email='parent@bench', password_hash='x', role_id=3)
+    driver = User(name='Driver', email='driver@bench', password_hash='x', role_id=2)
+    db.session.add_all([pickup, school, parent, driver])
+    db.session.flush()
+    db.session.add(Vehicle(route_id=route.id, user_id=driver.id, license_plate='KBench', model='Van', capacity=14))
+
+    today = date.today()
+    for i in range(5):
+        booking = Booking(
+            user_id=parent.id, route_id=route.id, pickup_location_id=pickup.id, dropoff_location_id=school.id,
+            booking_date=datetime.utcnow(), start_date=today, end_date=today + timedelta(days=30),
+            status='active', seats_booked=1, service_type='both', days_of_week='1,2,3,4,5,6,7'
+        )
+        db.session.add(booking)
+        db.session.flush()
+        db.session.add_all([
+            Trip(booking_id=booking.id, trip_date=today + timedelta(days=day), service_time=service_time,
+                 status='scheduled')
+            for day in range(3) for service_time in ('morning', 'evening')
+        ])
+    db.session.commit()
+    return route.id, parent.id
+
+
+# What the routes ran before
+
+def legacy_today_trips(route_id, service_time, today):
+    return Trip.query.join(Booking).filter(
+        Trip.trip_date == today,
+        Trip.service_time == service_time,
+        Booking.route_id == route_id,
+        Trip.status.in_(['scheduled', 'picked_up'])
+    ).options(
+        contains_eager(Trip.booking).joinedload(Booking.user),
+        contains_eager(Trip.booking).joinedload(Booking.pickup_location),
+        contains_eager(Trip.booking).joinedload(Booking.dropoff_location)
+    ).all()
+
+
+def legacy_max_seats_booked(route_id, start_date, end_date):
+    seats_by_date = db.session.query(func.sum(Booking.seats_booked).label('seats')).join(Trip).filter(
+        Booking.route_id == route_id,
+        Trip.trip_date >= start_date,
+        Trip.trip_date <= end_date,
+        Trip.status.in_(['scheduled', 'picked_up'])
+    ).group_by(Trip.trip_date).subquery()
+    return db.session.query(func.max(seats_by_date.c.seats)).scalar() or 0
+
+
+def legacy_list_bookings(user_id=None, route_id=None, status=None):
+    query = Booking.query
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    if route_id:
+        query = query.filter_by(route_id=route_id)
+    if status:
+        query = query.filter_by(status=status)
+    return query.options(
+        joinedload(Booking.user),
+        joinedload(Booking.route),
+        joinedload(Booking.pickup_location),
+        joinedload(Booking.dropoff_location)
+    ).all()
+
+
+def legacy_sync_booking_status_from_trips(booking_id):
+    booking = Booking.query.get(booking_id)
+    if not booking or booking.status != 'active':
+        return
+    if not db.session.query(Trip.query.filter_by(booking_id=booking_id).exists()).scalar():
+        return
+    any_incomplete = db.session.query(Trip.query.filter(
+        Trip.booking_id == booking_id,
+        Trip.status.in_(['scheduled', 'picked_up'])
+    ).exists()).scalar()
+    if not any_incomplete:
+        booking.status = 'completed'
+        db.session.commit()
+
+
+def per_call_us(fn, args, calls, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn(*args)
+        runs.append((time.perf_counter() - started) / calls * 1e6)
+        # A fresh identity map each run, like a new request
+        db.session.remove()
+    return min(runs), statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Query.get() is deprecated; that's the point of the comparison
+    warnings.simplefilter('ignore')
+
+    app = create_app()
+    with app.app_context():
+        route_id, parent_id = seed()
+        today = date.today()
+        cases = [
+            ('TripToday trips', legacy_today_trips, today_trips, (route_id, 'morning', today)),
+            ('capacity max seats', legacy_max_seats_booked, max_seats_booked,
+             (route_id, today, today + timedelta(days=30))),
+            ('GET /bookings by parent', legacy_list_bookings, list_bookings, (parent_id, None, 'active')),
+            ('GET /bookings by route', legacy_list_bookings, list_bookings, (None, route_id, None)),
+            ('trip PATCH booking sync', legacy_sync_booking_status_from_trips, sync_booking_status_from_trips, (1,)),
+        ]
+
+        print(f'{args.calls} calls per run, best/median of {args.repeat} runs (µs per call)')
+        print(f"{'query':<26} {'legacy':>15} {'select()':>15} {'saved':>7}")
+        for name, legacy, current, call_args in cases:
+            expected = legacy(*call_args)
+            got = current(*call_args)
+            assert expected == got, f'{name}: {expected!r} != {got!r}'
+            db.session.remove()
+
+            legacy_best, legacy_median = per_call_us(legacy, call_args, args.calls, args.repeat)
+            current_best, current_median = per_call_us(current, call_args, args.calls, args.repeat)
+            print(f'{name:<26} {legacy_best:>7.1f}/{legacy_median:>7.1f} {current_best:>7.1f}/{current_median:>7.1f} '
+                  f'{1 - current_best / legacy_best:>7.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,425 @@
+"""
+Replay one school day of driver and parent traffic.
+
+    python bench/replay.py                                 # seed a temp SQLite db, run in-process at 60x
+    python bench/replay.py --database-url postgresql://... --url http://127.0.0.1:5555 --workers 64
+    python bench/replay.py --no-seed --database-url postgresql://... --url ... --output day.json
+
+Drivers poll GET /trips/today through the morning (06:30-08:00) and
+afternoon (15:00-17:00) runs and PATCH pickup and dropoff for each of
+today's trips on their route: children are picked up from home over the
+morning run and dropped at school in a burst before 08:00, then collected
+together after school and dropped home over the afternoon. Parents open
+their bookings and a booking's detail, mostly during the runs and a few
+times in between.
+
+Simulated time runs --compression times faster than the wall clock, and
+stretches with nothing scheduled are skipped unless --keep-idle is given.
+The report has, per endpoint, latency percentiles, 409s (contention on a
+trip or booking), errors, database time from the Server-Timing header, and
+how late requests started compared with the schedule (more than a few ms
+means --workers is too small to keep up). Against Postgres it also samples
+pg_stat_activity for lock waits and connection counts, and /metrics for
+time spent waiting on the connection pool.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+from run import SIZES, PASSWORD, ROLE_IDS, LocalClient, HttpClient
+
+# Seconds since midnight of the simulated day
+RUNS = {'morning': (6 * 3600 + 1800, 8 * 3600), 'evening': (15 * 3600, 17 * 3600)}
+MIDDAY = (10 * 3600, 14 * 3600)
+# Quiet stretches longer than this are cut short unless --keep-idle
+IDLE_GAP = 60
+TIMELINE_BUCKET = 15 * 60
+
+LOCK_SAMPLE_SQL = """
+    SELECT count(*) FILTER (WHERE wait_event_type = 'Lock'),
+           coalesce(max(extract(epoch FROM now() - state_change)) FILTER (WHERE wait_event_type = 'Lock'), 0),
+           count(*) FILTER (WHERE state = 'active'),
+           count(*) FILTER (WHERE state = 'idle in transaction'),
+           count(*)
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid()
+"""
+DEADLOCKS_SQL = "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+
+
+class Actor:
+    """One driver's phone (per vehicle) or parent's phone, with its own session"""
+
+    def __init__(self, role, email, client):
+        self.role = role
+        self.email = email
+        self.client = client
+        # A phone waits for one request before sending the next
+        self.lock = threading.Lock()
+
+
+class Event:
+    def __init__(self, at, actor, endpoint, method, path, body=None):
+        self.at = at
+        self.actor = actor
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.body = body
+
+
+def load_day(app, parents_limit, rng):
+    """Vehicles, today's trips and parents with an active booking, from the database"""
+    from models import db, User, Vehicle, Booking, Trip
+
+    today = date.today()
+    with app.app_context():
+        vehicles = db.session.query(Vehicle.id, Vehicle.route_id, User.email).join(User) \
+            .order_by(Vehicle.id).all()
+        trips = db.session.query(Trip.id, Booking.route_id, Trip.service_time).join(Booking).filter(
+            Trip.trip_date == today, Trip.status == 'scheduled'
+        ).order_by(Trip.id).all()
+        bookings = db.session.query(User.email, Booking.user_id, Booking.id).join(User).filter(
+            Booking.status == 'active', Booking.start_date <= today, Booking.end_date >= today
+        ).order_by(Booking.id).all()
+
+    parents = {}
+    for email, user_id, booking_id in bookings:
+        parents.setdefault(email, (user_id, []))[1].append(booking_id)
+    emails = sorted(parents)
+    emails = rng.sample(emails, min(parents_limit, len(emails)))
+    return vehicles, trips, {email: parents[email] for email in emails}
+
+
+def schedule(vehicles, trips, parents, client_factory, options, rng):
+    """Actors and the day's events, in time order"""
+    actors = []
+    events = []
+
+    by_route = {}
+    for vehicle_id, route_id, email in vehicles:
+        actor = Actor('driver', email, client_factory())
+        actors.append(actor)
+        by_route.setdefault(route_id, []).append((vehicle_id, actor))
+
+        for service_time, (start, end) in RUNS.items():
+            at = start + rng.uniform(0, options.poll_interval)
+            while at < end:
+                events.append(Event(at, actor, 'GET /trips/today', 'GET',
+                                    f'/trips/today?vehicle_id={vehicle_id}&service_time={service_time}'))
+                at += options.poll_interval * rng.uniform(0.8, 1.2)
+
+    # Each route's trips are shared out between the vehicles on it
+    seen = {}
+    for trip_id, route_id, service_time in trips:
+        if route_id not in by_route:
+            continue
+        index = seen[route_id] = seen.get(route_id, -1) + 1
+        _, actor = by_route[route_id][index % len(by_route[route_id])]
+        start, end = RUNS[service_time]
+        if service_time == 'morning':
+            # Picked up from home over the run, dropped at school together
+            pickup = rng.uniform(start, end - 20 * 60)
+            dropoff = max(pickup + 60, rng.uniform(end - 20 * 60, end))
+        else:
+            # Collected after school, dropped home over the run
+            pickup = rng.uniform(start, start + 20 * 60)
+            dropoff = rng.uniform(pickup + 10 * 60, end)
+        events.append(Event(pickup, actor, 'PATCH /trips/<id>/pickup', 'PATCH', f'/trips/{trip_id}/pickup', {}))
+        events.append(Event(dropoff, actor, 'PATCH /trips/<id>/dropoff', 'PATCH', f'/trips/{trip_id}/dropoff', {}))
+
+    for email, (user_id, booking_ids) in parents.items():
+        actor = Actor('parent', email, client_factory())
+        actors.append(actor)
+
+        visits = [rng.uniform(*window) for window in RUNS.values() if rng.random() < options.parent_activity]
+        if rng.random() < options.parent_activity / 3:
+            visits.append(rng.uniform(*MIDDAY))
+        for at in visits:
+            # Open the app, look at a booking, then keep refreshing for a while
+            events.append(Event(at, actor, 'GET /bookings', 'GET', f'/bookings?user_id={user_id}'))
+            events.append(Event(at + rng.uniform(5, 20), actor, 'GET /bookings/<id>', 'GET',
+                                f'/bookings/{rng.choice(booking_ids)}'))
+            for _ in range(rng.randint(0, 3)):
+                at += rng.uniform(120, 300)
+                events.append(Event(at, actor, 'GET /bookings', 'GET', f'/bookings?user_id={user_id}'))
+
+    events.sort(key=lambda event: event.at)
+    return actors, events
+
+
+def server_timing_db_ms(headers):
+    for metric in (headers.get('Server-Timing') or '').split(','):
+        name, _, params = metric.strip().partition(';')
+        if name == 'db':
+            for param in params.split(';'):
+                key, _, value = param.partition('=')
+                if key.strip() == 'dur':
+                    return float(value)
+    return None
+
+
+class LockSampler(threading.Thread):
+    """Samples lock waits and connections from pg_stat_activity every interval seconds"""
+
+    def __init__(self, database_url, interval):
+        super().__init__(daemon=True)
+        from sqlalchemy import create_engine
+        self.engine = create_engine(database_url, isolation_level='AUTOCOMMIT')
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def deadlocks(self):
+        from sqlalchemy import text
+        with self.engine.connect() as connection:
+            return connection.execute(text(DEADLOCKS_SQL)).scalar() or 0
+
+    def run(self):
+        from sqlalchemy import text
+        with self.engine.connect() as connection:
+            while not self.stopped.wait(self.interval):
+                self.samples.append(tuple(connection.execute(text(LOCK_SAMPLE_SQL)).one()))
+
+    def summary(self, deadlocks):
+        if not self.samples:
+            return None
+        waiters = [sample[0] for sample in self.samples]
+        return {
+            'samples': len(self.samples),
+            'samples_with_lock_waits': sum(1 for count in waiters if count),
+            'max_lock_waiters': max(waiters),
+            'longest_lock_wait_ms': round(max(float(sample[1]) for sample in self.samples) * 1000, 1),
+            'max_active_connections': max(sample[2] for sample in self.samples),
+            'max_idle_in_transaction': max(sample[3] for sample in self.samples),
+            'max_connections': max(sample[4] for sample in self.samples),
+            'deadlocks': deadlocks,
+        }
+
+
+def pool_checkouts(app, url):
+    """(checkouts, seconds waited, checkouts that waited over 10ms) from /metrics"""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    headers = {}
+    if os.getenv('METRICS_TOKEN'):
+        headers['Authorization'] = f"Bearer {os.environ['METRICS_TOKEN']}"
+    if url:
+        request = urllib.request.Request(url.rstrip('/') + '/metrics', headers=headers)
+        with urllib.request.urlopen(request) as response:
+            text = response.read().decode()
+    else:
+        text = app.test_client().get('/metrics', headers=headers).get_data(as_text=True)
+
+    count = total = fast = 0.0
+    for family in text_string_to_metric_families(text):
+        if family.name != 'minitrack_db_pool_checkout_seconds':
+            continue
+        for sample in family.samples:
+            if sample.name.endswith('_count'):
+                count += sample.value
+            elif sample.name.endswith('_sum'):
+                total += sample.value
+            elif sample.name.endswith('_bucket') and sample.labels.get('le') == '0.01':
+                fast += sample.value
+    return count, total, count - fast
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    if len(values) == 1:
+        values = values * 2
+    quantiles = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50_ms': round(quantiles[49], 1), 'p95_ms': round(quantiles[94], 1),
+            'p99_ms': round(quantiles[98], 1), 'max_ms': round(max(values), 1)}
+
+
+class Replay:
+    def __init__(self, events, compression, workers, keep_idle):
+        self.events = events
+        self.compression = compression
+        self.workers = workers
+        self.keep_idle = keep_idle
+        self.records = []
+
+    def execute(self, event, due):
+        with event.actor.lock:
+            started = time.perf_counter()
+            try:
+                status, _ = event.actor.client.request(event.method, event.path, event.body)
+                db_ms = server_timing_db_ms(event.actor.client.headers)
+            except Exception:
+                status, db_ms = 0, None
+            finished = time.perf_counter()
+        self.records.append((event.endpoint, event.at, (finished - started) * 1000, status,
+                             max(0.0, (started - due) * 1000), db_ms))
+
+    def run(self):
+        started = time.perf_counter()
+        origin = self.events[0].at
+        skipped = 0.0
+        previous = origin
+        with ThreadPoolExecutor(self.workers) as pool:
+            for event in self.events:
+                if not self.keep_idle and event.at - previous > IDLE_GAP:
+                    skipped += event.at - previous - IDLE_GAP
+                previous = event.at
+                due = started + (event.at - origin - skipped) / self.compression
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self.execute, event, due)
+        return time.perf_counter() - started
+
+    def report(self):
+        endpoints = {}
+        for endpoint, _, latency, status, lag, db_ms in self.records:
+            endpoints.setdefault(endpoint, []).append((latency, status, lag, db_ms))
+
+        result = {}
+        for endpoint, rows in sorted(endpoints.items()):
+            result[endpoint] = dict(
+                requests=len(rows),
+                **percentiles([row[0] for row in rows]),
+                conflicts=sum(1 for row in rows if row[1] == 409),
+                errors=sum(1 for row in rows if row[1] == 0 or row[1] >= 500),
+                db_p95_ms=percentiles([row[3] for row in rows if row[3] is not None]).get('p95_ms'),
+                start_lag_p95_ms=percentiles([row[2] for row in rows]).get('p95_ms'),
+            )
+
+        timeline = {}
+        for endpoint, at, latency, status, _, _ in self.records:
+            timeline.setdefault(int(at // TIMELINE_BUCKET) * TIMELINE_BUCKET, []).append(latency)
+        return result, [
+            dict(time=f'{at // 3600:02.0f}:{at % 3600 // 60:02.0f}', requests=len(latencies),
+                 p95_ms=percentiles(latencies)['p95_ms'])
+            for at, latencies in sorted(timeline.items())
+        ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a school day of driver and parent traffic.')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file')
+    parser.add_argument('--url', help='Replay against a running server instead of an in-process app')
+    parser.add_argument('--size', choices=SIZES, default='small', help='Dataset size passed to seed.py')
+    parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database')
+    parser.add_argument('--compression', type=float, default=60, help='Simulated seconds per wall-clock second')
+    parser.add_argument('--keep-idle', action='store_true', help='Do not skip quiet stretches of the day')
+    parser.add_argument('--workers', type=int, default=32, help='Requests in flight at once')
+    parser.add_argument('--parents', type=int, default=300, help='Parents using the app today')
+    parser.add_argument('--parent-activity', type=float, default=0.7,
+                        help='Chance a parent opens the app during each run')
+    parser.add_argument('--poll-interval', type=float, default=30, help='Seconds between a driver\'s polls')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='Wall seconds between lock samples')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write results JSON here')
+    args = parser.parse_args(argv)
+
+    if args.url and not args.database_url:
+        parser.error('--url needs --database-url, to read the day\'s trips and bookings')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replay.db')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ['REQUEST_LOG'] = 'off'
+    os.environ['PROFILE_SAMPLE_RATE'] = '0'
+    # Logins happen before the day starts; skip the first-login hash upgrade
+    os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+    import seed
+    from app import create_app
+
+    app = create_app()
+    if not args.no_seed:
+        seed_args = SIZES[args.size] + ['--reset'] + ([] if args.database_url else ['--create-tables'])
+        with app.app_context():
+            seed.Seeder(seed.build_parser().parse_args(seed_args)).run(app)
+
+    def client_factory():
+        return HttpClient(args.url) if args.url else LocalClient(app)
+
+    rng = random.Random(args.seed)
+    vehicles, trips, parents = load_day(app, args.parents, rng)
+    if not trips:
+        sys.exit('No scheduled trips today; seed with --reset (trips skip days outside a booking\'s days_of_week)')
+    actors, events = schedule(vehicles, trips, parents, client_factory, args, rng)
+
+    print(f'Logging in {len(actors)} drivers and parents')
+    with ThreadPoolExecutor(args.workers) as pool:
+        statuses = list(pool.map(lambda actor: actor.client.request('POST', '/login', {
+            'email': actor.email, 'password': PASSWORD, 'role_id': ROLE_IDS[actor.role]
+        })[0], actors))
+    if any(status != 200 for status in statuses):
+        sys.exit(f'{sum(1 for status in statuses if status != 200)} logins failed')
+
+    sampler = LockSampler(database_url, args.sample_interval) if database_url.startswith('postgresql') else None
+    deadlocks = sampler.deadlocks() if sampler else 0
+    checkouts = pool_checkouts(app, args.url)
+    if sampler:
+        sampler.start()
+
+    print(f'Replaying {len(events)} requests from {len(trips)} trips, {len(vehicles)} vehicles and '
+          f'{len(parents)} parents at {args.compression:g}x')
+    replay = Replay(events, args.compression, args.workers, args.keep_idle)
+    wall = replay.run()
+
+    if sampler:
+        sampler.stopped.set()
+        sampler.join()
+        deadlocks = sampler.deadlocks() - deadlocks
+    after = pool_checkouts(app, args.url)
+    endpoints, timeline = replay.report()
+
+    results = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'database': database_url.split(':', 1)[0],
+            'target': args.url or 'in-process',
+            'compression': args.compression,
+            'workers': args.workers,
+            'wall_seconds': round(wall, 1),
+            'requests': len(events),
+        },
+        'endpoints': endpoints,
+        'timeline': timeline,
+        'locks': sampler.summary(deadlocks) if sampler else None,
+        'pool': {
+            'checkouts': int(after[0] - checkouts[0]),
+            'wait_seconds': round(after[1] - checkouts[1], 3),
+            'checkouts_over_10ms': int(after[2] - checkouts[2]),
+        },
+    }
+
+    print(f"\n{'endpoint':<28} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'409':>5} {'err':>5} "
+          f"{'db p95':>8} {'lag p95':>8}")
+    for endpoint, row in endpoints.items():
+        print(f"{endpoint:<28} {row['requests']:>6} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+              f"{row['max_ms']:>8.1f} {row['conflicts']:>5} {row['errors']:>5} {row['db_p95_ms'] or 0:>8.1f} "
+              f"{row['start_lag_p95_ms']:>8.1f}")
+    print(f"\n{'time':<6} {'requests':>9} {'p95':>8}")
+    for row in timeline:
+        print(f"{row['time']:<6} {row['requests']:>9} {row['p95_ms']:>8.1f}")
+    if results['locks']:
+        print('\nLocks: ' + ', '.join(f'{key}={value}' for key, value in results['locks'].items()))
+    print('Pool: ' + ', '.join(f'{key}={value}' for key, value in results['pool'].items()))
+    print(f'Replayed in {wall:.0f}s')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
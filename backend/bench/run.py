@@ -0,0 +1,379 @@
+"""
+Endpoint benchmarks for the hot paths, with a regression gate.
+
+    python bench/run.py                                   # seed a temp SQLite db, run in-process
+    python bench/run.py --database-url postgresql://...   # seed and run against Postgres
+    python bench/run.py --url http://127.0.0.1:5555 --database-url postgresql://... --concurrency 8
+    python bench/run.py --save-baseline                   # store results as the baseline
+    python bench/run.py --baseline bench/baseline.json    # exit 1 if any p95 regressed
+
+The dataset comes from seed.py, so it is the same on every run. Scenarios
+write to the database (bookings, pickups), so the data is regenerated
+before each run unless --no-seed is given. With --url, requests go over
+HTTP to an app already started against the same database, with
+RATELIMIT_ENABLED=false. Otherwise the app runs in this process through
+Flask's test client.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'bench', 'baseline.json')
+
+SIZES = {
+    'small': ['--routes', '6', '--parents', '500', '--drivers', '12', '--bookings', '1000'],
+    'medium': [],
+    'large': ['--routes', '20', '--parents', '8000', '--drivers', '60', '--bookings', '25000'],
+}
+
+PASSWORD = 'password'
+ROLE_IDS = {'admin': 1, 'driver': 2, 'parent': 3}
+
+
+class LocalClient:
+    """Requests through Flask's test client, in this process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        self.headers = {}
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        self.headers = response.headers
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """Requests over HTTP to a running server, keeping its cookies"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        self.headers = {}
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(
+            self.base_url + path, data=data, method=method, headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with self.opener.open(request) as response:
+                self.headers = response.headers
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as error:
+            self.headers = error.headers
+            return error.code, None
+
+
+class Scenario:
+    def __init__(self, name, role, iterations, run, expected=(200,)):
+        self.name = name
+        self.role = role
+        self.iterations = iterations
+        self.run = run
+        self.expected = set(expected)
+
+
+def build_scenarios(fixtures, warmup):
+    f = fixtures
+    today_trips = f['today_trips']
+    # Each pickup/dropoff request (warmup included) gets its own trip
+    trip_iterations = len(today_trips) - warmup
+
+    def trip_today(client, i):
+        service_time = 'morning' if i % 2 == 0 else 'evening'
+        return client.request('GET', f"/trips/today?vehicle_id={f['vehicle_id']}&service_time={service_time}")
+
+    def booking_list(client, i):
+        return client.request('GET', f"/bookings?route_id={f['busy_route_id']}&status=active")
+
+    def booking_detail(client, i):
+        return client.request('GET', f"/bookings/{f['long_booking_id']}")
+
+    def booking_create(client, i):
+        start = f['next_monday'] + timedelta(weeks=i % 20)
+        return client.request('POST', '/bookings', dict(f['open_booking'], start_date=start.isoformat(),
+                                                      end_date=(start + timedelta(days=4)).isoformat()))
+
+    def booking_create_full(client, i):
+        return client.request('POST', '/bookings', f['full_booking'])
+
+    def trip_pickup(client, i):
+        return client.request('PATCH', f"/trips/{today_trips[i % len(today_trips)]}/pickup", {})
+
+    def trip_dropoff(client, i):
+        return client.request('PATCH', f"/trips/{today_trips[i % len(today_trips)]}/dropoff", {})
+
+    def login(client, i):
+        return client.request('POST', '/login', {
+            'email': f"parent{i % 20 + 1}@minitrack.test", 'password': PASSWORD, 'role_id': ROLE_IDS['parent']
+        })
+
+    scenarios = [
+        Scenario('trip_today', 'driver', 100, trip_today, expected=(200, 201)),
+        Scenario('booking_list', 'parent', 20, booking_list),
+        Scenario('booking_detail_360_trips', 'parent', 100, booking_detail),
+        Scenario('booking_create', 'parent', 50, booking_create, expected=(201,)),
+        Scenario('booking_create_at_capacity', 'parent', 20, booking_create_full, expected=(409,)),
+        Scenario('trip_pickup', 'driver', trip_iterations, trip_pickup),
+        Scenario('trip_dropoff', 'driver', trip_iterations, trip_dropoff),
+        Scenario('login', None, 20, login),
+    ]
+    if trip_iterations < 2:
+        print('No scheduled trips today on the busiest route; skipping trip_pickup and trip_dropoff')
+        scenarios = [scenario for scenario in scenarios if scenario.name not in ('trip_pickup', 'trip_dropoff')]
+    return scenarios
+
+
+def prepare_fixtures(app, client_factory):
+    """Find (or create through the API) the rows each scenario needs"""
+    from sqlalchemy import func
+    from models import db, User, Route, Vehicle, Booking, Trip, PickupLocation, SchoolLocation
+
+    today = date.today()
+    with app.app_context():
+        busy_route_id = db.session.query(Booking.route_id).group_by(Booking.route_id) \
+            .order_by(func.count().desc()).limit(1).scalar()
+        vehicle = Vehicle.query.filter_by(route_id=busy_route_id).first()
+        driver = db.session.get(User, vehicle.user_id)
+        parent = User.query.filter_by(email='parent1@minitrack.test').one()
+        today_trips = [trip_id for (trip_id,) in db.session.query(Trip.id).join(Booking).filter(
+            Trip.trip_date == today, Trip.status == 'scheduled', Booking.route_id == busy_route_id
+        ).order_by(Trip.id).limit(250)]
+
+        full_booking = {
+            'user_id': parent.id,
+            'route_id': busy_route_id,
+            'pickup_location_id': PickupLocation.query.filter_by(route_id=busy_route_id).first().id,
+            'dropoff_location_id': SchoolLocation.query.filter_by(route_id=busy_route_id).first().id,
+            'start_date': (today + timedelta(days=1)).isoformat(),
+            'end_date': (today + timedelta(days=60)).isoformat(),
+            'days_of_week': '1,2,3,4,5',
+            'service_type': 'both',
+            'seats_booked': 1,
+        }
+
+        # A quiet route with a big vehicle, so new bookings are accepted
+        route = Route(name=f'Bench route {datetime.utcnow():%H%M%S%f}', starting_point='Bench', ending_point='Bench')
+        db.session.add(route)
+        db.session.flush()
+        pickup = PickupLocation(route_id=route.id, name='Bench stop', gps_coordinates='-1.28,36.82')
+        school = SchoolLocation(route_id=route.id, name='Bench school', gps_coordinates='-1.29,36.81')
+        db.session.add_all([pickup, school, Vehicle(
+            route_id=route.id, user_id=driver.id, license_plate=f'BENCH {route.id}', model='Bench', capacity=100000
+        )])
+        db.session.commit()
+
+        open_booking = dict(
+            full_booking, route_id=route.id, pickup_location_id=pickup.id, dropoff_location_id=school.id
+        )
+        fixtures = {
+            'vehicle_id': vehicle.id,
+            'busy_route_id': busy_route_id,
+            'today_trips': today_trips,
+            'full_booking': full_booking,
+            'open_booking': open_booking,
+            'next_monday': today + timedelta(days=7 - today.weekday()),
+            'driver_email': driver.email,
+            'parent_email': parent.email,
+        }
+
+    # 180 days, every day, morning and evening: 360 trips
+    client = client_factory()
+    login(client, 'parent', fixtures)
+    status, body = client.request('POST', '/bookings', dict(
+        open_booking,
+        start_date=(today + timedelta(days=1)).isoformat(),
+        end_date=(today + timedelta(days=180)).isoformat(),
+        days_of_week='1,2,3,4,5,6,7',
+    ))
+    if status != 201:
+        sys.exit(f'Could not create the 360-trip booking: {status} {body}')
+    fixtures['long_booking_id'] = body['booking_id']
+    return fixtures
+
+
+def login(client, role, fixtures):
+    if role is None:
+        return
+    status, body = client.request('POST', '/login', {
+        'email': fixtures[f'{role}_email'], 'password': PASSWORD, 'role_id': ROLE_IDS[role]
+    })
+    if status != 200:
+        sys.exit(f'Could not log in as {role}: {status} {body}')
+
+
+def percentile(quantiles, p):
+    return round(quantiles[p - 1], 2)
+
+
+def run_scenario(scenario, client_factory, fixtures, concurrency, warmup):
+    clients = []
+    for _ in range(concurrency):
+        client = client_factory()
+        login(client, scenario.role, fixtures)
+        clients.append(client)
+
+    for i in range(warmup):
+        scenario.run(clients[0], i)
+
+    latencies = []
+    unexpected = {}
+
+    def one(i):
+        started = time.perf_counter()
+        status, _ = scenario.run(clients[i % concurrency], warmup + i)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if status not in scenario.expected:
+            unexpected[status] = unexpected.get(status, 0) + 1
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        for i in range(scenario.iterations):
+            one(i)
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(one, range(scenario.iterations)))
+    wall = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(latencies),
+        'p50_ms': percentile(quantiles, 50),
+        'p95_ms': percentile(quantiles, 95),
+        'p99_ms': percentile(quantiles, 99),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'throughput_rps': round(len(latencies) / wall, 1),
+        'unexpected_statuses': unexpected,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print a comparison and return the names of regressed scenarios"""
+    regressed = []
+    print(f"\n{'scenario':<28} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for name, current in results['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            print(f"{name:<28} {'-':>10} {current['p95_ms']:>10.2f} {'new':>8}")
+            continue
+        change = current['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0
+        worse = change > tolerance and current['p95_ms'] - base['p95_ms'] > min_delta_ms
+        if worse:
+            regressed.append(name)
+        print(f"{name:<28} {base['p95_ms']:>10.2f} {current['p95_ms']:>10.2f} {change:>+7.0%}{'  REGRESSED' if worse else ''}")
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot API paths.')
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file')
+    parser.add_argument('--url', help='Benchmark a running server instead of an in-process app')
+    parser.add_argument('--size', choices=SIZES, default='small', help='Dataset size passed to seed.py')
+    parser.add_argument('--no-seed', action='store_true', help='Use the data already in the database')
+    parser.add_argument('--scenarios', help='Comma-separated subset to run')
+    parser.add_argument('--iterations', type=float, default=1.0, help='Multiplier for every scenario')
+    parser.add_argument('--concurrency', type=int, default=1, help='Parallel clients (with --url)')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--baseline', help=f'Compare with this results file (e.g. {os.path.relpath(DEFAULT_BASELINE)})')
+    parser.add_argument('--save-baseline', action='store_true', help=f'Write results to {os.path.relpath(DEFAULT_BASELINE)}')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore p95 changes smaller than this')
+    args = parser.parse_args(argv)
+
+    if args.concurrency > 1 and not args.url:
+        parser.error('--concurrency needs --url; the in-process client runs one request at a time')
+
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['RATELIMIT_ENABLED'] = 'false'
+    os.environ['REQUEST_LOG'] = 'off'
+    os.environ['PROFILE_SAMPLE_RATE'] = '0'
+
+    import seed
+    from app import create_app
+
+    app = create_app()
+    if not args.no_seed:
+        seed_args = SIZES[args.size] + ['--reset'] + ([] if args.database_url else ['--create-tables'])
+        with app.app_context():
+            seed.Seeder(seed.build_parser().parse_args(seed_args)).run(app)
+
+    def client_factory():
+        return HttpClient(args.url) if args.url else LocalClient(app)
+
+    fixtures = prepare_fixtures(app, client_factory)
+    scenarios = build_scenarios(fixtures, args.warmup)
+    if args.scenarios:
+        wanted = set(args.scenarios.split(','))
+        scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': database_url.split(':', 1)[0],
+            'target': args.url or 'in-process',
+            'size': None if args.no_seed else args.size,
+            'concurrency': args.concurrency,
+        },
+        'scenarios': {},
+    }
+
+    print(f"\n{'scenario':<28} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8}")
+    failed = False
+    for scenario in scenarios:
+        if scenario.name not in ('trip_pickup', 'trip_dropoff'):
+            scenario.iterations = max(2, int(scenario.iterations * args.iterations))
+        result = run_scenario(scenario, client_factory, fixtures, args.concurrency, args.warmup)
+        results['scenarios'][scenario.name] = result
+        print(f"{scenario.name:<28} {result['requests']:>5} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+              f"{result['p99_ms']:>8.2f} {result['throughput_rps']:>8.1f}")
+        if result['unexpected_statuses']:
+            failed = True
+            print(f"  unexpected statuses: {result['unexpected_statuses']}")
+
+    for path in filter(None, [args.output, DEFAULT_BASELINE if args.save_baseline else None]):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressed:
+            print(f"\np95 regressed by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+            return 1
+
+    return 2 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
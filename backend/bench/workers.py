@@ -0,0 +1,164 @@
+"""
+Compare gunicorn sync and gevent workers at (roughly) equal memory.
+
+    python bench/workers.py --database-url postgresql://...
+    python bench/workers.py --database-url postgresql://... --sync-workers 8 --gevent-workers 2 --concurrency 64
+
+For each mode, starts gunicorn with gunicorn.conf.py against the database,
+drives it over HTTP with bench/run.py (which reseeds first, so both modes
+see the same data) and then measures the server's memory as PSS: pages the
+master and workers share copy-on-write are split between them rather than
+counted once per process. Choose worker counts that give similar PSS totals;
+req/s per 100 MB compares the modes either way. The database must already
+be migrated (flask db upgrade). Needs Linux (/proc) and gevent. SQLite
+works for a dry run, but sqlite3 blocks the whole gevent worker, so only
+Postgres shows the difference.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCENARIOS = 'trip_today,booking_list,booking_detail_360_trips'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f'gunicorn exited with {process.returncode}')
+        try:
+            urllib.request.urlopen(url + '/me', timeout=1)
+            return
+        except urllib.error.HTTPError:
+            # Any HTTP answer (401 here) means a worker is serving
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit(f'gunicorn did not answer on {url} within {timeout}s')
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            found.append(int(entry))
+    return found
+
+
+def pss_mb(pid):
+    """PSS of pid and its descendants, in MB"""
+    total_kb = 0
+    for process in [pid] + [grandchild for child in children(pid) for grandchild in [child] + children(child)]:
+        try:
+            with open(f'/proc/{process}/smaps_rollup') as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except (OSError, StopIteration):
+            pass
+    return total_kb / 1024
+
+
+def run_mode(args, worker_class, workers):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(
+        os.environ,
+        DATABASE_URL=args.database_url,
+        RATELIMIT_ENABLED='false',
+        REQUEST_LOG='off',
+        PROFILE_SAMPLE_RATE='0',
+        PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix='minitrack-prometheus-'),
+        # gunicorn.conf.py reads the class to patch the preloading master
+        GUNICORN_WORKER_CLASS=worker_class,
+        GUNICORN_WORKER_CONNECTIONS=str(args.worker_connections),
+    )
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(url, server)
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        bench = subprocess.run(
+            [sys.executable, os.path.join(BACKEND_DIR, 'bench', 'run.py'), '--url', url,
+             '--database-url', args.database_url, '--size', args.size, '--scenarios', args.scenarios,
+             '--concurrency', str(args.concurrency), '--iterations', str(args.iterations), '--output', output],
+            cwd=BACKEND_DIR, env=dict(os.environ, DATABASE_URL=args.database_url),
+            stdout=subprocess.DEVNULL if not args.verbose else None
+        )
+        if bench.returncode not in (0, 2):
+            sys.exit(f'bench/run.py failed against {worker_class} workers')
+        memory = pss_mb(server.pid)
+        with open(output) as f:
+            return {'worker_class': worker_class, 'workers': workers, 'pss_mb': round(memory, 1),
+                    'scenarios': json.load(f)['scenarios']}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare sync and gevent gunicorn workers.')
+    parser.add_argument('--database-url', required=True, help='Database the servers use (it is reseeded)')
+    parser.add_argument('--size', default='small', help='Dataset size passed to bench/run.py')
+    parser.add_argument('--sync-workers', type=int, default=4)
+    parser.add_argument('--gevent-workers', type=int, default=1)
+    parser.add_argument('--worker-connections', type=int, default=50, help='Concurrent requests per gevent worker')
+    parser.add_argument('--concurrency', type=int, default=32, help='Parallel clients')
+    parser.add_argument('--iterations', type=float, default=5.0, help='Multiplier for every scenario')
+    parser.add_argument('--scenarios', default=DEFAULT_SCENARIOS)
+    parser.add_argument('--output', help='Write results JSON here')
+    parser.add_argument('--verbose', action='store_true', help="Show bench/run.py's output")
+    args = parser.parse_args(argv)
+
+    results = [run_mode(args, 'sync', args.sync_workers)]
+    if args.gevent_workers:
+        results.append(run_mode(args, 'gevent', args.gevent_workers))
+
+    print(f"\n{'mode':<8} {'workers':>7} {'PSS MB':>8}  {'scenario':<26} {'p50':>8} {'p95':>8} {'req/s':>8} "
+          f"{'req/s per 100MB':>16}")
+    for result in results:
+        for name, scenario in result['scenarios'].items():
+            per_100mb = scenario['throughput_rps'] / result['pss_mb'] * 100 if result['pss_mb'] else 0
+            print(f"{result['worker_class']:<8} {result['workers']:>7} {result['pss_mb']:>8.1f}  {name:<26} "
+                  f"{scenario['p50_ms']:>8.2f} {scenario['p95_ms']:>8.2f} {scenario['throughput_rps']:>8.1f} "
+                  f"{per_100mb:>16.1f}")
+
+    if len(results) == 2:
+        ratio = results[1]['pss_mb'] / results[0]['pss_mb'] if results[0]['pss_mb'] else 0
+        if not 0.85 <= ratio <= 1.15:
+            print(f"\ngevent used {ratio:.0%} of sync's memory; adjust --sync-workers/--gevent-workers "
+                  f"for an equal-memory comparison")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import gzip
+import os
+
+from flask import request
+
+from cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Responses are compressed after the fact in an after_request hook, picking
+# brotli or gzip from Accept-Encoding. A compressed body is a different
+# representation, so its strong ETag gets an encoding suffix; conditional()
+# in http_cache accepts either form. Bodies that carry an ETag are the same
+# for every caller, so their compressed bytes are kept and reused.
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/csv')
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gzip'}
+
+_compressed = TTLCache('compressed_bodies', maxsize=256, ttl=3600)
+
+
+def _negotiate():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def _compress(body, encoding, app):
+    if encoding == 'br':
+        return brotli.compress(body, quality=app.config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(body, compresslevel=app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def _encoded_etag(response, encoding):
+    etag, weak = response.get_etag()
+    if etag is None:
+        return None
+    etag += ETAG_SUFFIXES[encoding]
+    response.set_etag(etag, weak)
+    return etag
+
+
+def compress_response(response, app):
+    if response.mimetype not in COMPRESSIBLE_TYPES or 'Content-Encoding' in response.headers:
+        return response
+
+    # 304s carry the ETag of the representation the client holds
+    if response.status_code == 304:
+        encoding = _negotiate()
+        if encoding:
+            _encoded_etag(response, encoding)
+        return response
+
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.content_length is None or response.content_length < app.config['COMPRESS_MIN_SIZE']):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate()
+    if encoding is None:
+        return response
+
+    etag = _encoded_etag(response, encoding)
+    body = _compressed.get(etag) if etag else None
+    if body is None:
+        body = _compress(response.get_data(), encoding, app)
+        if etag:
+            _compressed.set(etag, body)
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.config.setdefault(
+        'COMPRESS_ENABLED', os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+    )
+    # Bodies smaller than this are sent as they are
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.getenv('COMPRESS_MIN_SIZE', '1024')))
+    # gzip 1-9 and brotli 0-11; the defaults favour speed for per-request compression
+    app.config.setdefault('COMPRESS_LEVEL', int(os.getenv('COMPRESS_LEVEL', '6')))
+    app.config.setdefault('COMPRESS_BR_LEVEL', int(os.getenv('COMPRESS_BR_LEVEL', '4')))
+
+    @app.after_request
+    def compress(response):
+        if not app.config['COMPRESS_ENABLED']:
+            return response
+        return compress_response(response, app)
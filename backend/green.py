@@ -0,0 +1,41 @@
+import sys
+
+
+# Support for gunicorn's gevent workers (GUNICORN_WORKER_CLASS=gevent, see
+# gunicorn.conf.py). The worker monkey-patches the standard library, so
+# sockets, locks, sleeps and threads yield to other requests. psycopg2 talks
+# to Postgres through libpq, which gevent cannot patch: install_psycopg2()
+# registers a wait callback that makes it yield while waiting on the server.
+
+
+def is_patched():
+    """True in a gevent worker"""
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('threading')
+
+
+def _wait(conn, timeout=None):
+    from psycopg2 import extensions, OperationalError
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f'Bad result from poll: {state!r}')
+
+
+def install_psycopg2():
+    from psycopg2 import extensions
+    extensions.set_wait_callback(_wait)
+
+
+def psycopg2_is_green():
+    """COPY is refused on connections that use a wait callback"""
+    from psycopg2 import extensions
+    return extensions.get_wait_callback() is not None
@@ -0,0 +1,67 @@
+import gc
+import os
+import shutil
+
+
+# Prometheus multiprocess mode: each worker writes its metrics to files here
+# and /metrics merges them. It must be set before prometheus_client is
+# imported, which is why it lives in the gunicorn config and not the app.
+prometheus_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/minitrack-prometheus')
+# With preload_app the master imports prometheus_client before on_starting
+os.makedirs(prometheus_dir, exist_ok=True)
+
+# "sync": one request at a time per worker. "gevent": each worker serves up
+# to worker_connections requests at once, switching between them while they
+# wait on Postgres or the network (limits are in the README).
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '50'))
+
+# Build the app once in the master and fork workers from it: imports, route
+# registration and mapper configuration are done once, and the memory they
+# use stays shared with every worker until written to (copy-on-write).
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+if preload_app:
+    if worker_class == 'gevent':
+        # Patch before the app imports socket/threading/ssl in the master
+        from gevent import monkey
+        monkey.patch_all()
+    # Collections in the master would touch (and so copy) shared pages; the
+    # objects it has built are frozen in pre_fork instead
+    gc.disable()
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be added to this one
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir)
+
+
+def pre_fork(server, worker):
+    # Move everything built so far out of the collector's reach: a worker's
+    # collections would otherwise write to every object's header and unshare
+    # the pages holding them
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    gc.enable()
+    if server.cfg.preload_app:
+        # Connections belong to one process; drop any the master opened
+        # without closing them under its feet
+        from models import db
+        with server.app.wsgi().app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    # After the gevent worker has monkey-patched and loaded the app
+    import green
+    if green.is_patched():
+        green.install_psycopg2()
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+import time
+from functools import wraps
+from itertools import chain
+
+from flask import current_app, request, Response
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from werkzeug.http import quote_etag
+
+from cache import TTLCache
+from compression import ETAG_SUFFIXES
+from models import db, CacheVersion
+import notify
+
+
+# Reference tables served with ETags. Each has a version in cache_versions
+# that is bumped in the same transaction as any write to the table, and every
+# worker keeps the current versions in memory. An ETag is derived from the
+# request path and the versions of the tables the endpoint reads, so a
+# matching If-None-Match is answered with 304 without touching the database.
+TRACKED_TABLES = ('routes', 'school_locations', 'pickup_locations', 'user_roles')
+
+CHANNEL = 'cache_versions'
+
+BUMP_SQL = """
+    INSERT INTO cache_versions (table_name, version) VALUES (:table_name, 1)
+    ON CONFLICT (table_name) DO UPDATE SET version = cache_versions.version + 1
+    RETURNING version
+"""
+
+_responses = TTLCache('http_responses', maxsize=512, ttl=3600)
+_state = {'versions': {}, 'pid': None, 'loaded_at': 0}
+_lock = threading.Lock()
+
+
+def _set_version(table_name, version):
+    with _lock:
+        if version > _state['versions'].get(table_name, 0):
+            _state['versions'][table_name] = version
+
+
+def _load():
+    versions = dict(db.session.query(CacheVersion.table_name, CacheVersion.version))
+    with _lock:
+        _state.update(versions=versions, pid=os.getpid(), loaded_at=time.monotonic())
+
+
+def _on_notify(payload):
+    table_name, _, version = payload.partition(':')
+    _set_version(table_name, int(version))
+
+
+def _ensure_loaded():
+    listener = notify.get_listener(current_app)
+
+    if _state['pid'] != os.getpid():
+        _load()
+        listener.ensure_started()
+    elif not listener.connected.is_set():
+        # Without NOTIFY, other workers' writes are only seen by polling
+        if time.monotonic() - _state['loaded_at'] > current_app.config['HTTP_CACHE_REFRESH_SECONDS']:
+            _load()
+
+
+def touch(session, *table_names):
+    """
+    Mark tables as written in this transaction, for writes the session
+    cannot see (raw SQL, COPY). ORM writes are picked up automatically.
+    """
+    session.info.setdefault('touched_tables', set()).update(
+        name for name in table_names if name in TRACKED_TABLES
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    touch(session, *{
+        obj.__table__.name for obj in chain(session.new, session.dirty, session.deleted)
+    })
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        touch(orm_execute_state.session, orm_execute_state.statement.table.name)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(session):
+    # Pending changes are only flushed after before_commit, so flush them now
+    session.flush()
+
+    touched = session.info.pop('touched_tables', None)
+    if not touched:
+        return
+
+    bumped = {}
+    for table_name in sorted(touched):
+        bumped[table_name] = session.execute(text(BUMP_SQL), {'table_name': table_name}).scalar()
+        notify.publish(session, CHANNEL, f'{table_name}:{bumped[table_name]}')
+    session.info['bumped_versions'] = bumped
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_versions(session):
+    for table_name, version in session.info.pop('bumped_versions', {}).items():
+        _set_version(table_name, version)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_versions(session):
+    session.info.pop('touched_tables', None)
+    session.info.pop('bumped_versions', None)
+
+
+def conditional(*table_names):
+    """
+    Serve a GET with an ETag built from the versions of the tables it reads.
+    Matching If-None-Match requests get a 304, and 200 bodies are kept by
+    ETag, so neither needs a query. Put it below any auth decorator, and
+    only use it where the response is the same for every caller.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['HTTP_CACHE_ENABLED']:
+                return fn(*args, **kwargs)
+
+            _ensure_loaded()
+            versions = _state['versions']
+            fingerprint = request.full_path + '|' + ','.join(
+                f'{name}={versions.get(name, 0)}' for name in table_names
+            )
+            etag = hashlib.blake2b(fingerprint.encode(), digest_size=12).hexdigest()
+
+            max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+            headers = {
+                'ETag': quote_etag(etag),
+                # Cookie-authenticated, so only the browser may keep it
+                'Cache-Control': f'private, max-age={max_age}, must-revalidate' if max_age else 'private, no-cache',
+            }
+
+            # The client may hold the plain or a compressed representation
+            if any(request.if_none_match.contains(etag + suffix) for suffix in ('', *ETAG_SUFFIXES.values())):
+                return Response(status=304, headers=headers)
+
+            cached = _responses.get(etag)
+            if cached is not None:
+                return cached, 200, headers
+
+            result = fn(*args, **kwargs)
+            data, status = result if isinstance(result, tuple) else (result, 200)
+            if status != 200:
+                return result
+
+            _responses.set(etag, data)
+            return data, 200, headers
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    app.config.setdefault(
+        'HTTP_CACHE_ENABLED', os.getenv('HTTP_CACHE_ENABLED', 'true').lower() == 'true'
+    )
+    # Seconds browsers may reuse a response without revalidating (0 = always revalidate)
+    app.config.setdefault('HTTP_CACHE_MAX_AGE', int(os.getenv('HTTP_CACHE_MAX_AGE', '0')))
+    # How often to reload versions when LISTEN/NOTIFY is not available
+    app.config.setdefault(
+        'HTTP_CACHE_REFRESH_SECONDS', float(os.getenv('HTTP_CACHE_REFRESH_SECONDS', '5'))
+    )
+
+    listener = notify.get_listener(app)
+    listener.subscribe(CHANNEL, _on_notify)
+    # Bumps sent while the listener was down were missed
+    listener.on_reconnect(_load)
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import sys
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Every request gets a RequestStats in g. Engine cursor events add each
+# statement's time to it, and after_request turns it into a Server-Timing
+# header and one JSON log line. Requests over the query-count or latency
+# thresholds are logged as warnings with their slowest statement.
+logger = logging.getLogger('minitrack.requests')
+
+SLOW_SQL_MAX_LENGTH = 500
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'db_seconds', 'slowest_seconds', 'slowest_statement')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+
+    def record(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+
+def current_stats():
+    """This request's stats, or None outside a request"""
+    return g.get('request_stats') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - conn.info['query_started'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, seconds)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def _server_timing(stats, total_ms):
+    db_ms = stats.db_seconds * 1000
+    # Reads sent to the read replica, see replica.py
+    where = ' on replica' if g.get('read_replica') else ''
+    return (
+        f'db;dur={db_ms:.1f};desc="{stats.queries} queries{where}", '
+        f'app;dur={total_ms - db_ms:.1f}, '
+        f'total;dur={total_ms:.1f}'
+    )
+
+
+def _log(app, stats, response, total_ms):
+    slow = (
+        total_ms > app.config['SLOW_REQUEST_MS']
+        or stats.queries > app.config['SLOW_REQUEST_QUERIES']
+    )
+    if not slow and app.config['REQUEST_LOG'] != 'all':
+        return
+
+    record = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'duration_ms': round(total_ms, 1),
+        'db_ms': round(stats.db_seconds * 1000, 1),
+        'queries': stats.queries,
+        'slowest_query_ms': round(stats.slowest_seconds * 1000, 1),
+    }
+    if g.get('read_replica'):
+        record['read_replica'] = True
+    if slow:
+        record['slow'] = True
+        if stats.slowest_statement:
+            record['slowest_query'] = ' '.join(stats.slowest_statement.split())[:SLOW_SQL_MAX_LENGTH]
+        logger.warning(json.dumps(record))
+    else:
+        logger.info(json.dumps(record))
+
+
+def init_app(app):
+    app.config.setdefault(
+        'SERVER_TIMING_ENABLED', os.getenv('SERVER_TIMING_ENABLED', 'true').lower() == 'true'
+    )
+    # "all", "slow" (only requests over a threshold) or "off"
+    app.config.setdefault('REQUEST_LOG', os.getenv('REQUEST_LOG', 'all'))
+    app.config.setdefault('SLOW_REQUEST_MS', float(os.getenv('SLOW_REQUEST_MS', '500')))
+    app.config.setdefault('SLOW_REQUEST_QUERIES', int(os.getenv('SLOW_REQUEST_QUERIES', '20')))
+
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats = RequestStats()
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = current_stats()
+        if stats is None:
+            return response
+
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        if app.config['SERVER_TIMING_ENABLED']:
+            response.headers['Server-Timing'] = _server_timing(stats, total_ms)
+        if app.config['REQUEST_LOG'] != 'off':
+            _log(app, stats, response, total_ms)
+        return response
@@ -0,0 +1,70 @@
+import json
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from cache import caches
+import notify
+
+
+# Evictions from the in-process caches in cache.caches are queued on the
+# writing session. When it commits, the worker evicts its own copy and sends
+# a NOTIFY so every other worker's listener evicts theirs. A listener that
+# reconnects may have missed some, so it flushes every cache instead.
+CHANNEL = 'cache_invalidate'
+
+
+def publish(session, cache_name, key=None):
+    """
+    Evict key (or the whole cache if key is None) from cache_name in every
+    worker once this session's transaction commits. The caller commits.
+    """
+    session.info.setdefault('invalidations', []).append({'cache': cache_name, 'key': key})
+
+
+def evict(cache_name, key=None):
+    cache = caches.get(cache_name)
+    if cache is None:
+        return
+    if key is None:
+        cache.clear()
+    else:
+        cache.invalidate(key)
+
+
+def flush_all():
+    for cache in caches.values():
+        cache.clear()
+
+
+def _on_notify(payload):
+    message = json.loads(payload)
+    evict(message['cache'], message['key'])
+
+
+@event.listens_for(Session, 'before_commit')
+def _send(session):
+    for message in session.info.get('invalidations', ()):
+        notify.publish(session, CHANNEL, json.dumps(message))
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_local(session):
+    for message in session.info.pop('invalidations', ()):
+        evict(message['cache'], message['key'])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('invalidations', None)
+
+
+def init_app(app):
+    listener = notify.get_listener(app)
+    listener.subscribe(CHANNEL, _on_notify)
+    listener.on_reconnect(flush_all)
+
+    @app.before_request
+    def start_listener():
+        # Once per worker process; a no-op afterwards
+        listener.ensure_started()
@@ -0,0 +1,136 @@
+import hmac
+import os
+import time
+
+from flask import current_app, request, Response
+from flask_restful import Resource
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+)
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from instrumentation import current_stats
+
+
+# With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py), every worker
+# writes its samples to files in that directory and /metrics merges them,
+# so a scrape sees the whole server rather than whichever worker answered.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    'minitrack_request_seconds',
+    'Time spent handling a request, by resource class',
+    ['resource', 'method', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'minitrack_db_pool_checkout_seconds',
+    'Time spent waiting for a database connection from the pool',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+
+DB_POOL_TIMEOUTS = Counter(
+    'minitrack_db_pool_timeouts',
+    'Requests that gave up waiting DB_POOL_TIMEOUT seconds for a database connection'
+)
+
+LOGIN_SECONDS = Histogram(
+    'minitrack_login_seconds',
+    'Time spent handling POST /login',
+    ['outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
+
+PASSWORD_HASH_SECONDS = Histogram(
+    'minitrack_password_hash_seconds',
+    'Time spent hashing or verifying a password, including pool wait',
+    ['operation'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)
+)
+
+BOOKINGS_CREATED = Counter(
+    'minitrack_bookings_created',
+    'Bookings created'
+)
+
+BOOKINGS_REJECTED = Counter(
+    'minitrack_bookings_rejected',
+    'Booking requests refused with 409',
+    ['reason']
+)
+
+TRIP_EVENTS = Counter(
+    'minitrack_trip_events',
+    'Children picked up or dropped off by drivers',
+    ['event']
+)
+
+REPLICA_READS = Counter(
+    'minitrack_replica_reads',
+    'GETs on read-replica resources, by where their reads went',
+    ['decision']
+)
+
+REPLICA_LAG_SECONDS = Gauge(
+    'minitrack_replica_lag_seconds',
+    'Replication lag of the read replica at its last check',
+    multiprocess_mode='max'
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+
+def _registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def resource_name():
+    """The flask-restful resource class handling this request"""
+    view = current_app.view_functions.get(request.endpoint)
+    view_class = getattr(view, 'view_class', None)
+    if view_class is not None:
+        return view_class.__name__
+    return request.endpoint or 'unmatched'
+
+
+class Metrics(Resource):
+    def get(self):
+        # Optional shared secret for scrapers, sent as "Authorization: Bearer <token>"
+        token = current_app.config.get('METRICS_TOKEN')
+        if token:
+            supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            if not hmac.compare_digest(supplied, token):
+                return {"error": "Unauthorized"}, 401
+
+        return Response(generate_latest(_registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    # Uses the start time instrumentation records for each request
+    @app.after_request
+    def observe_request(response):
+        stats = current_stats()
+        if stats is not None:
+            REQUEST_SECONDS.labels(resource_name(), request.method, response.status_code).observe(
+                time.perf_counter() - stats.started
+            )
+        return response
@@ -0,0 +1,68 @@
+"""add pickup location grid cell
+
+Revision ID: 7c1d2e9a4b10
+Revises: 59e6d8443989
+Create Date: 2026-10-19 09:12:40.118204
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1d2e9a4b10'
+down_revision = '59e6d8443989'
+branch_labels = None
+depends_on = None
+
+
+# Frozen copy of pickup_dedupe.grid_cell at this revision
+GRID_CELL_M = 50
+METRES_PER_DEGREE = 111320.0
+
+
+def grid_cell(gps_coordinates):
+    try:
+        lat, lng = (float(part) for part in gps_coordinates.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    y = math.floor(lat * METRES_PER_DEGREE / GRID_CELL_M)
+    x = math.floor(lng * METRES_PER_DEGREE * math.cos(math.radians(lat)) / GRID_CELL_M)
+    return f"{y}:{x}"
+
+
+def upgrade():
+    with op.batch_alter_table('pickup_locations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('grid_cell', sa.String(length=40), nullable=True))
+        batch_op.create_index('ix_pickup_locations_route_id_grid_cell', ['route_id', 'grid_cell'], unique=False)
+
+    # Backfill the spatial hash for existing stops
+    conn = op.get_bind()
+    pickup_locations = sa.table(
+        'pickup_locations',
+        sa.column('id', sa.Integer),
+        sa.column('gps_coordinates', sa.String),
+        sa.column('grid_cell', sa.String),
+    )
+    rows = conn.execute(sa.select(pickup_locations.c.id, pickup_locations.c.gps_coordinates)).fetchall()
+    updates = [
+        {'location_id': row.id, 'cell': grid_cell(row.gps_coordinates)}
+        for row in rows
+    ]
+    if updates:
+        conn.execute(
+            pickup_locations.update()
+            .where(pickup_locations.c.id == sa.bindparam('location_id'))
+            .values(grid_cell=sa.bindparam('cell')),
+            updates
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('pickup_locations', schema=None) as batch_op:
+        batch_op.drop_index('ix_pickup_locations_route_id_grid_cell')
+        batch_op.drop_column('grid_cell')
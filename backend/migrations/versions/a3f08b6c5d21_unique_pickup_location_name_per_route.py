@@ -0,0 +1,50 @@
+"""unique pickup location name per route
+
+Revision ID: a3f08b6c5d21
+Revises: 7c1d2e9a4b10
+Create Date: 2026-10-19 10:02:11.540377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f08b6c5d21'
+down_revision = '7c1d2e9a4b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fold stops that share a name on the same route into the oldest one
+    # before the unique constraint is added
+    op.execute("""
+        UPDATE bookings SET pickup_location_id = (
+            SELECT MIN(keep.id)
+            FROM pickup_locations keep
+            JOIN pickup_locations dup
+              ON dup.route_id = keep.route_id AND dup.name = keep.name
+            WHERE dup.id = bookings.pickup_location_id
+        )
+        WHERE pickup_location_id IN (
+            SELECT id FROM pickup_locations
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM pickup_locations GROUP BY route_id, name
+            )
+        )
+    """)
+    op.execute("""
+        DELETE FROM pickup_locations
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM pickup_locations GROUP BY route_id, name
+        )
+    """)
+
+    with op.batch_alter_table('pickup_locations', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_pickup_locations_route_id_name', ['route_id', 'name'])
+
+
+def downgrade():
+    with op.batch_alter_table('pickup_locations', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_pickup_locations_route_id_name', type_='unique')
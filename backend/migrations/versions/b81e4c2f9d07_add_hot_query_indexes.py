@@ -0,0 +1,71 @@
+"""add hot query indexes
+
+Revision ID: b81e4c2f9d07
+Revises: f7a0c3d85e42
+Create Date: 2026-10-19 15:42:08.516377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e4c2f9d07'
+down_revision = 'f7a0c3d85e42'
+branch_labels = None
+depends_on = None
+
+
+OPEN_TRIP = "status IN ('scheduled', 'picked_up')"
+
+# name, table, columns, partial index predicate
+INDEXES = [
+    ('ix_trips_open_trip_date', 'trips', ['trip_date', 'service_time', 'booking_id'], OPEN_TRIP),
+    ('ix_trips_booking_id_trip_date', 'trips', ['booking_id', 'trip_date'], None),
+    ('ix_bookings_route_id_status', 'bookings', ['route_id', 'status'], None),
+    ('ix_bookings_user_id', 'bookings', ['user_id'], None),
+    ('ix_bookings_pickup_location_id', 'bookings', ['pickup_location_id'], None),
+    ('ix_bookings_dropoff_location_id', 'bookings', ['dropoff_location_id'], None),
+    ('ix_vehicles_route_id', 'vehicles', ['route_id'], None),
+    ('ix_vehicles_user_id', 'vehicles', ['user_id'], None),
+    ('ix_school_locations_route_id', 'school_locations', ['route_id'], None),
+]
+
+
+def _drop_invalid(name):
+    # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind,
+    # which IF NOT EXISTS would then skip
+    invalid = op.get_bind().execute(sa.text("""
+        SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid
+        WHERE pg_class.relname = :name AND NOT pg_index.indisvalid
+    """), {'name': name}).scalar()
+    if invalid:
+        op.drop_index(name, postgresql_concurrently=True)
+
+
+def upgrade():
+    postgresql = op.get_bind().dialect.name == 'postgresql'
+
+    # CONCURRENTLY builds without blocking writes to trips and bookings,
+    # but cannot run inside the migration's transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            if postgresql:
+                _drop_invalid(name)
+            op.create_index(
+                name, table, columns,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_where=sa.text(where) if where else None,
+                sqlite_where=sa.text(where) if where else None,
+            )
+        if postgresql:
+            # Fresh statistics so the planner picks the new indexes right away
+            op.execute('ANALYZE trips')
+            op.execute('ANALYZE bookings')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
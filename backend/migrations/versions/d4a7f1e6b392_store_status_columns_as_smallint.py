@@ -0,0 +1,92 @@
+"""store status columns as smallint
+
+Revision ID: d4a7f1e6b392
+Revises: b81e4c2f9d07
+Create Date: 2026-10-19 16:27:51.093842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7f1e6b392'
+down_revision = 'b81e4c2f9d07'
+branch_labels = None
+depends_on = None
+
+
+# Frozen copies of the enums in models.py at this revision
+BOOKING_STATUS = {'active': 1, 'completed': 2, 'cancelled': 3}
+SERVICE_TYPE = {'morning': 1, 'evening': 2, 'both': 3}
+SERVICE_TIME = {'morning': 1, 'evening': 2}
+TRIP_STATUS = {'scheduled': 1, 'picked_up': 2, 'completed': 3, 'cancelled': 4}
+
+# table, column, codes, previous VARCHAR length
+COLUMNS = [
+    ('bookings', 'status', BOOKING_STATUS, 50),
+    ('bookings', 'service_type', SERVICE_TYPE, 50),
+    ('trips', 'service_time', SERVICE_TIME, 20),
+    ('trips', 'status', TRIP_STATUS, 50),
+]
+
+OPEN_TRIP_INDEX = ('ix_trips_open_trip_date', 'trips', ['trip_date', 'service_time', 'booking_id'])
+
+
+def _to_codes(column, codes):
+    # Unknown values become NULL and fail the NOT NULL check, stopping the migration
+    whens = ' '.join(f"WHEN '{name}' THEN {code}" for name, code in codes.items())
+    return f'CASE {column} {whens} END'
+
+
+def _to_names(column, codes):
+    whens = ' '.join(f"WHEN {code} THEN '{name}'" for name, code in codes.items())
+    return f'CASE {column} {whens} END'
+
+
+def _convert(convert, column_type):
+    """Rewrite every column with convert(column, codes) and change it to column_type(length)"""
+    dialect = op.get_bind().dialect
+    if dialect.name == 'postgresql':
+        # One ALTER per table, so each table is rewritten once
+        for table in ('bookings', 'trips'):
+            changes = ', '.join(
+                f'ALTER COLUMN {column} TYPE {column_type(length).compile(dialect=dialect)} '
+                f'USING {convert(column, codes)}'
+                for table_name, column, codes, length in COLUMNS if table_name == table
+            )
+            op.execute(f'ALTER TABLE {table} {changes}')
+        return
+
+    for table, column, codes, length in COLUMNS:
+        op.execute(f'UPDATE {table} SET {column} = {convert(column, codes)}')
+    for table in ('bookings', 'trips'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for table_name, column, codes, length in COLUMNS:
+                if table_name == table:
+                    batch_op.alter_column(column, type_=column_type(length), existing_nullable=False)
+
+
+def upgrade():
+    # The partial index predicate names statuses, so it is rebuilt with codes.
+    # Both tables are rewritten under an exclusive lock: run this off-hours.
+    name, table, columns = OPEN_TRIP_INDEX
+    op.drop_index(name, table_name=table)
+
+    _convert(_to_codes, lambda length: sa.SmallInteger())
+
+    where = sa.text(f"status IN ({TRIP_STATUS['scheduled']}, {TRIP_STATUS['picked_up']})")
+    op.create_index(name, table, columns, postgresql_where=where, sqlite_where=where)
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ANALYZE trips')
+        op.execute('ANALYZE bookings')
+
+
+def downgrade():
+    name, table, columns = OPEN_TRIP_INDEX
+    op.drop_index(name, table_name=table)
+
+    _convert(_to_names, lambda length: sa.String(length=length))
+
+    where = sa.text("status IN ('scheduled', 'picked_up')")
+    op.create_index(name, table, columns, postgresql_where=where, sqlite_where=where)
@@ -0,0 +1,42 @@
+"""add rate limit buckets
+
+Revision ID: e2b47d90c613
+Revises: c5e91f27ab34
+Create Date: 2026-10-19 12:05:14.372901
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b47d90c613'
+down_revision = 'c5e91f27ab34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Buckets are throwaway state: skip the WAL, losing them on a crash is fine
+        op.execute("""
+            CREATE UNLOGGED TABLE rate_limit_buckets (
+                key VARCHAR(255) NOT NULL PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL,
+                allowed BOOLEAN NOT NULL
+            )
+        """)
+        return
+
+    op.create_table('rate_limit_buckets',
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.Float(), nullable=False),
+    sa.Column('allowed', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_buckets')
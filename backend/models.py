@@ -1,7 +1,73 @@
+import enum
+
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, date
 
-db = SQLAlchemy()
+from replica import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+# Codes stored for the status and service columns. Existing codes must never
+# be renumbered; add new members with new numbers (and a migration for any
+# partial index that lists codes).
+
+class BookingStatus(enum.IntEnum):
+    active = 1
+    completed = 2
+    cancelled = 3
+
+
+class ServiceType(enum.IntEnum):
+    morning = 1
+    evening = 2
+    both = 3
+
+
+class ServiceTime(enum.IntEnum):
+    morning = 1
+    evening = 2
+
+
+class TripStatus(enum.IntEnum):
+    scheduled = 1
+    picked_up = 2
+    completed = 3
+    cancelled = 4
+
+
+class CodedEnum(db.TypeDecorator):
+    """
+    An IntEnum stored as SMALLINT. The application keeps reading and writing
+    member names ('scheduled', 'picked_up'), so filters, comparisons and
+    JSON output are unchanged; only the column holds the 2-byte code.
+    """
+    impl = db.SmallInteger
+    cache_ok = True
+
+    def __init__(self, enum_class):
+        super().__init__()
+        self.enum_class = enum_class
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, self.enum_class):
+            return value.value
+        try:
+            return self.enum_class[value].value
+        except KeyError:
+            raise ValueError(f"{value!r} is not a valid {self.enum_class.__name__}")
+
+    def process_literal_param(self, value, dialect):
+        return self.process_bind_param(value, dialect)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else self.enum_class(value).name
+
+
+# Trips a driver still has to act on; partial indexes cover only these rows
+OPEN_TRIP = f"status IN ({TripStatus.scheduled.value}, {TripStatus.picked_up.value})"
 
 
 class UserRole(db.Model):
@@ -79,6 +145,9 @@ class Route(db.Model):
 
 class SchoolLocation(db.Model):
     __tablename__ = 'school_locations'
+    __table_args__ = (
+        db.Index('ix_school_locations_route_id', 'route_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
@@ -96,11 +165,17 @@ class SchoolLocation(db.Model):
 
 class PickupLocation(db.Model):
     __tablename__ = 'pickup_locations'
+    __table_args__ = (
+        db.Index('ix_pickup_locations_route_id_grid_cell', 'route_id', 'grid_cell'),
+        db.UniqueConstraint('route_id', 'name', name='uq_pickup_locations_route_id_name'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
     gps_coordinates = db.Column(db.String(250), nullable=False)
+    # Spatial hash of gps_coordinates, see pickup_dedupe.grid_cell
+    grid_cell = db.Column(db.String(40))
 
     # Relationships
     route = db.relationship('Route', back_populates='pickup_locations')
@@ -113,6 +188,10 @@ class PickupLocation(db.Model):
 
 class Vehicle(db.Model):
     __tablename__ = 'vehicles'
+    __table_args__ = (
+        db.Index('ix_vehicles_route_id', 'route_id'),
+        db.Index('ix_vehicles_user_id', 'user_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
@@ -128,6 +207,12 @@ class Vehicle(db.Model):
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        db.Index('ix_bookings_route_id_status', 'route_id', 'status'),
+        db.Index('ix_bookings_user_id', 'user_id'),
+        db.Index('ix_bookings_pickup_location_id', 'pickup_location_id'),
+        db.Index('ix_bookings_dropoff_location_id', 'dropoff_location_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     route_id = db.Column(db.Integer, db.ForeignKey('routes.id'), nullable=False)
@@ -148,9 +233,9 @@ class Booking(db.Model):
         nullable=False
     )
 
-    status = db.Column(db.String(50), nullable=False)
+    status = db.Column(CodedEnum(BookingStatus), nullable=False)
     seats_booked = db.Column(db.Integer, nullable=False, default=1)
-    service_type = db.Column(db.String(50), nullable=False)
+    service_type = db.Column(CodedEnum(ServiceType), nullable=False)
     days_of_week = db.Column(db.String(100), nullable=False)
 
     # Relationships
@@ -175,12 +260,21 @@ class Booking(db.Model):
 
 class Trip(db.Model):
     __tablename__ = 'trips'
+    __table_args__ = (
+        # TripToday: today's open trips for one run, joined to bookings on the route
+        db.Index(
+            'ix_trips_open_trip_date', 'trip_date', 'service_time', 'booking_id',
+            postgresql_where=db.text(OPEN_TRIP), sqlite_where=db.text(OPEN_TRIP)
+        ),
+        # A booking's trips, and validate_booking_capacity's date range per booking
+        db.Index('ix_trips_booking_id_trip_date', 'booking_id', 'trip_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
 
-    service_time = db.Column(db.String(20), nullable=False)
-    status = db.Column(db.String(50), nullable=False)
+    service_time = db.Column(CodedEnum(ServiceTime), nullable=False)
+    status = db.Column(CodedEnum(TripStatus), nullable=False)
     trip_date = db.Column(db.Date, nullable=False)
 
     pickup_time = db.Column(db.Time)
@@ -189,4 +283,30 @@ class Trip(db.Model):
     driver_notes = db.Column(db.Text)
 
     # Relationships
-    booking = db.relationship('Booking', back_populates='trips')
\ No newline at end of file
+    booking = db.relationship('Booking', back_populates='trips')
+
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_tokens'
+
+    jti = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+class RateLimitBucket(db.Model):
+    __tablename__ = 'rate_limit_buckets'
+
+    key = db.Column(db.String(255), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    # Seconds since the epoch, on the database clock
+    updated_at = db.Column(db.Float, nullable=False)
+    allowed = db.Column(db.Boolean, nullable=False)
+
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
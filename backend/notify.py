@@ -0,0 +1,133 @@
+import logging
+import os
+import select
+import threading
+import time
+
+from sqlalchemy import text
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keepalive checks while no notification arrives
+POLL_TIMEOUT = 5
+RECONNECT_DELAY_MAX = 30
+
+
+class Listener:
+    """
+    One background thread per worker process holding a dedicated Postgres
+    connection that LISTENs on the subscribed channels and hands each
+    NOTIFY payload to its callbacks. Subscribe before start(); reconnect
+    callbacks run after every (re)connect, since notifications sent while
+    disconnected are lost.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.channels = {}
+        self.reconnect_callbacks = []
+        self.thread = None
+        self.pid = None
+        self.connected = threading.Event()
+
+    def subscribe(self, channel, callback):
+        self.channels.setdefault(channel, []).append(callback)
+
+    def on_reconnect(self, callback):
+        self.reconnect_callbacks.append(callback)
+
+    def dsn(self):
+        url = self.app.config.get('LISTEN_DATABASE_URL') or self.app.config['SQLALCHEMY_DATABASE_URI']
+        return url.replace('postgresql+psycopg2://', 'postgresql://', 1)
+
+    def ensure_started(self):
+        # Threads do not survive fork, so each worker starts its own
+        if self.pid == os.getpid() or not self.channels:
+            return
+        if not self.dsn().startswith('postgresql'):
+            return
+        self.pid = os.getpid()
+        if self.app.config.get('PGBOUNCER_TRANSACTION_MODE') and not self.app.config.get('LISTEN_DATABASE_URL'):
+            # LISTEN through transaction pooling would subscribe a server
+            # connection that is then handed to other clients; poll instead
+            logger.warning('PGBOUNCER_TRANSACTION_MODE without LISTEN_DATABASE_URL: not listening for notifications')
+            return
+        self.connected.clear()
+        self.thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        delay = 1
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn())
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    for channel in self.channels:
+                        cursor.execute(f'LISTEN "{channel}"')
+
+                self._dispatch_reconnect()
+                self.connected.set()
+                delay = 1
+
+                while True:
+                    if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                        with conn.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        self._dispatch(notification.channel, notification.payload)
+
+            except Exception:
+                logger.exception('Postgres listener disconnected, retrying in %ss', delay)
+                self.connected.clear()
+                time.sleep(delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _dispatch(self, channel, payload):
+        for callback in self.channels.get(channel, ()):
+            try:
+                with self.app.app_context():
+                    callback(payload)
+            except Exception:
+                logger.exception('Listener callback for %s failed', channel)
+
+    def _dispatch_reconnect(self):
+        for callback in self.reconnect_callbacks:
+            try:
+                with self.app.app_context():
+                    callback()
+            except Exception:
+                logger.exception('Listener reconnect callback failed')
+
+
+def supports_notify(engine):
+    return engine.dialect.name == 'postgresql'
+
+
+def publish(session, channel, payload):
+    """
+    Queue a NOTIFY on the session's transaction. Postgres delivers it only
+    if and when the transaction commits.
+    """
+    if supports_notify(session.get_bind()):
+        session.execute(text('SELECT pg_notify(:channel, :payload)'), {'channel': channel, 'payload': payload})
+
+
+def init_app(app):
+    app.config.setdefault('LISTEN_DATABASE_URL', os.getenv('LISTEN_DATABASE_URL'))
+    app.extensions['pg_listener'] = Listener(app)
+
+
+def get_listener(app):
+    return app.extensions['pg_listener']
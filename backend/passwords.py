@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+from metrics import PASSWORD_HASH_SECONDS
+import green
+
+
+# PBKDF2 is deliberately slow. Running it inline holds a gunicorn worker (and
+# the GIL) for the whole computation, so hashes are computed in a small
+# process pool instead. The pool is bounded: once every worker is busy and
+# the queue is full, callers get a 503 rather than piling up behind it.
+
+_pool = None
+_pool_pid = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashPoolBusy(ServiceUnavailable):
+    description = "Too many sign-in requests right now, please try again shortly"
+
+    def __init__(self):
+        super().__init__(retry_after=1)
+
+
+def init_app(app):
+    # Any werkzeug method string, cost parameters included,
+    # e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1"
+    app.config.setdefault(
+        "PASSWORD_HASH_METHOD", os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+    )
+    # Used for generated temporary passwords in bulk onboarding. They carry
+    # 96 random bits, so key stretching adds nothing and a cheap hash is safe;
+    # needs_rehash() upgrades them to PASSWORD_HASH_METHOD on first login.
+    app.config.setdefault(
+        "BULK_PASSWORD_HASH_METHOD", os.getenv("BULK_PASSWORD_HASH_METHOD", "pbkdf2:sha256:1000")
+    )
+    app.config.setdefault(
+        "PASSWORD_HASH_WORKERS", int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+    )
+    # Requests allowed to wait for a free worker on top of the ones running
+    app.config.setdefault(
+        "PASSWORD_HASH_QUEUE", int(os.getenv("PASSWORD_HASH_QUEUE", "16"))
+    )
+    app.config.setdefault(
+        "PASSWORD_HASH_TIMEOUT", float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+    )
+
+
+def _get_pool():
+    global _pool, _pool_pid, _slots
+
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    if workers < 1:
+        return None
+
+    # A pool inherited through fork belongs to the parent process
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                if green.is_patched():
+                    # In a gevent worker, native threads: PBKDF2 and scrypt
+                    # release the GIL, so other greenlets keep running
+                    from gevent.threadpool import ThreadPoolExecutor
+                    _pool = ThreadPoolExecutor(max_workers=workers)
+                else:
+                    _pool = ProcessPoolExecutor(max_workers=workers)
+                _pool_pid = os.getpid()
+                _slots = threading.BoundedSemaphore(workers + current_app.config['PASSWORD_HASH_QUEUE'])
+    return _pool
+
+
+def _run(operation, fn, *args):
+    started = time.perf_counter()
+    pool = _get_pool()
+
+    try:
+        if pool is None:
+            return fn(*args)
+
+        timeout = current_app.config['PASSWORD_HASH_TIMEOUT']
+        if not _slots.acquire(timeout=timeout):
+            raise HashPoolBusy()
+        try:
+            return pool.submit(fn, *args).result(timeout=timeout)
+        except TimeoutError:
+            raise HashPoolBusy()
+        finally:
+            _slots.release()
+    finally:
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+
+def hash_password(password, method=None):
+    return _run('hash', generate_password_hash, password, method or current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def _hash_many(passwords, method):
+    return [generate_password_hash(password, method) for password in passwords]
+
+
+def hash_passwords(passwords, method=None):
+    """
+    Hash a list of passwords across every pool worker at once. Returns the
+    hashes in the same order. Bulk jobs bypass the per-request queue limit
+    since they are admin-only and already run in one request.
+    """
+    method = method or current_app.config['PASSWORD_HASH_METHOD']
+    passwords = list(passwords)
+    started = time.perf_counter()
+    pool = _get_pool()
+
+    try:
+        if pool is None or len(passwords) < 2:
+            return _hash_many(passwords, method)
+
+        workers = current_app.config['PASSWORD_HASH_WORKERS']
+        chunk_size = max(1, len(passwords) // (workers * 4))
+        chunks = [passwords[i:i + chunk_size] for i in range(0, len(passwords), chunk_size)]
+
+        hashes = []
+        for chunk_hashes in pool.map(_hash_many, chunks, [method] * len(chunks)):
+            hashes.extend(chunk_hashes)
+        return hashes
+    finally:
+        PASSWORD_HASH_SECONDS.labels('bulk_hash').observe(time.perf_counter() - started)
+
+
+def verify_password(password_hash, password):
+    return _run('verify', check_password_hash, password_hash, password)
+
+
+def _method_params(method):
+    """
+    A werkzeug method string with werkzeug's defaults filled in, so that
+    "pbkdf2", "pbkdf2:sha256" and the prefix of a hash made with either
+    compare equal
+    """
+    name, *params = method.strip().lower().split(':')
+    if name == 'pbkdf2':
+        hash_name = params[0] if params else 'sha256'
+        iterations = int(params[1]) if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return name, hash_name, iterations
+    if name == 'scrypt':
+        n, r, p = [int(value) for value in params] + [2 ** 15, 8, 1][len(params):]
+        return name, n, r, p
+    return (name, *params)
+
+
+def needs_rehash(password_hash):
+    """
+    True when the stored hash was made with different parameters than the
+    ones currently configured, e.g. after PASSWORD_HASH_METHOD changes
+    """
+    try:
+        stored = _method_params(password_hash.split('$', 1)[0])
+    except ValueError:
+        return True
+    return stored != _method_params(current_app.config['PASSWORD_HASH_METHOD'])
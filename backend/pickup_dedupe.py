@@ -0,0 +1,259 @@
+import math
+import re
+from difflib import SequenceMatcher
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, PickupLocation, Booking
+
+
+# Size of the grid cell stored on pickup_locations.grid_cell. Inline duplicate
+# checks look at the block of cells within the radius of a new stop: 3x3 up to
+# GRID_CELL_M, and wider (more cells in the IN list) for larger radii.
+GRID_CELL_M = 50
+DEFAULT_RADIUS_M = 50
+DEFAULT_NAME_SIMILARITY = 0.6
+
+METRES_PER_DEGREE = 111320.0
+EARTH_RADIUS_M = 6371000.0
+
+NAME_ABBREVIATIONS = {
+    'stn': 'station',
+    'st': 'street',
+    'rd': 'road',
+    'ave': 'avenue',
+    'opp': 'opposite',
+    'sch': 'school',
+}
+
+# Words that describe the kind of stop rather than which stop it is
+GENERIC_NAME_WORDS = {
+    'the', 'at', 'near', 'opposite', 'petrol', 'station', 'stage', 'bus',
+    'stop', 'gate', 'junction', 'road', 'street', 'avenue',
+}
+
+
+def parse_gps(value):
+    """
+    Parse a "lat,lng" string into a (lat, lng) tuple, or None if malformed
+    """
+    if not value or not isinstance(value, str):
+        return None
+
+    parts = value.split(',')
+    if len(parts) != 2:
+        return None
+
+    try:
+        lat, lng = float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+
+    return lat, lng
+
+
+def _cell_xy(lat, lng, cell_size_m):
+    y = math.floor(lat * METRES_PER_DEGREE / cell_size_m)
+    x = math.floor(lng * METRES_PER_DEGREE * math.cos(math.radians(lat)) / cell_size_m)
+    return y, x
+
+
+def grid_cell(gps_coordinates, cell_size_m=GRID_CELL_M):
+    point = parse_gps(gps_coordinates)
+    if not point:
+        return None
+    y, x = _cell_xy(point[0], point[1], cell_size_m)
+    return f"{y}:{x}"
+
+
+def neighbour_cells(point, radius_m=GRID_CELL_M, cell_size_m=GRID_CELL_M):
+    y, x = _cell_xy(point[0], point[1], cell_size_m)
+    reach = max(1, math.ceil(radius_m / cell_size_m))
+    offsets = range(-reach, reach + 1)
+    return [f"{y + dy}:{x + dx}" for dy in offsets for dx in offsets]
+
+
+def distance_m(a, b):
+    lat1, lng1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lng2 = math.radians(b[0]), math.radians(b[1])
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
+
+
+def normalize_name(name):
+    words = re.findall(r'[a-z0-9]+', (name or '').lower())
+    words = [NAME_ABBREVIATIONS.get(w, w) for w in words]
+    significant = [w for w in words if w not in GENERIC_NAME_WORDS]
+    return ' '.join(significant or words)
+
+
+def name_similarity(a, b):
+    a, b = normalize_name(a), normalize_name(b)
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+
+    ratio = SequenceMatcher(None, a, b).ratio()
+    tokens_a, tokens_b = set(a.split()), set(b.split())
+    overlap = len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+    return max(ratio, overlap)
+
+
+def is_near_duplicate(point_a, name_a, point_b, name_b,
+                      radius_m=DEFAULT_RADIUS_M, min_similarity=DEFAULT_NAME_SIMILARITY):
+    if distance_m(point_a, point_b) > radius_m:
+        return False
+    return name_similarity(name_a, name_b) >= min_similarity
+
+
+class GridIndex:
+    """
+    In-memory spatial hash of pickup locations, keyed by (route_id, cell).
+    Used by the dedupe job and by bulk uploads so each row is checked against
+    a constant number of neighbours instead of every stop on the route.
+    """
+
+    def __init__(self, radius_m=DEFAULT_RADIUS_M, min_similarity=DEFAULT_NAME_SIMILARITY):
+        self.radius_m = radius_m
+        self.min_similarity = min_similarity
+        self.cells = {}
+
+    def add(self, route_id, name, point, item):
+        y, x = _cell_xy(point[0], point[1], self.radius_m)
+        self.cells.setdefault((route_id, y, x), []).append((name, point, item))
+
+    def find(self, route_id, name, point):
+        y, x = _cell_xy(point[0], point[1], self.radius_m)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for other_name, other_point, item in self.cells.get((route_id, y + dy, x + dx), ()):
+                    if is_near_duplicate(point, name, other_point, other_name,
+                                         self.radius_m, self.min_similarity):
+                        return item
+        return None
+
+
+def find_near_duplicate(route_id, name, gps_coordinates, exclude_id=None,
+                        radius_m=DEFAULT_RADIUS_M, min_similarity=DEFAULT_NAME_SIMILARITY):
+    """
+    Look up an existing stop on the route that is close enough and named
+    similarly enough to be the same place. Uses the (route_id, grid_cell)
+    index, so the cost does not depend on how many stops the route has.
+    """
+    point = parse_gps(gps_coordinates)
+    if not point:
+        return None
+
+    query = PickupLocation.query.filter(
+        PickupLocation.route_id == route_id,
+        PickupLocation.grid_cell.in_(neighbour_cells(point, radius_m))
+    )
+    if exclude_id is not None:
+        query = query.filter(PickupLocation.id != exclude_id)
+
+    for candidate in query.all():
+        candidate_point = parse_gps(candidate.gps_coordinates)
+        if candidate_point and is_near_duplicate(point, name, candidate_point, candidate.name,
+                                                 radius_m, min_similarity):
+            return candidate
+    return None
+
+
+def find_duplicate_clusters(route_id=None, radius_m=DEFAULT_RADIUS_M,
+                            min_similarity=DEFAULT_NAME_SIMILARITY):
+    """
+    Group near-duplicate pickup locations into clusters. Each stop is only
+    compared with stops in neighbouring grid cells on the same route.
+    """
+    query = PickupLocation.query
+    if route_id:
+        query = query.filter_by(route_id=route_id)
+    locations = query.order_by(PickupLocation.id).all()
+
+    parent = {}
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    cells = {}
+    for location in locations:
+        point = parse_gps(location.gps_coordinates)
+        if not point:
+            continue
+        parent[location.id] = location.id
+
+        y, x = _cell_xy(point[0], point[1], radius_m)
+        for dy in (-1, 0, 1):
+            for dx in (-1, 0, 1):
+                for other, other_point in cells.get((location.route_id, y + dy, x + dx), ()):
+                    if is_near_duplicate(point, location.name, other_point, other.name,
+                                         radius_m, min_similarity):
+                        parent[find(location.id)] = find(other.id)
+
+        cells.setdefault((location.route_id, y, x), []).append((location, point))
+
+    clusters = {}
+    by_id = {location.id: location for location in locations}
+    for location_id in parent:
+        clusters.setdefault(find(location_id), []).append(by_id[location_id])
+
+    return [members for members in clusters.values() if len(members) > 1]
+
+
+def merge_pickup_locations(target, sources):
+    """
+    Repoint every booking from the source stops to the target in one UPDATE
+    and delete the sources. Returns the number of bookings moved.
+    The caller commits.
+    """
+    source_ids = [source.id for source in sources]
+    if not source_ids:
+        return 0
+
+    moved = Booking.query.filter(
+        Booking.pickup_location_id.in_(source_ids)
+    ).update({'pickup_location_id': target.id}, synchronize_session=False)
+
+    PickupLocation.query.filter(
+        PickupLocation.id.in_(source_ids)
+    ).delete(synchronize_session=False)
+
+    return moved
+
+
+@click.command('dedupe-pickups')
+@click.option('--route-id', type=int, default=None, help='Only check one route.')
+@click.option('--radius', type=float, default=DEFAULT_RADIUS_M, help='Cluster radius in metres.')
+@click.option('--similarity', type=float, default=DEFAULT_NAME_SIMILARITY, help='Minimum name similarity (0-1).')
+@click.option('--merge', is_flag=True, help='Merge each cluster into the stop with the most bookings.')
+@with_appcontext
+def dedupe_pickups_command(route_id, radius, similarity, merge):
+    """Find (and optionally merge) near-duplicate pickup locations."""
+    clusters = find_duplicate_clusters(route_id, radius, similarity)
+
+    for cluster in clusters:
+        cluster.sort(key=lambda location: (-len(location.bookings), location.id))
+        target, sources = cluster[0], cluster[1:]
+        click.echo(
+            f"route {target.route_id}: keep #{target.id} {target.name!r}, "
+            f"duplicates {[(s.id, s.name) for s in sources]}"
+        )
+        if merge:
+            moved = merge_pickup_locations(target, sources)
+            click.echo(f"  merged, {moved} bookings moved")
+
+    if merge:
+        db.session.commit()
+
+    click.echo(f"{len(clusters)} duplicate clusters found")
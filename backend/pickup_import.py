@@ -0,0 +1,278 @@
+import csv
+import io
+
+from sqlalchemy import insert, text, tuple_, update
+
+from models import db, PickupLocation, Route
+from pickup_dedupe import GridIndex, grid_cell, parse_gps
+from http_cache import touch
+import green
+
+
+NAME_MAX_LENGTH = 100
+GPS_MAX_LENGTH = 250
+
+# Rows per round trip when the database has no COPY (SQLite in development)
+BATCH_SIZE = 5000
+
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE pickup_import (
+        row_no integer NOT NULL,
+        route_id integer NOT NULL,
+        name varchar(100) NOT NULL,
+        gps_coordinates varchar(250) NOT NULL,
+        grid_cell varchar(40)
+    ) ON COMMIT DROP
+"""
+
+UPSERT_SQL = """
+    WITH upserted AS (
+        INSERT INTO pickup_locations (route_id, name, gps_coordinates, grid_cell)
+        SELECT route_id, name, gps_coordinates, grid_cell FROM pickup_import
+        ON CONFLICT (route_id, name) DO UPDATE
+            SET gps_coordinates = EXCLUDED.gps_coordinates,
+                grid_cell = EXCLUDED.grid_cell
+        RETURNING id, route_id, name, (xmax = 0) AS inserted
+    )
+    SELECT i.row_no, u.id, u.inserted
+    FROM upserted u
+    JOIN pickup_import i ON i.route_id = u.route_id AND i.name = u.name
+    ORDER BY i.row_no
+"""
+
+
+class PickupImport:
+    """
+    Validate uploaded pickup location rows and upsert them by (route_id, name).
+    Rows are validated as they are streamed in; only the per-row report and
+    the names already seen are kept in memory.
+    """
+
+    def __init__(self, radius_m, check_duplicates=True, full_report=False):
+        self.check_duplicates = check_duplicates
+        self.full_report = full_report
+        self.index = GridIndex(radius_m=radius_m)
+        self.route_ids = {route_id for (route_id,) in db.session.query(Route.id)}
+        self.indexed_routes = set()
+        # (route_id, name) of the stops already in the database
+        self.existing = set()
+        self.seen = {}
+
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped_rows = []
+        self.rows = []
+
+    def skip(self, row_no, row, reason):
+        self.skipped_rows.append({
+            'row': row_no,
+            'name': row.get('name') if isinstance(row, dict) else None,
+            'reason': reason
+        })
+
+    def _index_route(self, route_id):
+        if route_id in self.indexed_routes:
+            return
+        self.indexed_routes.add(route_id)
+        locations = PickupLocation.query.filter_by(route_id=route_id).with_entities(
+            PickupLocation.name, PickupLocation.gps_coordinates
+        )
+        for name, gps_coordinates in locations:
+            self.existing.add((route_id, name))
+            point = parse_gps(gps_coordinates)
+            if point:
+                self.index.add(route_id, name, point, name)
+
+    def validate(self, rows):
+        """
+        Yield clean (row_no, route_id, name, gps_coordinates, grid_cell)
+        tuples and record a reason for every row that is skipped.
+        """
+        for row_no, row in rows:
+            self.received += 1
+
+            if row is None:
+                self.skip(row_no, row, 'Malformed row')
+                continue
+
+            name, gps_coordinates = row.get('name'), row.get('gps_coordinates')
+            # JSON rows can carry numbers or objects where text is expected
+            if not isinstance(name, (str, type(None))):
+                self.skip(row_no, row, 'name must be text')
+                continue
+            if not isinstance(gps_coordinates, (str, type(None))):
+                self.skip(row_no, row, 'gps_coordinates must be text like "lat,lng"')
+                continue
+            name = (name or '').strip()
+            gps_coordinates = (gps_coordinates or '').strip()
+
+            if not name:
+                self.skip(row_no, row, 'Missing required field: name')
+                continue
+            if not gps_coordinates:
+                self.skip(row_no, row, 'Missing required field: gps_coordinates')
+                continue
+            if len(name) > NAME_MAX_LENGTH:
+                self.skip(row_no, row, f'name longer than {NAME_MAX_LENGTH} characters')
+                continue
+            if len(gps_coordinates) > GPS_MAX_LENGTH:
+                self.skip(row_no, row, f'gps_coordinates longer than {GPS_MAX_LENGTH} characters')
+                continue
+
+            point = parse_gps(gps_coordinates)
+            if not point:
+                self.skip(row_no, row, 'Invalid gps_coordinates. Use "lat,lng"')
+                continue
+
+            try:
+                route_id = int(row.get('route_id'))
+            except (TypeError, ValueError):
+                self.skip(row_no, row, 'Missing or invalid route_id')
+                continue
+            if route_id not in self.route_ids:
+                self.skip(row_no, row, 'Route not found')
+                continue
+
+            key = (route_id, name)
+            if key in self.seen:
+                self.skip(row_no, row, f'Duplicate of row {self.seen[key]} in this upload')
+                continue
+
+            if self.check_duplicates:
+                self._index_route(route_id)
+                # An exact name match is an update of that stop, even when
+                # another similarly named stop is nearby
+                if key not in self.existing:
+                    match = self.index.find(route_id, name, point)
+                    if match:
+                        self.skip(row_no, row, f"Near duplicate of '{match}'")
+                        continue
+                    self.index.add(route_id, name, point, name)
+
+            self.seen[key] = row_no
+            yield row_no, route_id, name, gps_coordinates, grid_cell(gps_coordinates)
+
+    def record(self, row_no, location_id, inserted):
+        if inserted:
+            self.inserted += 1
+        else:
+            self.updated += 1
+        if self.full_report:
+            self.rows.append({
+                'row': row_no,
+                'id': location_id,
+                'status': 'inserted' if inserted else 'updated'
+            })
+
+    def run(self, rows):
+        clean_rows = self.validate(rows)
+        if db.engine.dialect.name == 'postgresql' and not green.psycopg2_is_green():
+            self._copy_and_upsert(clean_rows)
+        else:
+            self._batch_upsert(clean_rows)
+
+    def _copy_and_upsert(self, clean_rows):
+        connection = db.session.connection()
+        connection.execute(text(STAGING_TABLE_SQL))
+
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                'COPY pickup_import (row_no, route_id, name, gps_coordinates, grid_cell) '
+                'FROM STDIN WITH (FORMAT csv)',
+                CsvStream(clean_rows)
+            )
+        finally:
+            cursor.close()
+
+        for row_no, location_id, inserted in connection.execute(text(UPSERT_SQL)):
+            self.record(row_no, location_id, inserted)
+        touch(db.session, 'pickup_locations')
+
+    def _batch_upsert(self, clean_rows):
+        batch = []
+        for row in clean_rows:
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                self._upsert_batch(batch)
+                batch = []
+        if batch:
+            self._upsert_batch(batch)
+
+    def _upsert_batch(self, batch):
+        keys = [(route_id, name) for _, route_id, name, _, _ in batch]
+        existing = dict(
+            ((route_id, name), location_id)
+            for location_id, route_id, name in db.session.query(
+                PickupLocation.id, PickupLocation.route_id, PickupLocation.name
+            ).filter(tuple_(PickupLocation.route_id, PickupLocation.name).in_(keys))
+        )
+
+        inserts, inserted_rows, updates = [], [], []
+        for row_no, route_id, name, gps_coordinates, cell in batch:
+            location_id = existing.get((route_id, name))
+            values = {'gps_coordinates': gps_coordinates, 'grid_cell': cell}
+            if location_id is None:
+                inserts.append(dict(values, route_id=route_id, name=name))
+                inserted_rows.append(row_no)
+            else:
+                updates.append(dict(values, id=location_id))
+                self.record(row_no, location_id, False)
+
+        if inserts:
+            result = db.session.execute(
+                insert(PickupLocation).returning(PickupLocation.id, sort_by_parameter_order=True),
+                inserts
+            )
+            for row_no, location_id in zip(inserted_rows, result.scalars()):
+                self.record(row_no, location_id, True)
+
+        if updates:
+            db.session.execute(update(PickupLocation), updates)
+
+    def report(self):
+        report = {
+            'message': f'{self.inserted} pickup locations created, {self.updated} updated, '
+                       f'{len(self.skipped_rows)} skipped',
+            'received': self.received,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': len(self.skipped_rows),
+            'skipped_rows': self.skipped_rows,
+        }
+        if self.full_report:
+            report['rows'] = self.rows
+        return report
+
+
+class CsvStream:
+    """
+    File-like object that renders rows as CSV on demand, so COPY reads
+    straight from the validation generator.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = ''
+
+    def read(self, size=-1):
+        while self.rows is not None and (size < 0 or len(self.pending) < size):
+            row = next(self.rows, None)
+            if row is None:
+                self.rows = None
+                break
+            self.writer.writerow(row)
+            self.pending += self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate()
+
+        if size < 0:
+            size = len(self.pending)
+        chunk, self.pending = self.pending[:size], self.pending[size:]
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
@@ -0,0 +1,79 @@
+import os
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import TimedQueuePool
+
+
+# Every gunicorn worker has its own pool per bind, so Postgres sees up to
+#
+#     workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)   (+ the same again for a replica)
+#     + workers                                    (one LISTEN connection each)
+#
+# connections. Keep that under max_connections, or put PgBouncer in front.
+#
+# PgBouncer in transaction mode hands the server connection to another client
+# after every transaction, so nothing may outlive one: no SET (SET LOCAL is
+# fine), LISTEN, session advisory locks, WITH HOLD cursors or prepared
+# statements. psycopg2 never prepares; psycopg 3 is told not to. LISTEN needs
+# a direct connection (LISTEN_DATABASE_URL), and migrations should run against
+# the server directly as well.
+
+# Statements that leave state on the server connection after their transaction
+SESSION_STATE = re.compile(
+    r'^\s*(SET\s+(?!LOCAL\b)|RESET\b|LISTEN\b|UNLISTEN\b|PREPARE\b|DISCARD\b|LOAD\b)'
+    r'|\bpg_advisory_(?:un)?lock(?:_shared)?\s*\(|\bWITH\s+HOLD\b',
+    re.I
+)
+
+
+def _reject_session_state(conn, cursor, statement, parameters, context, executemany):
+    if SESSION_STATE.search(statement):
+        raise RuntimeError(
+            'Session-level statement not allowed with PGBOUNCER_TRANSACTION_MODE: ' + statement[:200]
+        )
+
+
+def engine_options(config, url):
+    """SQLALCHEMY_ENGINE_OPTIONS for a Postgres URL"""
+    options = {
+        # Records checkout wait in minitrack_db_pool_checkout_seconds
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'connect_args': {'connect_timeout': config['DB_CONNECT_TIMEOUT']},
+    }
+    if config['PGBOUNCER_TRANSACTION_MODE'] and url.startswith('postgresql+psycopg:'):
+        options['connect_args']['prepare_threshold'] = None
+    return options
+
+
+def init_app(app):
+    app.config.setdefault('DB_POOL_SIZE', int(os.getenv('DB_POOL_SIZE', '5')))
+    app.config.setdefault('DB_MAX_OVERFLOW', int(os.getenv('DB_MAX_OVERFLOW', '10')))
+    # Seconds to wait for a free connection before failing the request
+    app.config.setdefault('DB_POOL_TIMEOUT', float(os.getenv('DB_POOL_TIMEOUT', '10')))
+    # Replace connections older than this, before a proxy or the server drops them
+    app.config.setdefault('DB_POOL_RECYCLE', int(os.getenv('DB_POOL_RECYCLE', '1800')))
+    app.config.setdefault(
+        'DB_POOL_PRE_PING', os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    )
+    app.config.setdefault('DB_CONNECT_TIMEOUT', int(os.getenv('DB_CONNECT_TIMEOUT', '5')))
+    app.config.setdefault(
+        'PGBOUNCER_TRANSACTION_MODE', os.getenv('PGBOUNCER_TRANSACTION_MODE', 'false').lower() == 'true'
+    )
+
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    if not url.startswith('postgresql'):
+        return
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config, url))
+
+    if app.config['PGBOUNCER_TRANSACTION_MODE'] and not event.contains(
+        Engine, 'before_cursor_execute', _reject_session_state
+    ):
+        event.listen(Engine, 'before_cursor_execute', _reject_session_state)
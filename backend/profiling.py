@@ -0,0 +1,219 @@
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g
+
+from metrics import resource_name
+import green
+
+
+# Opt-in profiling of live requests. A request is profiled when its resource
+# class is in the endpoint list (or the list is empty) and it wins a draw at
+# sample_rate. "sample" mode walks the request thread's stack from a
+# background thread every few milliseconds and writes collapsed stacks
+# (flamegraph.pl / speedscope input); "cprofile" mode writes a pstats file.
+# Settings come from the environment and can be changed at runtime through
+# PATCH /profiles, which stores them in the profile directory so every
+# worker on the host picks them up.
+#
+# In gevent workers every request runs on the worker's one OS thread, and
+# sys._current_frames() only knows OS threads, so "sample" mode would record
+# whichever greenlet happened to be running (or nothing, while a CPU-bound
+# request keeps the sampler from being scheduled). It is not offered there;
+# "cprofile" works, but its files include the other requests the worker
+# switched to while the profiled one waited on I/O.
+
+MODES = ('sample', 'cprofile')
+SETTINGS_FILE = 'settings.json'
+SETTINGS_CHECK_SECONDS = 1
+
+_settings = {'values': None, 'mtime': None, 'checked_at': 0}
+_warned = set()
+
+
+class StackSampler:
+    """Counts the stacks seen in one thread at a fixed interval"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump_stats(self, path):
+        """Write collapsed stacks, one 'frame;frame;frame count' line each"""
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+def available_modes():
+    return tuple(mode for mode in MODES if mode != 'sample') if green.is_patched() else MODES
+
+
+def profile_dir(app):
+    return app.config['PROFILE_DIR']
+
+
+def current_settings(app):
+    """Environment defaults overlaid with any runtime settings from PATCH /profiles"""
+    now = time.monotonic()
+    if _settings['values'] is None or now - _settings['checked_at'] > SETTINGS_CHECK_SECONDS:
+        _settings['checked_at'] = now
+        path = os.path.join(profile_dir(app), SETTINGS_FILE)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+
+        if _settings['values'] is None or mtime != _settings['mtime']:
+            values = {
+                'sample_rate': app.config['PROFILE_SAMPLE_RATE'],
+                'endpoints': app.config['PROFILE_ENDPOINTS'],
+                'mode': app.config['PROFILE_MODE'],
+            }
+            if mtime is not None:
+                with open(path) as f:
+                    values.update(json.load(f))
+            _settings.update(values=values, mtime=mtime)
+
+    return _settings['values']
+
+
+def save_settings(app, values):
+    os.makedirs(profile_dir(app), exist_ok=True)
+    path = os.path.join(profile_dir(app), SETTINGS_FILE)
+    tmp_path = f'{path}.{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(values, f)
+    os.replace(tmp_path, path)
+    _settings['values'] = None
+
+
+def list_profiles(app):
+    directory = profile_dir(app)
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(('.collapsed', '.pstats')):
+            stat = entry.stat()
+            profiles.append({
+                'name': entry.name,
+                'size': stat.st_size,
+                'created_at': datetime.utcfromtimestamp(stat.st_mtime),
+            })
+    profiles.sort(key=lambda profile: profile['created_at'], reverse=True)
+    return profiles
+
+
+def _rotate(app):
+    for profile in list_profiles(app)[app.config['PROFILE_MAX_FILES']:]:
+        try:
+            os.remove(os.path.join(profile_dir(app), profile['name']))
+        except OSError:
+            pass
+
+
+def _should_profile(settings):
+    if not settings['sample_rate']:
+        return False
+    endpoints = settings['endpoints']
+    if endpoints and resource_name() not in endpoints:
+        return False
+    return random.random() < settings['sample_rate']
+
+
+def _start(app):
+    settings = current_settings(app)
+    if not _should_profile(settings):
+        return
+
+    if settings['mode'] not in available_modes():
+        if settings['mode'] not in _warned:
+            _warned.add(settings['mode'])
+            app.logger.warning('PROFILE_MODE=%s is not available in this worker; not profiling', settings['mode'])
+        return
+
+    if settings['mode'] == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL_MS'] / 1000)
+        profiler.start()
+    g.profiler = (profiler, time.perf_counter())
+
+
+def _finish(app, status):
+    profiler, started = g.pop('profiler')
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        extension = 'pstats'
+    else:
+        profiler.stop()
+        extension = 'collapsed'
+
+    os.makedirs(profile_dir(app), exist_ok=True)
+    name = (
+        f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{resource_name()}-{status}"
+        f"-{elapsed_ms:.0f}ms-{os.getpid()}.{extension}"
+    )
+    profiler.dump_stats(os.path.join(profile_dir(app), name))
+    _rotate(app)
+
+
+def init_app(app):
+    app.config.setdefault('PROFILE_DIR', os.getenv('PROFILE_DIR', '/tmp/minitrack-profiles'))
+    # Fraction of matching requests to profile; 0 turns profiling off
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.getenv('PROFILE_SAMPLE_RATE', '0')))
+    # Resource class names to profile, e.g. "TripToday,BookingList"; empty = all
+    app.config.setdefault(
+        'PROFILE_ENDPOINTS', [name for name in os.getenv('PROFILE_ENDPOINTS', '').split(',') if name]
+    )
+    app.config.setdefault('PROFILE_MODE', os.getenv('PROFILE_MODE', 'sample'))
+    app.config.setdefault('PROFILE_INTERVAL_MS', float(os.getenv('PROFILE_INTERVAL_MS', '5')))
+    app.config.setdefault('PROFILE_MAX_FILES', int(os.getenv('PROFILE_MAX_FILES', '200')))
+
+    @app.before_request
+    def start_profiler():
+        _start(app)
+
+    @app.after_request
+    def finish_profiler(response):
+        if 'profiler' in g:
+            _finish(app, response.status_code)
+        return response
+
+    @app.teardown_request
+    def stop_profiler(exc):
+        # after_request is skipped when the view raised
+        if 'profiler' in g:
+            _finish(app, 500)
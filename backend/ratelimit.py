@@ -0,0 +1,219 @@
+import json
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import text
+
+from models import db
+
+
+# Token buckets: each key holds up to `capacity` tokens and refills at
+# capacity / period tokens per second. A request spends one token from every
+# bucket that applies to it (per IP, per user, and for the whole route) and
+# is rejected with 429 if any of them is empty. A rejected request spends
+# nothing, so clients over their own limit can't drain the shared buckets.
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# A bucket left alone for its whole period is full again, the same as one
+# that doesn't exist, so buckets idle for the longest period are dropped.
+# Each process sweeps at most once per PURGE_INTERVAL seconds.
+IDLE_SECONDS = max(PERIODS.values())
+PURGE_INTERVAL = 300
+
+DEFAULT_BUDGETS = {
+    'login': {'ip': '20/minute', 'user': '5/minute'},
+    'signup': {'ip': '10/hour'},
+    'create_admin': {'ip': '5/hour'},
+    'booking_create': {'ip': '60/minute', 'user': '10/minute', 'route': '600/minute'},
+}
+
+# Every bucket of a request in one statement: existing rows are locked (in
+# key order, so concurrent requests can't deadlock), refilled, and only
+# decremented if all of them have a token
+POSTGRES_TAKE_SQL = """
+    WITH clock AS (
+        SELECT EXTRACT(EPOCH FROM clock_timestamp()) AS now
+    ), wanted AS (
+        SELECT * FROM unnest(CAST(:keys AS text[]), CAST(:capacities AS float8[]), CAST(:rates AS float8[]))
+            AS w (key, capacity, rate)
+    ), locked AS (
+        SELECT key, tokens, updated_at FROM rate_limit_buckets
+        WHERE key = ANY(CAST(:keys AS text[]))
+        ORDER BY key
+        FOR UPDATE
+    ), refilled AS (
+        SELECT w.key, LEAST(w.capacity, COALESCE(l.tokens + (clock.now - l.updated_at) * w.rate, w.capacity)) AS tokens
+        FROM wanted w LEFT JOIN locked l ON l.key = w.key CROSS JOIN clock
+    ), verdict AS (
+        SELECT bool_and(tokens >= 1) AS allowed FROM refilled
+    )
+    INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at, allowed)
+    SELECT r.key, CASE WHEN verdict.allowed THEN r.tokens - 1 ELSE r.tokens END, clock.now, r.tokens >= 1
+    FROM refilled r CROSS JOIN verdict CROSS JOIN clock
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = EXCLUDED.tokens,
+        updated_at = EXCLUDED.updated_at,
+        allowed = EXCLUDED.allowed
+    RETURNING key, allowed, tokens
+"""
+
+POSTGRES_PURGE_SQL = """
+    DELETE FROM rate_limit_buckets WHERE updated_at < EXTRACT(EPOCH FROM clock_timestamp()) - :idle
+"""
+
+
+def parse_budget(budget):
+    """'5/minute' -> (capacity, refill rate per second)"""
+    count, period = budget.split('/')
+    capacity = int(count)
+    return capacity, capacity / PERIODS[period.strip()]
+
+
+class MemoryStore:
+    """Buckets in this process only. Fine for one worker or development."""
+
+    def __init__(self):
+        # key -> (tokens, updated_at, time it is full again)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.purged_at = time.monotonic()
+
+    def take(self, buckets):
+        """
+        buckets: [(key, capacity, rate)]. Spends a token from each only if
+        all of them have one; returns [(allowed, tokens)] in the same order.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.purged_at >= PURGE_INTERVAL:
+                self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+                self.purged_at = now
+
+            refilled = []
+            for key, capacity, rate in buckets:
+                tokens, updated_at, _ = self.buckets.get(key, (capacity, now, now))
+                refilled.append(min(capacity, tokens + (now - updated_at) * rate))
+            allowed = all(tokens >= 1 for tokens in refilled)
+
+            results = []
+            for (key, capacity, rate), tokens in zip(buckets, refilled):
+                results.append((tokens >= 1, tokens - 1 if allowed else tokens))
+                remaining = results[-1][1]
+                self.buckets[key] = (remaining, now, now + (capacity - remaining) / rate)
+        return results
+
+
+class PostgresStore:
+    """
+    Buckets in an UNLOGGED Postgres table, shared by every worker. Each
+    request's check is a single statement on its own short autocommit
+    connection, so it never joins (or waits on) the request's transaction.
+    """
+
+    def __init__(self):
+        self.purged_at = time.monotonic()
+
+    def take(self, buckets):
+        params = {
+            'keys': [key for key, _, _ in buckets],
+            'capacities': [float(capacity) for _, capacity, _ in buckets],
+            'rates': [float(rate) for _, _, rate in buckets],
+        }
+        with db.engine.connect() as conn:
+            rows = {key: (allowed, tokens) for key, allowed, tokens in conn.execute(text(POSTGRES_TAKE_SQL), params)}
+            if time.monotonic() - self.purged_at >= PURGE_INTERVAL:
+                self.purged_at = time.monotonic()
+                conn.execute(text(POSTGRES_PURGE_SQL), {'idle': IDLE_SECONDS})
+            conn.commit()
+        return [rows[key] for key, _, _ in buckets]
+
+
+def _store():
+    store = current_app.extensions.get('ratelimit_store')
+    if store is None:
+        kind = current_app.config['RATELIMIT_STORAGE'] or (
+            'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+        )
+        store = PostgresStore() if kind == 'postgres' else MemoryStore()
+        current_app.extensions['ratelimit_store'] = store
+    return store
+
+
+def _identity_key():
+    try:
+        verify_jwt_in_request(optional=True)
+    except Exception:
+        return None
+    identity = get_jwt_identity()
+    return identity.get('id') if isinstance(identity, dict) else identity
+
+
+def json_field(field):
+    """user_key that buckets on a field of the JSON body, e.g. the login email"""
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(field) if isinstance(data, dict) else None
+        return str(value).strip().lower() if value else None
+    return key
+
+
+def rate_limited(name, user_key=None):
+    """
+    Apply the named budget from RATELIMIT_BUDGETS to a resource method.
+    user_key returns the value to bucket "per user" on, e.g. the email
+    being logged into; it defaults to the id in the caller's JWT.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['RATELIMIT_ENABLED']:
+                return fn(*args, **kwargs)
+
+            budgets = current_app.config['RATELIMIT_BUDGETS'].get(name, {})
+            keys = {}
+            if 'ip' in budgets:
+                keys['ip'] = request.remote_addr
+            if 'user' in budgets:
+                user = user_key() if user_key else _identity_key()
+                if user is not None:
+                    keys['user'] = user
+            if 'route' in budgets:
+                keys['route'] = '*'
+
+            buckets = [(f"{name}:{scope}:{value}", *parse_budget(budgets[scope])) for scope, value in keys.items()]
+            retry_after = 0
+            for (_, _, rate), (allowed, tokens) in zip(buckets, _store().take(buckets) if buckets else []):
+                if not allowed:
+                    retry_after = max(retry_after, (1 - tokens) / rate)
+
+            if retry_after:
+                return (
+                    {"error": "Too many requests, please try again later"},
+                    429,
+                    {"Retry-After": str(math.ceil(retry_after))}
+                )
+
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    app.config.setdefault(
+        'RATELIMIT_ENABLED', os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    )
+    # "memory" or "postgres"; unset means postgres whenever the database is
+    # Postgres, so limits are shared by every gunicorn worker
+    app.config.setdefault('RATELIMIT_STORAGE', os.getenv('RATELIMIT_STORAGE') or None)
+
+    # JSON overrides per endpoint, e.g. {"login": {"ip": "50/minute"}}
+    budgets = {name: dict(budget) for name, budget in DEFAULT_BUDGETS.items()}
+    for name, budget in json.loads(os.getenv('RATELIMIT_BUDGETS') or '{}').items():
+        budgets.setdefault(name, {}).update(budget)
+    app.config.setdefault('RATELIMIT_BUDGETS', budgets)
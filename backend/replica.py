@@ -0,0 +1,193 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+
+from metrics import REPLICA_READS, REPLICA_LAG_SECONDS
+
+
+# With DATABASE_REPLICA_URL set, GETs on resources marked
+#
+#     class VehicleList(Resource):
+#         read_replica = True
+#
+# run their SELECTs on the replica bind. A request stays on the primary if
+# its client wrote within REPLICA_STICKY_SECONDS (every successful write sets
+# a cookie, so clients read their own writes), or if the replica's lag at the
+# last check was over REPLICA_MAX_LAG_SECONDS or could not be measured.
+# Writes, SELECT ... FOR UPDATE and any read after the session has written in
+# this request always use the primary.
+#
+# Don't mark endpoints wrapped in http_cache.conditional: their ETags come
+# from the primary's table versions, and a body read from a replica that is
+# behind would be cached under the newer ETag.
+logger = logging.getLogger(__name__)
+
+BIND_KEY = 'replica'
+STICKY_COOKIE = 'minitrack_primary_until'
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 0 when the standby has replayed everything it received (an idle primary
+# commits nothing, so the last replay timestamp ages without any real lag),
+# and 0 on a server that is not a standby at all
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_lag = {'seconds': None, 'checked_at': float('-inf')}
+_lag_lock = threading.Lock()
+
+
+class RoutingSession(Session):
+    """db.session: sends the reads of replica-routed requests to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[BIND_KEY]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        return (
+            has_app_context()
+            and g.get('read_replica', False)
+            and not self._flushing
+            and not self.info.get('replica_pinned')
+            and getattr(clause, 'is_select', False)
+            and getattr(clause, '_for_update_arg', None) is None
+        )
+
+
+# Once the session has changed rows, the rest of the request reads them back
+# from the primary. Bulk updates that matched nothing (BookingList's
+# completion sweep, most of the time) don't count.
+
+@event.listens_for(OrmSession, 'after_flush')
+def _pin_after_flush(session, flush_context):
+    session.info['replica_pinned'] = True
+
+
+# Covers both Query.update() and session.execute(update(...)); the legacy
+# after_bulk_update event only fires for the former.
+@event.listens_for(OrmSession, 'do_orm_execute')
+def _pin_after_bulk(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    result = orm_execute_state.invoke_statement()
+    # Bulk UPDATE by primary key (a list of parameter sets) has no rowcount
+    if getattr(result, 'rowcount', True):
+        orm_execute_state.session.info['replica_pinned'] = True
+    return result
+
+
+@contextmanager
+def on_primary():
+    """
+    Run this block's reads on the primary even in a replica-routed request,
+    for state that must never go backwards (e.g. revocations loaded since a
+    timestamp)
+    """
+    routed = has_app_context() and g.get('read_replica', False)
+    if routed:
+        g.read_replica = False
+    try:
+        yield
+    finally:
+        if routed:
+            g.read_replica = True
+
+
+def _measure_lag():
+    engine = current_app.extensions['sqlalchemy'].engines[BIND_KEY]
+    try:
+        with engine.connect() as conn:
+            if conn.dialect.name != 'postgresql':
+                # A second SQLite file for local testing never falls behind
+                conn.exec_driver_sql('SELECT 1')
+                return 0.0
+            return float(conn.execute(text(POSTGRES_LAG_SQL)).scalar())
+    except Exception as error:
+        # Once per outage rather than on every check
+        if _lag['seconds'] is not None or _lag['checked_at'] == float('-inf'):
+            logger.warning('Read replica unavailable, reading from the primary: %s', error)
+        return None
+
+
+def replica_lag():
+    """
+    Seconds the replica is behind, or None if it could not be reached.
+    Measured at most once per REPLICA_LAG_CHECK_SECONDS per worker; requests
+    arriving while another thread measures use the previous value.
+    """
+    interval = current_app.config['REPLICA_LAG_CHECK_SECONDS']
+    if time.monotonic() - _lag['checked_at'] >= interval and _lag_lock.acquire(blocking=False):
+        try:
+            if time.monotonic() - _lag['checked_at'] >= interval:
+                _lag['seconds'] = _measure_lag()
+                _lag['checked_at'] = time.monotonic()
+                if _lag['seconds'] is not None:
+                    REPLICA_LAG_SECONDS.set(_lag['seconds'])
+        finally:
+            _lag_lock.release()
+    return _lag['seconds']
+
+
+def _sticky_until():
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def init_app(app):
+    # Unset: everything uses DATABASE_URL
+    app.config.setdefault('DATABASE_REPLICA_URL', os.getenv('DATABASE_REPLICA_URL'))
+    # How long a client reads from the primary after a write. Keep it above
+    # REPLICA_MAX_LAG_SECONDS + REPLICA_LAG_CHECK_SECONDS, so the write has
+    # reached any replica this worker will still use once the cookie expires.
+    app.config.setdefault('REPLICA_STICKY_SECONDS', float(os.getenv('REPLICA_STICKY_SECONDS', '10')))
+    app.config.setdefault('REPLICA_MAX_LAG_SECONDS', float(os.getenv('REPLICA_MAX_LAG_SECONDS', '5')))
+    app.config.setdefault('REPLICA_LAG_CHECK_SECONDS', float(os.getenv('REPLICA_LAG_CHECK_SECONDS', '1')))
+
+    if not app.config['DATABASE_REPLICA_URL']:
+        return
+    # Before db.init_app, which creates an engine per bind
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[BIND_KEY] = app.config['DATABASE_REPLICA_URL']
+
+    @app.before_request
+    def choose_database():
+        g.read_replica = False
+        if request.method != 'GET':
+            return
+        view_class = getattr(app.view_functions.get(request.endpoint), 'view_class', None)
+        if not getattr(view_class, 'read_replica', False):
+            return
+
+        if _sticky_until() > time.time():
+            REPLICA_READS.labels('sticky').inc()
+            return
+        lag = replica_lag()
+        if lag is None or lag > app.config['REPLICA_MAX_LAG_SECONDS']:
+            REPLICA_READS.labels('lagging').inc()
+            return
+        g.read_replica = True
+        REPLICA_READS.labels('replica').inc()
+
+    @app.after_request
+    def stick_to_primary(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            seconds = app.config['REPLICA_STICKY_SECONDS']
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + seconds) + 1), max_age=int(seconds) + 1,
+                httponly=True, secure=app.config['JWT_COOKIE_SECURE'],
+                samesite=app.config['JWT_COOKIE_SAMESITE']
+            )
+        return response
@@ -0,0 +1,165 @@
+import hashlib
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from cache import TTLCache
+from models import db, RevokedToken
+from replica import on_primary
+import notify
+
+
+# Logged-out tokens are stored by JTI in revoked_tokens. Every worker keeps a
+# bloom filter of the revoked JTIs, so the common case (token not revoked) is
+# answered from memory. Only bloom hits, revoked tokens and the rare false
+# positive, fall through to the LRU and then the database. Other workers'
+# revocations arrive via NOTIFY on this channel.
+CHANNEL = 'token_revoked'
+
+_lookups = TTLCache('revoked_tokens', maxsize=10000, ttl=3600)
+_state = {'bloom': None, 'pid': None, 'refreshed_at': None}
+_lock = threading.Lock()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        return [(a + i * b) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _rebuild():
+    """Load every unexpired revoked JTI into a fresh bloom filter"""
+    now = datetime.utcnow()
+    jtis = [jti for (jti,) in db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at > now)]
+
+    bloom = BloomFilter(max(len(jtis) * 2, current_app.config['REVOCATION_BLOOM_CAPACITY']))
+    for jti in jtis:
+        bloom.add(jti)
+
+    with _lock:
+        _state.update(bloom=bloom, pid=os.getpid(), refreshed_at=now)
+    _lookups.clear()
+
+
+def _refresh():
+    """Pick up revocations made since the last refresh, for when NOTIFY is unavailable"""
+    since = _state['refreshed_at']
+    now = datetime.utcnow()
+    new_jtis = db.session.query(RevokedToken.jti).filter(RevokedToken.revoked_at >= since)
+    for (jti,) in new_jtis:
+        _mark_revoked(jti)
+    _state['refreshed_at'] = now
+
+
+def _mark_revoked(jti):
+    _state['bloom'].add(jti)
+    _lookups.set(jti, True)
+
+
+def _on_notify(payload):
+    if _state['bloom'] is not None:
+        _mark_revoked(payload)
+
+
+def _ensure_loaded():
+    listener = notify.get_listener(current_app)
+
+    if _state['pid'] != os.getpid():
+        _rebuild()
+        listener.ensure_started()
+    elif not listener.connected.is_set():
+        age = (datetime.utcnow() - _state['refreshed_at']).total_seconds()
+        if age > current_app.config['REVOCATION_REFRESH_SECONDS']:
+            _refresh()
+
+
+def is_revoked(jti):
+    # A replica that is behind could miss a revocation, and the answer is cached
+    with on_primary():
+        _ensure_loaded()
+
+        if jti not in _state['bloom']:
+            return False
+
+        revoked = _lookups.get(jti)
+        if revoked is None:
+            revoked = db.session.get(RevokedToken, jti) is not None
+            _lookups.set(jti, revoked)
+        return revoked
+
+
+def revoke(jwt_payload):
+    """Revoke the token described by these claims. The caller commits."""
+    jti = jwt_payload['jti']
+    identity = jwt_payload.get('sub')
+    now = datetime.utcnow()
+    if 'exp' in jwt_payload:
+        expires_at = datetime.utcfromtimestamp(jwt_payload['exp'])
+    else:
+        # Tokens issued with JWT_ACCESS_TOKEN_EXPIRES=False never expire
+        expires_at = now + timedelta(seconds=current_app.config['REVOCATION_MAX_TTL_SECONDS'])
+    db.session.merge(RevokedToken(
+        jti=jti,
+        user_id=identity.get('id') if isinstance(identity, dict) else identity,
+        expires_at=expires_at,
+        revoked_at=now
+    ))
+    notify.publish(db.session, CHANNEL, jti)
+
+    if _state['bloom'] is not None:
+        _mark_revoked(jti)
+
+
+@click.command('purge-revoked-tokens')
+@with_appcontext
+def purge_revoked_tokens_command():
+    """Delete revoked tokens that have expired anyway."""
+    deleted = RevokedToken.query.filter(RevokedToken.expires_at <= datetime.utcnow()).delete()
+    db.session.commit()
+    click.echo(f"{deleted} expired revoked tokens deleted")
+
+
+def init_app(app, jwt):
+    app.config.setdefault(
+        'REVOCATION_BLOOM_CAPACITY', int(os.getenv('REVOCATION_BLOOM_CAPACITY', '100000'))
+    )
+    # How often to poll for revocations when LISTEN/NOTIFY is not available
+    app.config.setdefault(
+        'REVOCATION_REFRESH_SECONDS', float(os.getenv('REVOCATION_REFRESH_SECONDS', '30'))
+    )
+
+    # How long to keep revocations of tokens without an exp claim. Once
+    # purged, such a token would be accepted again
+    app.config.setdefault(
+        'REVOCATION_MAX_TTL_SECONDS', int(os.getenv('REVOCATION_MAX_TTL_SECONDS', str(365 * 86400)))
+    )
+
+    listener = notify.get_listener(app)
+    listener.subscribe(CHANNEL, _on_notify)
+    # Revocations sent while the listener was down were missed
+    listener.on_reconnect(_rebuild)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return is_revoked(jwt_payload['jti'])
+
+    app.cli.add_command(purge_revoked_tokens_command)
@@ -1,12 +1,27 @@
-from flask import Flask, request, session, make_response
+from flask import request, make_response
 from flask_restful import Resource
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, verify_jwt_in_request, unset_jwt_cookies, set_access_cookies
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt, verify_jwt_in_request, unset_jwt_cookies, set_access_cookies
+import time
 
-from models import db, User, UserRole
+from models import db, User
+from passwords import hash_password, verify_password, needs_rehash
+from metrics import LOGIN_SECONDS
+from authz import current_identity, get_profile, role_ids, role_name
+import revocation
+from ratelimit import rate_limited, json_field
 
 class Login(Resource):
+    query_budget = {'post': 2}
+
+    @rate_limited("login", user_key=json_field("email"))
     def post(self):
+        started = time.perf_counter()
+        response = self._login()
+        outcome = "success" if getattr(response, "status_code", None) == 200 else "failure"
+        LOGIN_SECONDS.labels(outcome).observe(time.perf_counter() - started)
+        return response
+
+    def _login(self):
         data = request.get_json()
         email = data.get("email")
         password = data.get("password")
@@ -14,7 +29,12 @@ class Login(Resource):
 
         user = User.query.filter_by(email=email, role_id=role_id).first()
 
-        if user and check_password_hash(user.password_hash, password):
+        if user and password and verify_password(user.password_hash, password):
+            # Upgrade hashes made with older cost parameters while we have the password
+            if needs_rehash(user.password_hash):
+                user.password_hash = hash_password(password)
+                db.session.commit()
+
             access_token = create_access_token(identity={"id": user.id, "role_id": user.role_id})
             response = make_response({
                 "message": "Login successful",
@@ -35,6 +55,7 @@ class Login(Resource):
 
 
 class Signup(Resource):
+    @rate_limited("signup")
     def post(self):
         data = request.get_json()
         name = data.get("name")
@@ -49,7 +70,7 @@ class Signup(Resource):
         if User.query.filter_by(email=email).first():
             return {"error": "Email already exists"}, 400
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
         
         new_user = User(
             name=name,
@@ -57,7 +78,7 @@ class Signup(Resource):
             phone_number=phone_number,
             residence=residence,
             password_hash=hashed_password,
-            role_id= 3 
+            role_id=role_ids()['parent']
         )
         db.session.add(new_user)
         db.session.commit()
@@ -75,25 +96,35 @@ class Signup(Resource):
     
 class Logout(Resource):
     def post(self):
+        # Revoke the token itself, not just the cookie, so a copied token stops working too
+        try:
+            verify_jwt_in_request(optional=True)
+            claims = get_jwt()
+        except Exception:
+            claims = {}
+
+        if claims.get("jti"):
+            revocation.revoke(claims)
+            db.session.commit()
+
         response = make_response({"message": "Logged out"}, 200)
         unset_jwt_cookies(response)
         return response
     
 class Me(Resource):
+    query_budget = {'get': 3}
+    read_replica = True
+
     @jwt_required()
     def get(self):
-        identity = get_jwt_identity()
-
-        # identity might be {"id": 1} OR just 1 (or "1")
-        user_id = identity.get("id") if isinstance(identity, dict) else identity
-
-        user = User.query.get(user_id)
-        if not user:
+        # Served from the token claims and the cached profile, no query on a hit
+        profile = get_profile(current_identity().get("id"))
+        if not profile:
             return {"error": "Unauthorized"}, 401
 
         return {
-            "id": user.id,
-            "name": user.name,
-            "email": user.email,
-            "role": user.role.name if user.role else None
-        }, 200
\ No newline at end of file
+            "id": profile["id"],
+            "name": profile["name"],
+            "email": profile["email"],
+            "role": role_name(profile["role_id"])
+        }, 200
@@ -1,7 +1,11 @@
 from flask import request
 from flask_restful import Resource
 from datetime import datetime, date, timedelta
-from models import db, Booking, Vehicle, User, Trip, Route, PickupLocation, SchoolLocation
+from sqlalchemy import and_, func, lambda_stmt, or_, select, update
+from sqlalchemy.orm import joinedload
+from models import db, Booking, BookingStatus, Vehicle, User, Trip, Route, PickupLocation, SchoolLocation
+from ratelimit import rate_limited
+from metrics import BOOKINGS_CREATED, BOOKINGS_REJECTED
 
 
 def generate_trips_for_booking(booking):
@@ -41,28 +45,28 @@ def generate_trips_for_booking(booking):
     return len(trips)
 
 
+def max_seats_booked(route_id, start_date, end_date):
+    """Most seats taken on any date in the range by active trips on the route"""
+    # Seats taken on each date, summed in the database; a lambda statement so
+    # the subquery isn't rebuilt for every booking request
+    seats_by_date = lambda_stmt(lambda: select(func.max(
+        select(func.sum(Booking.seats_booked).label('seats')).join(Booking.trips).where(
+            Booking.route_id == route_id,
+            Trip.trip_date >= start_date,
+            Trip.trip_date <= end_date,
+            Trip.status.in_(['scheduled', 'picked_up'])  # Active trips only
+        ).group_by(Trip.trip_date).subquery().c.seats
+    )))
+    return db.session.scalar(seats_by_date) or 0
+
+
 def validate_booking_capacity(vehicle_id, start_date, end_date, seats_requested):
-    vehicle = Vehicle.query.get(vehicle_id)
+    vehicle = db.session.get(Vehicle, vehicle_id)
     if not vehicle:
         return False, 0, "Vehicle not found"
     
-    # Find all trips that overlap with this date range for this vehicle's route
-    overlapping_trips = Trip.query.join(Booking).filter(
-        Booking.route_id == vehicle.route_id,
-        Trip.trip_date >= start_date,
-        Trip.trip_date <= end_date,
-        Trip.status.in_(['scheduled', 'picked_up'])  # Active trips only
-    ).all()
-    
-    # Group by date and count seats
-    from collections import defaultdict
-    seats_by_date = defaultdict(int)
-    
-    for trip in overlapping_trips:
-        seats_by_date[trip.trip_date] += trip.booking.seats_booked
-    
     # Check if any date exceeds capacity
-    max_seats_used = max(seats_by_date.values()) if seats_by_date else 0
+    max_seats_used = max_seats_booked(vehicle.route_id, start_date, end_date)
     available = vehicle.capacity - max_seats_used
     
     if seats_requested <= available:
@@ -138,13 +142,59 @@ def sync_booking_completion_from_trips(booking: Booking) -> bool:
     return False
 
 
-def serialize_booking(booking, include_trips=False):
+def complete_finished_bookings(*criteria):
+    """
+    Bulk version of the completion checks in serialize_booking, for every
+    active booking matching criteria. One SELECT finds them (on the replica
+    when the request is routed there), and only if it finds any does an
+    UPDATE go to the primary, so most GET /bookings stay read-only.
+    """
+    finished = or_(
+        Booking.end_date < date.today(),
+        and_(Booking.trips.any(), ~Booking.trips.any(Trip.status.in_(['scheduled', 'picked_up'])))
+    )
+    booking_ids = db.session.scalars(
+        select(Booking.id).where(Booking.status == 'active', finished, *criteria)
+    ).all()
+    if not booking_ids:
+        return
+
+    # Conditions repeated, since a replica may be slightly behind the primary
+    db.session.execute(
+        update(Booking).where(Booking.id.in_(booking_ids), Booking.status == 'active', finished)
+        .values(status='completed').execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def list_bookings(user_id=None, route_id=None, status=None):
+    """Bookings for GET /bookings, with what serialize_booking reads"""
+    # A lambda statement: each combination of filters is built once and cached
+    stmt = lambda_stmt(lambda: select(Booking).options(
+        joinedload(Booking.user),
+        joinedload(Booking.route),
+        joinedload(Booking.pickup_location),
+        joinedload(Booking.dropoff_location)
+    ))
+    if user_id:
+        stmt += lambda s: s.where(Booking.user_id == user_id)
+    if route_id:
+        stmt += lambda s: s.where(Booking.route_id == route_id)
+    if status:
+        stmt += lambda s: s.where(Booking.status == status)
+    return db.session.scalars(stmt).all()
+
+
+def serialize_booking(booking, include_trips=False, sync_status=True):
 
     # Auto-complete booking if end date has passed
   
     did_update = False
 
-    if booking.status == 'active' and booking.end_date < date.today():
+    if not sync_status:
+        # Already done in bulk by complete_finished_bookings
+        did_update = False
+    elif booking.status == 'active' and booking.end_date < date.today():
         booking.status = 'completed'
         did_update = True
     else:
@@ -166,9 +216,9 @@ def serialize_booking(booking, include_trips=False):
         "dropoff_location_id": booking.dropoff_location_id,
         "dropoff_location_name": booking.dropoff_location.name,
         "dropoff_location_gps": booking.dropoff_location.gps_coordinates,
-        "booking_date": booking.booking_date.isoformat(),
-        "start_date": booking.start_date.isoformat(),
-        "end_date": booking.end_date.isoformat(),
+        "booking_date": booking.booking_date,
+        "start_date": booking.start_date,
+        "end_date": booking.end_date,
         "status": booking.status,
         "seats_booked": booking.seats_booked,
         "service_type": booking.service_type,
@@ -200,7 +250,7 @@ def serialize_trip(trip):
     return {
         "trip_id": trip.id,
         "booking_id": trip.booking_id,
-        "trip_date": trip.trip_date.isoformat(),
+        "trip_date": trip.trip_date,
         "service_time": trip.service_time,
         "status": trip.status,
         "pickup_location_id": pickup_location.id,
@@ -209,9 +259,9 @@ def serialize_trip(trip):
         "dropoff_location_id": dropoff_location.id,
         "dropoff_location_name": dropoff_location.name,
         "dropoff_location_gps": dropoff_location.gps_coordinates,
-        "pickup_time": trip.pickup_time.isoformat() if trip.pickup_time else None,
-        "actual_pickup_time": trip.actual_pickup_time.isoformat() if trip.actual_pickup_time else None,
-        "actual_dropoff_time": trip.actual_dropoff_time.isoformat() if trip.actual_dropoff_time else None,
+        "pickup_time": trip.pickup_time,
+        "actual_pickup_time": trip.actual_pickup_time,
+        "actual_dropoff_time": trip.actual_dropoff_time,
         "driver_notes": trip.driver_notes,
     }
 
@@ -221,32 +271,38 @@ def serialize_trip(trip):
 
 
 class BookingList(Resource):
+    query_budget = {'get': 3, 'post': 16}
+    read_replica = True
 
     def get(self):
 
         user_id = request.args.get('user_id', type=int)
         route_id = request.args.get('route_id', type=int)
         status = request.args.get('status')
+
+        if status and status not in BookingStatus.__members__:
+            return {"error": f"status must be one of: {', '.join(BookingStatus.__members__)}"}, 400
         
-        query = Booking.query
+        criteria = []
         
         if user_id:
-            query = query.filter_by(user_id=user_id)
+            criteria.append(Booking.user_id == user_id)
         
         if route_id:
-            query = query.filter_by(route_id=route_id)
-        
-        if status:
-            query = query.filter_by(status=status)
+            criteria.append(Booking.route_id == route_id)
         
-        bookings = query.all()
+        # Before the status filter, so ?status=completed sees them too
+        complete_finished_bookings(*criteria)
+
+        bookings = list_bookings(user_id, route_id, status)
         
         response = []
         for booking in bookings:
-            response.append(serialize_booking(booking, include_trips=False))
+            response.append(serialize_booking(booking, include_trips=False, sync_status=False))
         
         return response, 200
     
+    @rate_limited("booking_create")
     def post(self):
 
         data = request.get_json()
@@ -262,31 +318,33 @@ class BookingList(Resource):
                 return {"error": f"{field} is required"}, 400
         
         # Validate user exists
-        user = User.query.get(data['user_id'])
+        user = db.session.get(User, data['user_id'])
         if not user:
             return {"error": "User not found"}, 404
         
         # Validate route exists
-        route = Route.query.get(data['route_id'])
+        route = db.session.get(Route, data['route_id'])
         if not route:
             return {"error": "Route not found"}, 404
         
         # Validate pickup location exists and belongs to route
-        pickup_location = PickupLocation.query.get(data['pickup_location_id'])
+        pickup_location = db.session.get(PickupLocation, data['pickup_location_id'])
         if not pickup_location:
             return {"error": "Pickup location not found"}, 404
         if pickup_location.route_id != data['route_id']:
             return {"error": "Pickup location does not belong to selected route"}, 400
         
         # Validate dropoff location exists and belongs to route
-        dropoff_location = SchoolLocation.query.get(data['dropoff_location_id'])
+        dropoff_location = db.session.get(SchoolLocation, data['dropoff_location_id'])
         if not dropoff_location:
             return {"error": "Dropoff location not found"}, 404
         if dropoff_location.route_id != data['route_id']:
             return {"error": "Dropoff location does not belong to selected route"}, 400
         
         # Auto-assign vehicle from route (get first available vehicle on this route)
-        vehicle = Vehicle.query.filter_by(route_id=data['route_id']).first()
+        vehicle = db.session.scalars(
+            select(Vehicle).filter_by(route_id=data['route_id']).limit(1)
+        ).first()
         if not vehicle:
             return {"error": "No vehicles available on this route"}, 404
         
@@ -325,6 +383,7 @@ class BookingList(Resource):
             seats_booked
         )
         if not is_valid:
+            BOOKINGS_REJECTED.labels('capacity').inc()
             return {"error": error_msg}, 409  # 409 Conflict
         
         # Create booking
@@ -354,6 +413,8 @@ class BookingList(Resource):
             db.session.commit()
             return {"error": f"Failed to generate trips: {str(e)}"}, 500
         
+        BOOKINGS_CREATED.inc()
+
         # Return success response
         response = serialize_booking(booking, include_trips=False)
         response["trips_created"] = trips_created
@@ -363,6 +424,8 @@ class BookingList(Resource):
 
 
 class BookingDetail(Resource):
+    query_budget = {'get': 6}
+    read_replica = True
     
     def get(self, booking_id):
  
@@ -1,33 +1,61 @@
-from flask import request
+from flask import request, current_app
 from flask_restful import Resource
-from models import db, PickupLocation, Route
+from models import db, PickupLocation, Route, Booking
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from functools import wraps
+from sqlalchemy.orm import joinedload
+from flask_jwt_extended import jwt_required
+from authz import admin_required, admin_or_parent_required
+from http_cache import conditional
+from pickup_dedupe import (
+    grid_cell, find_near_duplicate, find_duplicate_clusters, merge_pickup_locations
+)
+from pickup_import import PickupImport
+from uploads import read_rows, unsupported_upload
+
+
+def force_requested(data=None):
+    """?force=true or "force": true in a JSON body: skip the near-duplicate check"""
+    if request.args.get('force') == 'true':
+        return True
+    return isinstance(data, dict) and bool(data.get('force'))
 
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
 
-        if identity.get("role_id") not in [1, 3]:
-            return {"error": "Admins and parents only"}, 403
+def serialize_pickup_location(location):
+    return {
+        'id': location.id,
+        'route_id': location.route_id,
+        'name': location.name,
+        'gps_coordinates': location.gps_coordinates
+    }
 
-        return fn(*args, **kwargs)
-    return wrapper
+
+def bookings_counts(location_ids):
+    """
+    Pickup location id -> number of bookings, in one query
+    """
+    if not location_ids:
+        return {}
+    rows = db.session.query(Booking.pickup_location_id, func.count(Booking.id)).filter(
+        Booking.pickup_location_id.in_(location_ids)
+    ).group_by(Booking.pickup_location_id)
+    return dict(rows.all())
 
 
 class PickupLocationList(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
+
     @jwt_required()
     def get(self):
         try:
             route_id = request.args.get('route_id', type=int)
             
+            query = PickupLocation.query.options(joinedload(PickupLocation.route))
             if route_id:
-                pickup_locations = PickupLocation.query.filter_by(route_id=route_id).all()
+                pickup_locations = query.filter_by(route_id=route_id).all()
             else:
-                pickup_locations = PickupLocation.query.all()
+                pickup_locations = query.all()
             
             return {
                 'pickup_locations': [
@@ -44,7 +72,7 @@ class PickupLocationList(Resource):
             
         except Exception as e:
             return {'error': str(e)}, 500
-    @admin_required
+    @admin_or_parent_required
     def post(self):
         try:
             data = request.get_json()
@@ -59,12 +87,36 @@ class PickupLocationList(Resource):
             route = Route.query.get(data['route_id'])
             if not route:
                 return {'error': 'Route not found'}, 404
+
+            # Reuse an existing stop instead of creating a near-duplicate,
+            # unless the caller explicitly asks for a new one
+            if not force_requested(data):
+                existing = find_near_duplicate(
+                    data['route_id'],
+                    data['name'],
+                    data['gps_coordinates'],
+                    radius_m=current_app.config['PICKUP_DEDUPE_RADIUS_M']
+                )
+                if existing:
+                    return {
+                        'message': 'Matched existing pickup location',
+                        'duplicate': True,
+                        'pickup_location': serialize_pickup_location(existing)
+                    }, 200
+
+            existing = PickupLocation.query.filter_by(route_id=data['route_id'], name=data['name']).first()
+            if existing:
+                return {
+                    'error': 'A pickup location with this name already exists on this route',
+                    'pickup_location': serialize_pickup_location(existing)
+                }, 409
             
             # Create new pickup location
             pickup_location = PickupLocation(
                 route_id=data['route_id'],
                 name=data['name'],
-                gps_coordinates=data['gps_coordinates']
+                gps_coordinates=data['gps_coordinates'],
+                grid_cell=grid_cell(data['gps_coordinates'])
             )
             
             db.session.add(pickup_location)
@@ -72,12 +124,7 @@ class PickupLocationList(Resource):
             
             return {
                 'message': 'Pickup location created successfully',
-                'pickup_location': {
-                    'id': pickup_location.id,
-                    'route_id': pickup_location.route_id,
-                    'name': pickup_location.name,
-                    'gps_coordinates': pickup_location.gps_coordinates
-                }
+                'pickup_location': serialize_pickup_location(pickup_location)
             }, 201
             
         except IntegrityError:
@@ -89,6 +136,9 @@ class PickupLocationList(Resource):
 
 
 class PickupLocationDetail(Resource):
+    query_budget = {'get': 3}
+    read_replica = True
+
     @jwt_required()
     def get(self, id):
         try:
@@ -104,19 +154,19 @@ class PickupLocationDetail(Resource):
                     'route_name': pickup_location.route.name,
                     'name': pickup_location.name,
                     'gps_coordinates': pickup_location.gps_coordinates,
-                    'bookings_count': len(pickup_location.bookings)
+                    'bookings_count': bookings_counts([id]).get(id, 0)
                 }
             }, 200
             
         except Exception as e:
             return {'error': str(e)}, 500
-    @admin_required
+    @admin_or_parent_required
     def put(self, id):
         return self._update(id)
-    @admin_required
+    @admin_or_parent_required
     def patch(self, id):
         return self._update(id)
-    @admin_required
+    @admin_or_parent_required
     def _update(self, id):
         try:
             pickup_location = PickupLocation.query.get(id)
@@ -139,17 +189,13 @@ class PickupLocationDetail(Resource):
             # Update GPS coordinates if provided
             if 'gps_coordinates' in data:
                 pickup_location.gps_coordinates = data['gps_coordinates']
+                pickup_location.grid_cell = grid_cell(data['gps_coordinates'])
             
             db.session.commit()
             
             return {
                 'message': 'Pickup location updated successfully',
-                'pickup_location': {
-                    'id': pickup_location.id,
-                    'route_id': pickup_location.route_id,
-                    'name': pickup_location.name,
-                    'gps_coordinates': pickup_location.gps_coordinates
-                }
+                'pickup_location': serialize_pickup_location(pickup_location)
             }, 200
             
         except IntegrityError:
@@ -158,7 +204,7 @@ class PickupLocationDetail(Resource):
         except Exception as e:
             db.session.rollback()
             return {'error': str(e)}, 500
-    @admin_required
+    @admin_or_parent_required
     def delete(self, id):
 
         try:
@@ -167,10 +213,11 @@ class PickupLocationDetail(Resource):
             if not pickup_location:
                 return {'error': 'Pickup location not found'}, 404
 
-            if pickup_location.bookings:
+            bookings_count = bookings_counts([id]).get(id, 0)
+            if bookings_count:
                 return {
                     'error': 'Cannot delete pickup location with active bookings',
-                    'active_bookings': len(pickup_location.bookings)
+                    'active_bookings': bookings_count
                 }, 400
             
             db.session.delete(pickup_location)
@@ -187,7 +234,10 @@ class PickupLocationDetail(Resource):
 
 
 class PickupLocationByRoute(Resource):
+    query_budget = {'get': 2}
+
     @jwt_required()
+    @conditional('routes', 'pickup_locations')
     def get(self, route_id):
         try:
             # Verify route exists
@@ -217,52 +267,127 @@ class PickupLocationByRoute(Resource):
 
 
 class PickupLocationBulk(Resource):
-    @admin_required
+    @admin_or_parent_required
     def post(self):
+        """
+        Upsert pickup locations by (route_id, name). Accepts text/csv or
+        application/x-ndjson bodies (route_id per row or as a query parameter)
+        streamed row by row, or the JSON {"route_id", "locations"} shape.
+        Pass ?force=true (or "force": true in a JSON body) to skip the
+        near-duplicate check and ?report=full for the outcome of every row,
+        not just the skipped ones.
+        """
+        unsupported = unsupported_upload(request)
+        if unsupported:
+            return unsupported
 
         try:
-            data = request.get_json()
-            
-            if 'route_id' not in data or 'locations' not in data:
-                return {'error': 'Missing route_id or locations'}, 400
-            
-            # Verify route exists
-            route = Route.query.get(data['route_id'])
-            if not route:
-                return {'error': 'Route not found'}, 404
-            
-            created_locations = []
-            
-            for location_data in data['locations']:
-                if 'name' not in location_data or 'gps_coordinates' not in location_data:
-                    continue
-                
-                pickup_location = PickupLocation(
-                    route_id=data['route_id'],
-                    name=location_data['name'],
-                    gps_coordinates=location_data['gps_coordinates']
-                )
-                
-                db.session.add(pickup_location)
-                created_locations.append(pickup_location)
-            
+            data = None
+            if request.mimetype == 'application/json':
+                data = request.get_json(silent=True) or {}
+                if 'route_id' not in data or 'locations' not in data:
+                    return {'error': 'Missing route_id or locations'}, 400
+
+                # Verify route exists
+                route = Route.query.get(data['route_id'])
+                if not route:
+                    return {'error': 'Route not found'}, 404
+
+            upload = PickupImport(
+                radius_m=current_app.config['PICKUP_DEDUPE_RADIUS_M'],
+                check_duplicates=not force_requested(data),
+                full_report=request.args.get('report') == 'full'
+            )
+            upload.run(read_rows(
+                request, 'locations', {'route_id': request.args.get('route_id', type=int)}
+            ))
             db.session.commit()
+
+            return upload.report(), 201 if upload.inserted else 200
             
+        except IntegrityError:
+            db.session.rollback()
+            return {'error': 'Database integrity error'}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {'error': str(e)}, 500
+
+
+class PickupLocationDuplicates(Resource):
+    read_replica = True
+
+    @admin_required
+    def get(self):
+        try:
+            route_id = request.args.get('route_id', type=int)
+            radius_m = request.args.get('radius_m', type=float) or current_app.config['PICKUP_DEDUPE_RADIUS_M']
+            similarity = request.args.get('similarity', type=float) or 0.6
+
+            clusters = find_duplicate_clusters(route_id, radius_m, similarity)
+            counts = bookings_counts([location.id for cluster in clusters for location in cluster])
+
             return {
-                'message': f'{len(created_locations)} pickup locations created successfully',
-                'pickup_locations': [
-                    {
-                        'id': location.id,
-                        'name': location.name,
-                        'gps_coordinates': location.gps_coordinates
-                    }
-                    for location in created_locations
+                'radius_m': radius_m,
+                'similarity': similarity,
+                'clusters': [
+                    [
+                        dict(serialize_pickup_location(location), bookings_count=counts.get(location.id, 0))
+                        for location in cluster
+                    ]
+                    for cluster in clusters
                 ]
-            }, 201
-            
+            }, 200
+
+        except Exception as e:
+            return {'error': str(e)}, 500
+
+
+class PickupLocationMerge(Resource):
+    @admin_required
+    def post(self):
+        try:
+            data = request.get_json()
+
+            if not data or 'target_id' not in data or not data.get('source_ids'):
+                return {'error': 'Missing target_id or source_ids'}, 400
+
+            # Before any query: a "1" that slipped past the target check
+            # would delete the target itself
+            if not isinstance(data['source_ids'], list):
+                return {'error': 'source_ids must be a list of ids'}, 400
+            try:
+                target_id = int(data['target_id'])
+                source_ids = sorted({int(i) for i in data['source_ids']} - {target_id})
+            except (TypeError, ValueError):
+                return {'error': 'target_id and source_ids must be integers'}, 400
+            if not source_ids:
+                return {'error': 'source_ids must name stops other than the target'}, 400
+
+            target = db.session.get(PickupLocation, target_id)
+            if not target:
+                return {'error': 'Target pickup location not found'}, 404
+
+            sources = PickupLocation.query.filter(PickupLocation.id.in_(source_ids)).all()
+
+            if len(sources) != len(source_ids):
+                return {'error': 'One or more source pickup locations not found'}, 404
+
+            if any(source.route_id != target.route_id for source in sources):
+                return {'error': 'Can only merge pickup locations on the same route'}, 400
+
+            bookings_moved = merge_pickup_locations(target, sources)
+            db.session.commit()
+
+            return {
+                'message': f'{len(sources)} pickup locations merged into {target.name}',
+                'pickup_location': serialize_pickup_location(target),
+                'merged_ids': source_ids,
+                'bookings_moved': bookings_moved
+            }, 200
+
         except IntegrityError:
             db.session.rollback()
             return {'error': 'Database integrity error'}, 400
         except Exception as e:
             db.session.rollback()
-            return {'error': str(e)}, 500
\ No newline at end of file
+            return {'error': str(e)}, 500
@@ -0,0 +1,57 @@
+from flask import request, current_app, send_from_directory
+from flask_restful import Resource
+from authz import admin_required
+from profiling import available_modes, current_settings, save_settings, list_profiles, profile_dir
+
+
+class ProfileList(Resource):
+    @admin_required
+    def get(self):
+        return {
+            "settings": current_settings(current_app),
+            "profiles": list_profiles(current_app)
+        }, 200
+
+    @admin_required
+    def patch(self):
+        data = request.get_json()
+        if not data:
+            return {"error": "No data provided"}, 400
+
+        settings = dict(current_settings(current_app))
+
+        if 'sample_rate' in data:
+            try:
+                sample_rate = float(data['sample_rate'])
+            except (TypeError, ValueError):
+                return {"error": "sample_rate must be a number"}, 400
+            if not 0 <= sample_rate <= 1:
+                return {"error": "sample_rate must be between 0 and 1"}, 400
+            settings['sample_rate'] = sample_rate
+
+        if 'endpoints' in data:
+            if not isinstance(data['endpoints'], list):
+                return {"error": "endpoints must be a list of resource names"}, 400
+            settings['endpoints'] = [str(name) for name in data['endpoints']]
+
+        if 'mode' in data:
+            if data['mode'] not in available_modes():
+                return {"error": f"mode must be one of: {', '.join(available_modes())}"}, 400
+            settings['mode'] = data['mode']
+
+        save_settings(current_app, settings)
+
+        return {
+            "message": "Profiler settings updated",
+            "settings": settings
+        }, 200
+
+
+class ProfileDownload(Resource):
+    @admin_required
+    def get(self, filename):
+        if not filename.endswith(('.collapsed', '.pstats')):
+            return {"error": "Profile not found"}, 404
+
+        # send_from_directory refuses paths outside the profile directory
+        return send_from_directory(profile_dir(current_app), filename, as_attachment=True)
@@ -1,20 +1,10 @@
 from flask import request
 from flask_restful import Resource
 from models import db, Route
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from functools import wraps
+from flask_jwt_extended import jwt_required
+from authz import admin_required
+from http_cache import conditional
 
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-
-        if identity.get("role_id") != 1:
-            return {"error": "Admins only"}, 403
-
-        return fn(*args, **kwargs)
-    return wrapper
 
 def serialize_route(route):
     return {
@@ -28,7 +18,10 @@ def serialize_route(route):
     }
 
 class RouteList(Resource):
+    query_budget = {'get': 1}
+
     @jwt_required()
+    @conditional('routes')
     def get(self):
   
         routes = Route.query.all()
@@ -70,8 +63,10 @@ class RouteList(Resource):
         return response, 201
     
 class RouteDetail(Resource):
+    query_budget = {'get': 1}
 
     @jwt_required()
+    @conditional('routes')
     def get(self, route_id):
         route = Route.query.get(route_id)
         
@@ -1,22 +1,12 @@
 from flask_restful import Resource, request
 from models import SchoolLocation, db
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from functools import wraps
+from flask_jwt_extended import jwt_required
+from authz import admin_or_parent_required
+from http_cache import conditional
 
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-
-        if identity.get("role_id") not in [1, 3]:
-            return {"error": "Admins and parents only"}, 403
-
-        return fn(*args, **kwargs)
-    return wrapper
 
 class CreateSchoolLocation(Resource):
-    @admin_required
+    @admin_or_parent_required
     def post(self):
         data = request.get_json()
         name = data.get("name")
@@ -46,7 +36,10 @@ class CreateSchoolLocation(Resource):
         }, 201
   
 class GetAllSchoolLocations(Resource):
+    query_budget = {'get': 1}
+
     @jwt_required()
+    @conditional('school_locations')
     def get(self):
         locations = SchoolLocation.query.all()
 
@@ -62,6 +55,9 @@ class GetAllSchoolLocations(Resource):
         return results, 200
 
 class GetSchoolLocation(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
+
     @jwt_required()
     def get(self, location_id):
         location = SchoolLocation.query.get(location_id)
@@ -78,7 +74,7 @@ class GetSchoolLocation(Resource):
 
 
 class UpdateSchoolLocation(Resource):
-    @admin_required
+    @admin_or_parent_required
     def put(self, location_id):
         location = SchoolLocation.query.get(location_id)
 
@@ -103,7 +99,7 @@ class UpdateSchoolLocation(Resource):
         }, 200
 
 class DeleteSchoolLocation(Resource):
-    @admin_required
+    @admin_or_parent_required
     def delete(self, location_id):
         location = SchoolLocation.query.get(location_id)
 
@@ -1,22 +1,12 @@
 from flask import request
 from flask_restful import Resource
 from datetime import datetime, date
-from models import db, Trip, Booking
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from functools import wraps
-
-def driver_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-
-        # role_id: 1=admin, 2=driver, 3=parent
-        if identity.get("role_id") != 2:
-            return {"error": "Drivers only"}, 403
-
-        return fn(*args, **kwargs)
-    return wrapper
+from models import db, Trip, Booking, Vehicle
+from sqlalchemy import exists, lambda_stmt, select
+from sqlalchemy.orm import contains_eager
+from flask_jwt_extended import jwt_required
+from authz import driver_required
+from metrics import TRIP_EVENTS
 
 
 def serialize_trip(trip):
@@ -28,12 +18,12 @@ def serialize_trip(trip):
     return {
         "trip_id": trip.id,
         "booking_id": trip.booking_id,
-        "trip_date": trip.trip_date.isoformat(),
+        "trip_date": trip.trip_date,
         "service_time": trip.service_time,
         "status": trip.status,
-        "pickup_time": trip.pickup_time.isoformat() if trip.pickup_time else None,
-        "actual_pickup_time": trip.actual_pickup_time.isoformat() if trip.actual_pickup_time else None,
-        "actual_dropoff_time": trip.actual_dropoff_time.isoformat() if trip.actual_dropoff_time else None,
+        "pickup_time": trip.pickup_time,
+        "actual_pickup_time": trip.actual_pickup_time,
+        "actual_dropoff_time": trip.actual_dropoff_time,
         "driver_notes": trip.driver_notes,
         "child_name": booking.user.name if booking and booking.user else None,
         "seats_booked": booking.seats_booked if booking else 0,
@@ -45,7 +35,7 @@ def serialize_trip(trip):
 
 def sync_booking_status_from_trips(booking_id: int) -> None:
  
-    booking = Booking.query.get(booking_id)
+    booking = db.session.get(Booking, booking_id)
     if not booking:
         return
 
@@ -58,20 +48,43 @@ def sync_booking_status_from_trips(booking_id: int) -> None:
     if booking.status != 'active':
         return
 
-    trips = booking.trips or []
-    if len(trips) == 0:
+    # Both EXISTS checks in one round trip instead of loading every trip
+    has_trips, any_incomplete = db.session.execute(lambda_stmt(lambda: select(
+        exists().where(Trip.booking_id == booking_id),
+        exists().where(Trip.booking_id == booking_id, Trip.status.in_(['scheduled', 'picked_up']))
+    ))).one()
+    if not has_trips:
         return
 
-    any_incomplete = any(t.status in ['scheduled', 'picked_up'] for t in trips)
-
     if not any_incomplete:
         booking.status = 'completed'
         db.session.commit()
 
 
+def today_trips(route_id, service_time, today):
+    """
+    A run's open trips on one route, with the booking, user and stops that
+    serialize_trip reads. A lambda statement, so polling drivers reuse the
+    cached SQL without rebuilding the query each time.
+    """
+    return db.session.scalars(lambda_stmt(lambda: select(Trip).join(Trip.booking).where(
+        Trip.trip_date == today,
+        Trip.service_time == service_time,
+        Booking.route_id == route_id,
+        Trip.status.in_(['scheduled', 'picked_up'])
+    ).options(
+        contains_eager(Trip.booking).joinedload(Booking.user),
+        contains_eager(Trip.booking).joinedload(Booking.pickup_location),
+        contains_eager(Trip.booking).joinedload(Booking.dropoff_location)
+    ))).all()
+
+
 # RESOURCE CLASSES
 
 class TripToday(Resource):
+    query_budget = {'get': 2}
+    read_replica = True
+
     @jwt_required()
     def get(self):
         vehicle_id = request.args.get('vehicle_id', type=int)
@@ -88,20 +101,14 @@ class TripToday(Resource):
 
         today = date.today()
 
-        from models import Vehicle
-        vehicle = Vehicle.query.get(vehicle_id)
+        vehicle = db.session.get(Vehicle, vehicle_id)
         if not vehicle:
             return {"error": "Vehicle not found"}, 404
 
-        trips = Trip.query.join(Booking).filter(
-            Trip.trip_date == today,
-            Trip.service_time == service_time,
-            Booking.route_id == vehicle.route_id,
-            Trip.status.in_(['scheduled', 'picked_up'])
-        ).all()
+        trips = today_trips(vehicle.route_id, service_time, today)
 
         response = {
-            "date": today.isoformat(),
+            "date": today,
             "service_time": service_time,
             "vehicle_id": vehicle_id,
             "trips": [serialize_trip(trip) for trip in trips],
@@ -114,9 +121,11 @@ class TripToday(Resource):
 
 
 class TripPickup(Resource):
+    query_budget = {'patch': 10}
+
     @driver_required
     def patch(self, trip_id):
-        trip = Trip.query.get(trip_id)
+        trip = db.session.get(Trip, trip_id)
 
         if not trip:
             return {"error": "Trip not found"}, 404
@@ -135,6 +144,7 @@ class TripPickup(Resource):
             trip.driver_notes = data['driver_notes']
 
         db.session.commit()
+        TRIP_EVENTS.labels('pickup').inc()
 
         sync_booking_status_from_trips(trip.booking_id)
 
@@ -145,10 +155,12 @@ class TripPickup(Resource):
 
 
 class TripDropoff(Resource):
+    query_budget = {'patch': 12}
+
     @driver_required
     def patch(self, trip_id):
   
-        trip = Trip.query.get(trip_id)
+        trip = db.session.get(Trip, trip_id)
 
         if not trip:
             return {"error": "Trip not found"}, 404
@@ -170,6 +182,7 @@ class TripDropoff(Resource):
             trip.driver_notes = data['driver_notes']
 
         db.session.commit()
+        TRIP_EVENTS.labels('dropoff').inc()
 
         sync_booking_status_from_trips(trip.booking_id)
 
@@ -1,21 +1,12 @@
-from flask import Flask, request, session
+from flask import request
 from flask_restful import Resource
-from werkzeug.security import check_password_hash, generate_password_hash
-from models import db, User, UserRole
-from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
-from functools import wraps
-
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-
-        if identity.get("role_id") != 1:
-            return {"error": "Admins only"}, 403
-
-        return fn(*args, **kwargs)
-    return wrapper
+from models import db, User
+from passwords import hash_password
+from user_import import import_users
+from uploads import read_rows, unsupported_upload
+from sqlalchemy.exc import IntegrityError
+from authz import admin_required, invalidate_profile, role_ids
+from ratelimit import rate_limited
 
 
 class CreateDriver(Resource):
@@ -34,14 +25,14 @@ class CreateDriver(Resource):
         if User.query.filter_by(email=email).first():
             return {"error": "Email already exists"}, 400
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         new_driver = User(
             name=name,
             email=email,
             password_hash=hashed_password,
             phone_number=phone_number,
-            role_id=2
+            role_id=role_ids()['driver']
         )
 
         db.session.add(new_driver)
@@ -58,10 +49,13 @@ class CreateDriver(Resource):
         }, 201
         
 class GetDrivers(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
+
     @admin_required
     def get(self):
    
-        drivers = User.query.filter_by(role_id=2).all()
+        drivers = User.query.filter_by(role_id=role_ids()['driver']).all()
 
         results = []
         for d in drivers:
@@ -74,13 +68,43 @@ class GetDrivers(Resource):
 
         return results
 
+class BulkUsers(Resource):
+    @admin_required
+    def post(self):
+        """
+        Onboard parents and drivers from a spreadsheet. Accepts text/csv or
+        application/x-ndjson with name, email, phone_number, residence, role
+        and optional password columns, or JSON {"users": [...]}. ?role= sets
+        the role for rows that leave it blank.
+        """
+        unsupported = unsupported_upload(request)
+        if unsupported:
+            return unsupported
+
+        try:
+            rows = read_rows(request, 'users', {'role': request.args.get('role')})
+            results = import_users(rows)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return {"error": "Database integrity error"}, 400
+
+        created = sum(1 for r in results if r['status'] == 'created')
+
+        return {
+            "message": f"{created} users created, {len(results) - created} skipped",
+            "created": created,
+            "skipped": len(results) - created,
+            "results": results
+        }, 201 if created else 200
+
+
 class GetUsers(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
+
     @admin_required
     def get(self):
-        admin = User.query.get(session.get("user_id"))
-        if not admin or admin.role_id != 1:
-            return {"error": "Unauthorized"}, 403
-
         users = User.query.all()
 
         return [
@@ -118,6 +142,7 @@ class UpdateUser(Resource):
         user.email = data.get("email", user.email)
         user.phone_number = data.get("phone_number", user.phone_number)
 
+        invalidate_profile(user_id)
         db.session.commit()
 
         return {
@@ -139,12 +164,14 @@ class DeleteUser(Resource):
             return {"error": "User not found"}, 404
 
         db.session.delete(user)
+        invalidate_profile(user_id)
         db.session.commit()
 
         return {"message": "User deleted"}
 
 
 class CreateAdmin(Resource):
+    @rate_limited("create_admin")
     def post(self):
         data = request.get_json()
         name = data.get("name")
@@ -158,14 +185,14 @@ class CreateAdmin(Resource):
         if User.query.filter_by(email=email).first():
             return {"error": "Email already exists"}, 400
 
-        hashed_password = generate_password_hash(password)
+        hashed_password = hash_password(password)
 
         new_admin = User(
             name=name,
             email=email,
             password_hash=hashed_password,
             phone_number=phone_number,
-            role_id=1
+            role_id=role_ids()['admin']
         )
 
         db.session.add(new_admin)
@@ -1,11 +1,15 @@
 from flask import request, jsonify
 from flask_restful import Resource
 from models import db, UserRole
+from authz import invalidate_roles
+from http_cache import conditional
 
 
 
 class UserRoleList(Resource):
+    query_budget = {'get': 1}
 
+    @conditional('user_roles')
     def get(self):
         roles = UserRole.query.all()
 
@@ -30,6 +34,7 @@ class UserRoleList(Resource):
 
         new_role = UserRole(name=name)
         db.session.add(new_role)
+        invalidate_roles()
         db.session.commit()
 
         return {
@@ -42,6 +47,9 @@ class UserRoleList(Resource):
 
 
 class UserRoleDetail(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
+
     def get(self, role_id):
         role = UserRole.query.get(role_id)
 
@@ -66,6 +74,7 @@ class UserRoleDetail(Resource):
             return {"error": "Role name is required"}, 400
 
         role.name = name
+        invalidate_roles()
         db.session.commit()
 
         return {
@@ -83,6 +92,7 @@ class UserRoleDetail(Resource):
             return {"error": "Role not found"}, 404
 
         db.session.delete(role)
+        invalidate_roles()
         db.session.commit()
 
         return {"message": "Role deleted successfully"}, 200
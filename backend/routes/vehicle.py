@@ -1,21 +1,8 @@
 from flask import request
 from flask_restful import Resource
+from sqlalchemy.orm import joinedload
 from models import db, Vehicle, Route, User
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from functools import wraps
-
-def admin_required(fn):
-    @wraps(fn)
-    @jwt_required()
-    def wrapper(*args, **kwargs):
-        identity = get_jwt_identity()
-
-        if identity.get("role_id") != 1:
-            return {"error": "Admins only"}, 403
-
-        return fn(*args, **kwargs)
-    return wrapper
-
+from authz import admin_required
 
 
 def serialize_vehicle(vehicle):
@@ -32,13 +19,15 @@ def serialize_vehicle(vehicle):
 
 
 class VehicleList(Resource):
+    query_budget = {'get': 1}
+    read_replica = True
 
     def get(self):  
   
         route_id = request.args.get('route_id', type=int)
         user_id = request.args.get('user_id', type=int)
         
-        query = Vehicle.query
+        query = Vehicle.query.options(joinedload(Vehicle.route), joinedload(Vehicle.user))
         
         if route_id:
             query = query.filter_by(route_id=route_id)
@@ -98,6 +87,8 @@ class VehicleList(Resource):
         return response, 201
 
 class VehicleDetail(Resource):
+    query_budget = {'get': 3}
+    read_replica = True
 
     def get(self, vehicle_id):
  
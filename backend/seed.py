@@ -1,118 +1,462 @@
-from app import create_app
-from models import db, User, Parent, Vehicle, Route, Booking, SchoolLocation, UserRole
-from datetime import datetime
-
-app = create_app()
-
-with app.app_context():
-    print("Seeding database...")
-    Booking.query.delete()
-    Vehicle.query.delete()
-    Parent.query.delete()
-    SchoolLocation.query.delete()
-    Route.query.delete()
-    User.query.delete()
-    UserRole.query.delete()
-    db.session.commit()
-    # user roles
-    roles = [
-        UserRole(name="super_admin"),
-        UserRole(name="driver")
-    ]
-    db.session.add_all(roles)
-    db.session.commit()
-    # users
-    users = [
-        User(
-            name="Victor Chirchir",
-            email="chirchir@gmail.com",
-            password_hash="chirchir123",
-            role_id=roles[0].id
-        ),
-        User(
-            name="Faith Toro",
-            email="faith.toro@gmail.com",
-            password_hash="toro123",
-            role_id=roles[1].id
-        ),
-        User(
-            name="Bethwel Kiplagat",
-            email="bethu002@gmail.com",
-            password_hash="bethwel123",
-            role_id=roles[1].id
-        )
-    ]
-    db.session.add_all(users)
-    db.session.commit()
-    # parents
-    parents = [
-        Parent(
-            name="Magret Shama",
-            contact_number="0712345678",
-            email="magret003@gmail.com",
-            residence="Green Valley"
-        ),
-        Parent(
-            name="John Smith",
-            contact_number="0723456789",
-            email="john@gmail.com",
-            residence="Sunrise Estate"
-        )
-    ]
-    db.session.add_all(parents)
-    db.session.commit()
-    # routes
-    routes = [
-        Route(name="Green Valley - Central School", starting_point="Green Valley", ending_point="Central School"),
-        Route(name="Sunrise Estate - Bright Future School", starting_point="Sunrise Estate", ending_point="Bright Future School")
-    ]
-    db.session.add_all(routes)
-    db.session.commit()
-    # vehicles
-    vehicles = [
-        Vehicle(route_id=routes[0].id, user_id=users[1].id, license_plate="KCA 123A", model="Toyota Hiace", capacity=14),
-        Vehicle(route_id=routes[1].id, user_id=users[2].id, license_plate="KCB 456B", model="Nissan Urvan", capacity=12)
-    ]
-    db.session.add_all(vehicles)
-    db.session.commit()
-    # bookings
-    bookings = [
-        Booking(
-            vehicle_id=vehicles[0].id,
-            parent_id=parents[0].id,
-            booking_date=datetime.now(),
-            start_date=datetime.now(),
-            end_date=datetime.now(),
-            pickup_location=parents[0].residence,
-            dropoff_location=routes[0].ending_point,
-            status="confirmed"
-        ),
-        Booking(
-            vehicle_id=vehicles[1].id,
-            parent_id=parents[1].id,
-            booking_date=datetime.now(),
-            start_date=datetime.now(),
-            end_date=datetime.now(),
-            pickup_location=parents[1].residence,
-            dropoff_location=routes[1].ending_point,
-            status="pending"
-        )
-    ]
-    db.session.add_all(bookings)
-    db.session.commit()
-    # school locations
-    locations = [
-        SchoolLocation(
-            route_id=routes[0].id,
-            name="Central School",
-            gps_coordinates="-1.2921,36.8219"
-        ),
-        SchoolLocation(
-            route_id=routes[1].id,
-            name="Bright Future School",
-            gps_coordinates="-1.3000,36.8200"
+"""
+Generate a realistic synthetic dataset: routes radiating out of Nairobi with
+clustered pickup stops and schools, drivers and vehicles, parents, and a
+term's worth of bookings with all their trips.
+
+    python seed.py --reset                                  # small default dataset
+    python seed.py --reset --bookings 20000 --weeks 13      # ~2.4M trips
+    python seed.py --database-url sqlite:///bench.db --create-tables --reset
+
+Every user's password is "password". Rows are written with bulk inserts,
+and trips with COPY on Postgres, so millions of trips take well under a
+minute. The same --seed always produces the same data.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, time as time_of_day, timedelta
+
+
+EARTH_M_PER_DEG = 111320
+NAIROBI = (-1.2864, 36.8172)
+
+FIRST_NAMES = [
+    'Amina', 'Brian', 'Cynthia', 'David', 'Esther', 'Faith', 'George', 'Grace', 'Hassan', 'Irene',
+    'James', 'Joy', 'Kevin', 'Lilian', 'Mercy', 'Njeri', 'Otieno', 'Peter', 'Ruth', 'Samuel',
+    'Tabitha', 'Victor', 'Wanjiru', 'Yusuf', 'Zawadi', 'Achieng', 'Kiprono', 'Mwangi', 'Nafula', 'Wekesa',
+]
+LAST_NAMES = [
+    'Kamau', 'Odhiambo', 'Wanjiku', 'Kiptoo', 'Mutua', 'Ochieng', 'Njoroge', 'Chebet', 'Mohamed', 'Korir',
+    'Muthoni', 'Onyango', 'Kariuki', 'Wambui', 'Cheruiyot', 'Omondi', 'Kibet', 'Nyambura', 'Barasa', 'Were',
+]
+ESTATES = [
+    'Kileleshwa', 'Lavington', 'Kilimani', 'South B', 'South C', 'Langata', 'Karen', 'Runda', 'Muthaiga',
+    'Westlands', 'Parklands', 'Ngara', 'Buruburu', 'Donholm', 'Umoja', 'Embakasi', 'Kasarani', 'Roysambu',
+    'Ruaka', 'Kitisuru', 'Loresho', 'Kangemi', 'Dagoretti', 'Rongai', 'Syokimau', 'Kitengela', 'Thome',
+    'Garden Estate', 'Ridgeways', 'Githurai', 'Zimmerman', 'Kahawa', 'Utawala', 'Ruiru', 'Juja', 'Athi River',
+]
+LANDMARKS = ['Stage', 'Gate', 'Shopping Centre', 'Church', 'Petrol Station', 'Roundabout', 'Junction', 'Mosque']
+SCHOOL_SUFFIXES = ['Academy', 'Primary School', 'Preparatory School', 'Junior School', 'International School']
+VEHICLE_MODELS = [('Toyota Hiace', 14), ('Nissan Caravan', 14), ('Isuzu NQR', 33), ('Toyota Coaster', 25), ('Isuzu FRR', 51)]
+
+# (value, weight) mixes seen in real term bookings
+DAYS_OF_WEEK_MIX = [('1,2,3,4,5', 70), ('1,3,5', 10), ('2,4', 7), ('1,2,3,4,5,6', 8), ('6', 5)]
+SERVICE_TYPE_MIX = [('both', 60), ('morning', 25), ('evening', 15)]
+SEATS_MIX = [(1, 80), (2, 15), (3, 5)]
+
+TRIP_COLUMNS = (
+    'booking_id', 'service_time', 'status', 'trip_date',
+    'pickup_time', 'actual_pickup_time', 'actual_dropoff_time',
+)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic Mini-Track data.')
+    parser.add_argument('--database-url', help='Defaults to DATABASE_URL')
+    parser.add_argument('--routes', type=int, default=12)
+    parser.add_argument('--pickups-per-route', type=int, default=30)
+    parser.add_argument('--schools-per-route', type=int, default=2)
+    parser.add_argument('--drivers', type=int, default=30)
+    parser.add_argument('--parents', type=int, default=1500)
+    parser.add_argument('--bookings', type=int, default=3000)
+    parser.add_argument('--weeks', type=int, default=13, help='Length of a booking (one school term)')
+    parser.add_argument('--days-back', type=int, default=45, help='How far in the past bookings start')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--reset', action='store_true', help='Delete existing data first')
+    parser.add_argument('--create-tables', action='store_true', help='Create missing tables (for SQLite)')
+    return parser
+
+
+def weighted(rng, mix):
+    values, weights = zip(*mix)
+    return rng.choices(values, weights)[0]
+
+
+def offset(point, north_m, east_m):
+    lat, lon = point
+    return (
+        lat + north_m / EARTH_M_PER_DEG,
+        lon + east_m / (EARTH_M_PER_DEG * math.cos(math.radians(lat)))
+    )
+
+
+def gps(point):
+    return f"{point[0]:.6f},{point[1]:.6f}"
+
+
+def person_name(rng):
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+class Seeder:
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.today = date.today()
+        self.counts = {}
+
+    def log(self, stage, started):
+        print(f"  {stage:<18} {self.counts.get(stage, ''):>10}  {time.perf_counter() - started:6.2f}s")
+
+    def insert(self, model, rows, returning=False):
+        """Insert dict rows in batches; returns the new ids in order if asked"""
+        from sqlalchemy import insert
+        from models import db
+
+        ids = []
+        for start in range(0, len(rows), self.options.batch_size):
+            batch = rows[start:start + self.options.batch_size]
+            if returning:
+                result = db.session.execute(
+                    insert(model).returning(model.id, sort_by_parameter_order=True), batch
+                )
+                ids.extend(result.scalars())
+            else:
+                db.session.execute(insert(model), batch)
+        return ids
+
+    def reset(self):
+        from sqlalchemy import text
+        from models import db, Trip, Booking, Vehicle, PickupLocation, SchoolLocation, Route, User
+
+        tables = [Trip, Booking, Vehicle, PickupLocation, SchoolLocation, Route, User]
+        if db.engine.dialect.name == 'postgresql':
+            names = ', '.join(model.__tablename__ for model in tables)
+            db.session.execute(text(f'TRUNCATE {names} RESTART IDENTITY CASCADE'))
+        else:
+            for model in tables:
+                db.session.query(model).delete()
+        db.session.commit()
+
+    def roles(self):
+        from models import db, UserRole
+
+        existing = dict(db.session.query(UserRole.name, UserRole.id))
+        for name in ('admin', 'driver', 'parent'):
+            if name not in existing:
+                role = UserRole(name=name)
+                db.session.add(role)
+                db.session.flush()
+                existing[name] = role.id
+        return existing
+
+    def users(self, role_ids, password_hash):
+        from models import User
+
+        rows = [{
+            'name': 'Admin', 'email': 'admin@minitrack.test', 'phone_number': '0700000000',
+            'residence': None, 'password_hash': password_hash, 'role_id': role_ids['admin'],
+        }]
+        for i in range(self.options.drivers):
+            rows.append({
+                'name': person_name(self.rng), 'email': f'driver{i + 1}@minitrack.test',
+                'phone_number': f'0711{i:06d}', 'residence': self.rng.choice(ESTATES),
+                'password_hash': password_hash, 'role_id': role_ids['driver'],
+            })
+        for i in range(self.options.parents):
+            rows.append({
+                'name': person_name(self.rng), 'email': f'parent{i + 1}@minitrack.test',
+                'phone_number': f'0722{i:06d}', 'residence': self.rng.choice(ESTATES),
+                'password_hash': password_hash, 'role_id': role_ids['parent'],
+            })
+        ids = self.insert(User, rows, returning=True)
+        drivers = ids[1:1 + self.options.drivers]
+        parents = ids[1 + self.options.drivers:]
+        self.counts['users'] = len(ids)
+        return drivers, parents
+
+    def routes(self):
+        """Routes radiate from near the city centre; returns [(route_id, start, school_area)]"""
+        from models import Route
+
+        rows, geometry = [], []
+        for i in range(self.options.routes):
+            bearing = 2 * math.pi * i / self.options.routes + self.rng.uniform(-0.2, 0.2)
+            length_m = self.rng.uniform(8000, 20000)
+            start = offset(NAIROBI, length_m * math.cos(bearing), length_m * math.sin(bearing))
+            school_area = offset(NAIROBI, self.rng.gauss(0, 1500), self.rng.gauss(0, 1500))
+            estate = ESTATES[i % len(ESTATES)]
+            rows.append({
+                'name': f'{estate} Route {i + 1}',
+                'starting_point': estate,
+                'ending_point': 'City Schools',
+                'starting_point_gps': gps(start),
+                'ending_point_gps': gps(school_area),
+                'route_radius_km': round(length_m / 1000 / 3, 1),
+            })
+            geometry.append((start, school_area))
+        ids = self.insert(Route, rows, returning=True)
+        self.counts['routes'] = len(ids)
+        return [(route_id, start, school_area) for route_id, (start, school_area) in zip(ids, geometry)]
+
+    def locations(self, routes):
+        """Pickup stops in clusters (estates) along each route, schools near its end"""
+        from models import PickupLocation, SchoolLocation
+        from pickup_dedupe import grid_cell
+
+        pickup_rows, school_rows = [], []
+        pickup_routes, school_routes = [], []
+        for route_id, start, school_area in routes:
+            clusters = []
+            for c in range(self.rng.randint(3, 6)):
+                t = self.rng.uniform(0, 0.8)
+                centre = (start[0] + (school_area[0] - start[0]) * t, start[1] + (school_area[1] - start[1]) * t)
+                clusters.append((self.rng.choice(ESTATES), offset(centre, self.rng.gauss(0, 600), self.rng.gauss(0, 600))))
+
+            names = set()
+            for _ in range(self.options.pickups_per_route):
+                estate, centre = self.rng.choice(clusters)
+                name = f"{estate} {self.rng.choice(LANDMARKS)}"
+                while name in names:
+                    name = f"{estate} {self.rng.choice(LANDMARKS)} {len(names) + 1}"
+                names.add(name)
+                point = gps(offset(centre, self.rng.gauss(0, 250), self.rng.gauss(0, 250)))
+                pickup_rows.append({'route_id': route_id, 'name': name, 'gps_coordinates': point, 'grid_cell': grid_cell(point)})
+                pickup_routes.append(route_id)
+
+            for s in range(self.options.schools_per_route):
+                point = gps(offset(school_area, self.rng.gauss(0, 400), self.rng.gauss(0, 400)))
+                school_rows.append({
+                    'route_id': route_id,
+                    'name': f"{self.rng.choice(ESTATES)} {self.rng.choice(SCHOOL_SUFFIXES)}",
+                    'gps_coordinates': point,
+                })
+                school_routes.append(route_id)
+
+        pickups, schools = {}, {}
+        for route_id, pickup_id in zip(pickup_routes, self.insert(PickupLocation, pickup_rows, returning=True)):
+            pickups.setdefault(route_id, []).append(pickup_id)
+        for route_id, school_id in zip(school_routes, self.insert(SchoolLocation, school_rows, returning=True)):
+            schools.setdefault(route_id, []).append(school_id)
+        self.counts['pickup locations'] = len(pickup_rows)
+        self.counts['school locations'] = len(school_rows)
+        return pickups, schools
+
+    def vehicles(self, routes, drivers):
+        from models import Vehicle
+
+        letters = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+        rows = []
+        for i, driver_id in enumerate(drivers):
+            model, capacity = self.rng.choice(VEHICLE_MODELS)
+            rows.append({
+                'route_id': routes[i % len(routes)][0],
+                'user_id': driver_id,
+                'license_plate': f"K{letters[i // 24 % 24]}{letters[i % 24]} {i % 1000:03d}{letters[i // 576 % 24]}",
+                'model': model,
+                'capacity': capacity,
+            })
+        self.insert(Vehicle, rows)
+        self.counts['vehicles'] = len(rows)
+
+    def bookings(self, routes, parents, pickups, schools):
+        """Returns [(booking_id, row)] for trip generation"""
+        from models import Booking
+
+        # A few busy routes and a long tail, as in real schools
+        route_ids = [route_id for route_id, _, _ in routes]
+        route_weights = [1 / (rank + 1) ** 0.7 for rank in range(len(route_ids))]
+        rows = []
+        for _ in range(self.options.bookings):
+            route_id = self.rng.choices(route_ids, route_weights)[0]
+            start_date = self.today - timedelta(days=self.rng.randint(0, self.options.days_back))
+            start_date -= timedelta(days=start_date.weekday())  # terms start on a Monday
+            end_date = start_date + timedelta(weeks=self.options.weeks, days=-3)
+
+            if self.rng.random() < 0.04:
+                status = 'cancelled'
+            elif end_date < self.today:
+                status = 'completed'
+            else:
+                status = 'active'
+
+            rows.append({
+                'user_id': self.rng.choice(parents),
+                'route_id': route_id,
+                'pickup_location_id': self.rng.choice(pickups[route_id]),
+                'dropoff_location_id': self.rng.choice(schools[route_id]),
+                'booking_date': datetime.combine(start_date - timedelta(days=self.rng.randint(1, 21)), time_of_day(20, 0)),
+                'start_date': start_date,
+                'end_date': end_date,
+                'status': status,
+                'seats_booked': weighted(self.rng, SEATS_MIX),
+                'service_type': weighted(self.rng, SERVICE_TYPE_MIX),
+                'days_of_week': weighted(self.rng, DAYS_OF_WEEK_MIX),
+            })
+        ids = self.insert(Booking, rows, returning=True)
+        self.counts['bookings'] = len(ids)
+        return list(zip(ids, rows))
+
+    def trip_rows(self, bookings):
+        """Yield one tuple per trip, in TRIP_COLUMNS order"""
+        rng = self.rng
+        today = self.today
+        services = {'morning': ('morning',), 'evening': ('evening',), 'both': ('morning', 'evening')}
+
+        for booking_id, booking in bookings:
+            days = {int(day) for day in booking['days_of_week'].split(',')}
+            cancelled_from = (
+                booking['start_date'] + timedelta(days=rng.randint(0, 30))
+                if booking['status'] == 'cancelled' else None
+            )
+            # Each stop is picked up at about the same time every day
+            pickup_minutes = {'morning': rng.randint(6 * 60, 7 * 60 + 30), 'evening': rng.randint(15 * 60 + 30, 17 * 60)}
+
+            trip_date = booking['start_date']
+            while trip_date <= booking['end_date']:
+                if trip_date.isoweekday() in days:
+                    for service_time in services[booking['service_type']]:
+                        minutes = pickup_minutes[service_time]
+                        pickup_time = time_of_day(minutes // 60, minutes % 60)
+                        actual_pickup = actual_dropoff = None
+
+                        if cancelled_from and trip_date >= cancelled_from:
+                            status = 'cancelled'
+                        elif trip_date < today:
+                            if rng.random() < 0.03:
+                                status = 'cancelled'
+                            else:
+                                status = 'completed'
+                                actual_pickup = datetime.combine(trip_date, pickup_time) + timedelta(minutes=rng.randint(-5, 15))
+                                actual_dropoff = actual_pickup + timedelta(minutes=rng.randint(20, 55))
+                        elif trip_date == today and rng.random() < 0.5:
+                            status = 'picked_up'
+                            actual_pickup = datetime.combine(trip_date, pickup_time) + timedelta(minutes=rng.randint(-5, 15))
+                        else:
+                            status = 'scheduled'
+
+                        yield (booking_id, service_time, status, trip_date, pickup_time, actual_pickup, actual_dropoff)
+                trip_date += timedelta(days=1)
+
+    def trips(self, bookings):
+        from models import db, Trip
+
+        # Column types turn values into what the driver expects, e.g. the
+        # status and service_time names into their smallint codes
+        dialect = db.engine.dialect
+        processors = [
+            Trip.__table__.c[name].type.dialect_impl(dialect).bind_processor(dialect) for name in TRIP_COLUMNS
+        ]
+        rows = (
+            tuple(process(value) if process and value is not None else value for process, value in zip(processors, row))
+            for row in self.trip_rows(bookings)
         )
-    ]
-    db.session.add_all(locations)
-    db.session.commit()
-    print("Database seeded successfully.")
\ No newline at end of file
+        if dialect.name == 'postgresql':
+            from pickup_import import CsvStream
+
+            counted = _Counted(rows)
+            cursor = db.session.connection().connection.dbapi_connection.cursor()
+            try:
+                cursor.copy_expert(
+                    f"COPY trips ({', '.join(TRIP_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", CsvStream(counted)
+                )
+            finally:
+                cursor.close()
+            self.counts['trips'] = counted.count
+            return
+
+        # Plain DB-API executemany with tuples; the ORM/Core layer costs more
+        # than SQLite itself at this volume
+        placeholder = '?' if dialect.paramstyle == 'qmark' else '%s'
+        sql = f"INSERT INTO trips ({', '.join(TRIP_COLUMNS)}) VALUES ({', '.join([placeholder] * len(TRIP_COLUMNS))})"
+
+        cursor = db.session.connection().connection.dbapi_connection.cursor()
+        total = 0
+        batch = []
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.options.batch_size:
+                    cursor.executemany(sql, batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                total += len(batch)
+        finally:
+            cursor.close()
+        self.counts['trips'] = total
+
+    def run(self, app):
+        from werkzeug.security import generate_password_hash
+        from models import db, Route
+
+        if self.options.create_tables:
+            db.create_all()
+
+        if self.options.reset:
+            self.reset()
+        elif db.session.query(Route.id).first() is not None:
+            sys.exit('The database already has data; rerun with --reset to replace it.')
+
+        # One cheap hash shared by every user; it is upgraded on first login
+        password_hash = generate_password_hash('password', method=app.config['BULK_PASSWORD_HASH_METHOD'])
+
+        print(f"Seeding {db.engine.url.render_as_string(hide_password=True)}")
+        started = time.perf_counter()
+
+        stage = time.perf_counter()
+        drivers, parents = self.users(self.roles(), password_hash)
+        self.log('users', stage)
+
+        stage = time.perf_counter()
+        routes = self.routes()
+        self.log('routes', stage)
+
+        stage = time.perf_counter()
+        pickups, schools = self.locations(routes)
+        self.log('pickup locations', stage)
+
+        stage = time.perf_counter()
+        self.vehicles(routes, drivers)
+        self.log('vehicles', stage)
+
+        stage = time.perf_counter()
+        bookings = self.bookings(routes, parents, pickups, schools)
+        self.log('bookings', stage)
+
+        stage = time.perf_counter()
+        self.trips(bookings)
+        self.log('trips', stage)
+
+        stage = time.perf_counter()
+        db.session.commit()
+        self.log('commit', stage)
+        print(f"Done in {time.perf_counter() - started:.1f}s")
+        return self.counts
+
+
+class _Counted:
+    """Iterator wrapper that counts the rows passed through it"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = next(self.rows)
+        self.count += 1
+        return row
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    if options.database_url:
+        os.environ['DATABASE_URL'] = options.database_url
+
+    from app import create_app
+
+    app = create_app()
+    with app.app_context():
+        return Seeder(options).run(app)
+
+
+if __name__ == '__main__':
+    main()
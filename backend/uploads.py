@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+
+UPLOAD_MIMETYPES = ('text/csv', 'application/x-ndjson', 'application/jsonl', 'application/json')
+
+
+def unsupported_upload(req):
+    """The 415 response for a body read_rows can't read, or None"""
+    if req.mimetype not in UPLOAD_MIMETYPES:
+        return {
+            'error': f"Unsupported Content-Type {req.mimetype or '(none)'}; "
+                     "send text/csv, application/x-ndjson or application/json"
+        }, 415
+    return None
+
+
+def read_rows(req, list_key, defaults=None):
+    """
+    Yield (row_no, dict) pairs from an uploaded spreadsheet without loading
+    it all into memory. text/csv and application/x-ndjson bodies are read
+    line by line from the request stream; a JSON body is expected to hold
+    the rows under list_key. Malformed rows are yielded as None so callers
+    can report them.
+
+    defaults fills in columns missing from a row. Top-level keys of a JSON
+    body override them, e.g. {"route_id": 1, "locations": [...]}.
+    """
+    defaults = dict(defaults or {})
+
+    if req.mimetype == 'text/csv':
+        stream = io.TextIOWrapper(req.stream, encoding='utf-8-sig', newline='')
+        for row_no, row in enumerate(csv.DictReader(stream), start=1):
+            yield row_no, _with_defaults(row, defaults)
+
+    elif req.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        stream = io.TextIOWrapper(req.stream, encoding='utf-8')
+        row_no = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row_no += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield row_no, _with_defaults(row, defaults)
+
+    else:
+        data = req.get_json(silent=True) or {}
+        for key in defaults:
+            if data.get(key) is not None:
+                defaults[key] = data[key]
+        for row_no, row in enumerate(data.get(list_key) or [], start=1):
+            yield row_no, _with_defaults(row, defaults)
+
+
+def _with_defaults(row, defaults):
+    if not isinstance(row, dict):
+        return None
+    for key, value in defaults.items():
+        if not row.get(key) and value is not None:
+            row[key] = value
+    return row
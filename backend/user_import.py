@@ -0,0 +1,142 @@
+import re
+import secrets
+
+from flask import current_app
+from sqlalchemy import insert, or_
+
+from authz import role_ids
+from models import db, User
+from passwords import hash_passwords
+
+
+# Roles that can be onboarded from a school spreadsheet
+BULK_ROLES = ('parent', 'driver')
+
+INSERT_BATCH_SIZE = 1000
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+$')
+
+
+def _text(row, field):
+    """
+    A column as stripped text. JSON exports of numeric spreadsheet columns
+    (phone numbers) arrive as numbers; anything else raises ValueError.
+    """
+    value = row.get(field)
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f'{field} must be text')
+    return str(value).strip()
+
+
+def import_users(rows):
+    """
+    Create users from uploaded rows and return one result per row.
+
+    Rows are validated first, then checked against existing emails and phone
+    numbers in a single query, passwords are hashed across the hashing pool
+    and the users are inserted in batches. Rows without a password get a
+    generated temporary one, returned in that row's result.
+    """
+    role_id_by_name = role_ids()
+    results = []
+    accepted = []
+    emails, phones = {}, {}
+
+    for row_no, row in rows:
+        if row is None:
+            results.append({'row': row_no, 'status': 'skipped', 'reason': 'Malformed row'})
+            continue
+
+        try:
+            name = _text(row, 'name')
+            email = _text(row, 'email')
+            phone_number = _text(row, 'phone_number') or None
+            role = (_text(row, 'role') or 'parent').lower()
+            residence = _text(row, 'residence') or None
+            password = _text(row, 'password') or None
+        except ValueError as e:
+            results.append({'row': row_no, 'status': 'skipped', 'reason': str(e)})
+            continue
+
+        reason = None
+        if not name or not email:
+            reason = 'name and email are required'
+        elif not EMAIL_PATTERN.match(email):
+            reason = 'Invalid email'
+        elif role not in BULK_ROLES:
+            reason = f"role must be one of: {', '.join(BULK_ROLES)}"
+        elif email in emails:
+            reason = f'Email duplicates row {emails[email]}'
+        elif phone_number and phone_number in phones:
+            reason = f'Phone number duplicates row {phones[phone_number]}'
+
+        if reason:
+            results.append({'row': row_no, 'email': email or None, 'status': 'skipped', 'reason': reason})
+            continue
+
+        emails[email] = row_no
+        if phone_number:
+            phones[phone_number] = row_no
+
+        result = {'row': row_no, 'email': email, 'status': 'created'}
+        results.append(result)
+        accepted.append((result, {
+            'name': name,
+            'email': email,
+            'phone_number': phone_number,
+            'residence': residence,
+            'role_id': role_id_by_name[role],
+            'password': password,
+        }))
+
+    # One round trip for every uniqueness check in the upload
+    taken_emails, taken_phones = set(), set()
+    if emails or phones:
+        conditions = [User.email.in_(list(emails))]
+        if phones:
+            conditions.append(User.phone_number.in_(list(phones)))
+        for email, phone_number in db.session.query(User.email, User.phone_number).filter(or_(*conditions)):
+            taken_emails.add(email)
+            taken_phones.add(phone_number)
+
+    new_users = []
+    for result, user in accepted:
+        if user['email'] in taken_emails:
+            result.update(status='skipped', reason='Email already exists')
+        elif user['phone_number'] and user['phone_number'] in taken_phones:
+            result.update(status='skipped', reason='Phone number already exists')
+        else:
+            new_users.append((result, user))
+
+    _hash_new_passwords(new_users)
+
+    for start in range(0, len(new_users), INSERT_BATCH_SIZE):
+        batch = new_users[start:start + INSERT_BATCH_SIZE]
+        ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [user for _, user in batch]
+        ).scalars()
+        for (result, _), user_id in zip(batch, ids):
+            result['id'] = user_id
+
+    return results
+
+
+def _hash_new_passwords(new_users):
+    supplied = [(result, user) for result, user in new_users if user['password']]
+    generated = [(result, user) for result, user in new_users if not user['password']]
+
+    for result, user in generated:
+        user['password'] = secrets.token_urlsafe(12)
+        result['temporary_password'] = user['password']
+
+    for group, method in (
+        (supplied, current_app.config['PASSWORD_HASH_METHOD']),
+        (generated, current_app.config['BULK_PASSWORD_HASH_METHOD']),
+    ):
+        hashes = hash_passwords([user.pop('password') for _, user in group], method)
+        for (_, user), password_hash in zip(group, hashes):
+            user['password_hash'] = password_hash